@@ -1,10 +1,17 @@
 from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
-#from flask_migrate import migrate
+from flask_migrate import Migrate
 from flask_cors import CORS
 from datetime import timedelta
+from sqlalchemy import inspect, text
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from app.models import db 
+from app.cache import catalogue_cache, membership_cache
+from app.events import event_broker
+from app.metrics import metrics
+from app.sqlite_profile import apply_sqlite_profile, serialized_writes
 import os
 import logging
 
@@ -12,6 +19,43 @@ import logging
 # Initialize extensions
 
 jwt = JWTManager()
+migrate = Migrate()
+
+# Any fixed key; only schema creation takes this advisory lock
+SCHEMA_LOCK_KEY = 7262011
+
+
+def create_schema(migrations_directory):
+    # Workers starting together on an empty database take turns; whoever
+    # goes second finds the tables made and leaves them alone
+    with serialized_writes(), db.engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        elif conn.dialect.name == 'sqlite' and not conn.connection.driver_connection.in_transaction:
+            # pysqlite runs DDL outside a transaction unless one is begun here
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        if inspect(conn).get_table_names():
+            return False
+        db.metadata.create_all(conn)
+        MigrationContext.configure(conn).stamp(ScriptDirectory(migrations_directory), 'head')
+        return True
+
+
+def engine_options(database_url):
+    # Pool settings from the environment; SQLite keeps SQLAlchemy's defaults
+    if database_url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout and database_url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
 
 
 def create_app():
@@ -25,15 +69,46 @@ def create_app():
     logger = logging.getLogger(__name__)
     
     # Configuration
-    # Default to SQLite if PostgreSQL is not available
-    database_url = 'sqlite:///' + os.path.join(app.instance_path, 'savingcircle.db')
+    # Default to SQLite if no DATABASE_URL (e.g. PostgreSQL) is configured
+    database_url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(app.instance_path, 'savingcircle.db')
+    if database_url.startswith('postgres://'):
+        database_url = 'postgresql://' + database_url[len('postgres://'):]
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Opt-in tuning for running SQLite under gunicorn (WAL, pragmas, serialised writes)
+    app.config['SQLITE_PROFILE'] = database_url.startswith('sqlite') and os.environ.get('SQLITE_PROFILE', '').lower() in ('1', 'true', 'production')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))  # negative = KiB
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', '89c082f4918c48ff8a03fca91305dd0d')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
     app.config['JWT_TOKEN_LOCATION'] = ['headers']
     app.config['JWT_HEADER_NAME'] = 'Authorization'
     app.config['JWT_HEADER_TYPE'] = 'Bearer'
+    # werkzeug hash method; existing hashes are upgraded on login when this changes
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['MEMBERSHIP_CACHE_BACKEND'] = os.environ.get('MEMBERSHIP_CACHE_BACKEND', 'memory')  # or 'sqlite'
+    app.config['MEMBERSHIP_CACHE_SIZE'] = int(os.environ.get('MEMBERSHIP_CACHE_SIZE', 10000))
+    app.config['MEMBERSHIP_CACHE_TTL'] = int(os.environ.get('MEMBERSHIP_CACHE_TTL', 60))
+    app.config['MEMBERSHIP_CACHE_PATH'] = os.environ.get('MEMBERSHIP_CACHE_PATH')  # default instance/membership_cache.db
+    # Invalidations must reach every worker, which a per-worker memory cache cannot do
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    app.config['DISCOVER_CACHE_BACKEND'] = os.environ.get('DISCOVER_CACHE_BACKEND', 'sqlite' if workers > 1 else 'memory')
+    app.config['DISCOVER_CACHE_PATH'] = os.environ.get('DISCOVER_CACHE_PATH')  # default instance/discover_cache.db
+    app.config['DISCOVER_CACHE_SIZE'] = int(os.environ.get('DISCOVER_CACHE_SIZE', 1000))
+    app.config['DISCOVER_CACHE_TTL'] = int(os.environ.get('DISCOVER_CACHE_TTL', 30))
+    app.config['DISCOVER_CACHE_MAX_BYTES'] = int(os.environ.get('DISCOVER_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    # GET /api/events: how often each worker reads the outbox, and how many
+    # recent events it keeps for streams that fall behind
+    app.config['EVENTS_POLL_SECONDS'] = float(os.environ.get('EVENTS_POLL_SECONDS', 1.0))
+    app.config['EVENTS_BUFFER_SIZE'] = int(os.environ.get('EVENTS_BUFFER_SIZE', 10000))
+    app.config['METRICS_BACKEND'] = os.environ.get('METRICS_BACKEND', 'sqlite')  # or 'memory'
+    app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    # Views over their SQL statement budget raise instead of logging (always on in tests and debug mode)
+    app.config['QUERY_BUDGET_STRICT'] = os.environ.get('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
     
     try:
         os.makedirs(app.instance_path)
@@ -43,6 +118,13 @@ def create_app():
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
+    # Batch mode lets Alembic alter SQLite tables by copy-and-move
+    migrations_directory = os.path.join(os.path.dirname(app.root_path), 'migrations')
+    migrate.init_app(app, db, directory=migrations_directory, render_as_batch=True)
+    membership_cache.init_app(app)
+    catalogue_cache.init_app(app)
+    event_broker.init_app(app)
+    metrics.init_app(app)
     
 
     @jwt.invalid_token_loader
@@ -63,13 +145,29 @@ def create_app():
     from .  import routes
     app.register_blueprint(routes.api_bp)
     
+    from . import cli
+    cli.register_commands(app)
+    
     # Create tables
     with app.app_context():
-        try:
-            db.create_all()
-            logger.info("Database tables created successfully")
-        except Exception as e:
-            logger.error(f"Error creating database tables: {e}")
-            raise
+        if app.config['SQLITE_PROFILE']:
+            apply_sqlite_profile(app, db.engine)
+        
+        # Migrations own the schema. Only a new, empty database is created
+        # here, and it is stamped as up to date; anything else is left to
+        # `flask db upgrade`.
+        if not inspect(db.engine).get_table_names():
+            try:
+                if create_schema(migrations_directory):
+                    logger.info("Database tables created successfully")
+            except Exception as e:
+                logger.error(f"Error creating database tables: {e}")
+                raise
+        
+        # Connections must not be shared across fork: a pre-forked gunicorn
+        # worker drops the pool it inherited (without closing the parent's
+        # sockets) and opens its own
+        engine = db.engine
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
     
     return app
\ No newline at end of file
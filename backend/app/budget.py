@@ -0,0 +1,95 @@
+from contextvars import ContextVar
+from flask import current_app, has_app_context
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The innermost budget open in this thread (or greenlet); the ones around it
+# are reached through `parent`
+current_budget = ContextVar('current_budget', default=None)
+# Sent by the SQLite profile when a transaction starts; not part of any budget
+TRANSACTION_STATEMENTS = {'BEGIN', 'BEGIN IMMEDIATE'}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    # Counts the SQL statements run inside a block, or inside each call of a
+    # decorated function, and complains when there are more than `limit`.
+    # A nested budget that finishes hands its statements to the one around
+    # it, so a view's budget covers everything the view ran. Statements of a
+    # failed attempt (rolled back and retried) are not passed on.
+    def __init__(self, limit, name=None):
+        self.limit = limit
+        self.name = name
+        self.statements = []
+        self.allowed = 0
+        self.parent = None
+        self.token = None
+
+    def __enter__(self):
+        self.statements = []
+        self.allowed = 0
+        self.parent = current_budget.get()
+        self.token = current_budget.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        current_budget.reset(self.token)
+        if exc_type is None:
+            if len(self.statements) > self.limit + self.allowed:
+                self.exceeded()
+            if self.parent is not None:
+                self.parent.statements.extend(self.statements)
+        return False
+
+    def __call__(self, function):
+        limit, name = self.limit, self.name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(limit, name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def exceeded(self):
+        message = (f"{self.name or 'Block'} ran {len(self.statements)} SQL statements, "
+                   f"over its budget of {self.limit + self.allowed}")
+        logger.warning("%s:\n%s", message, ";\n".join(self.statements))
+        if strict_budgets():
+            raise QueryBudgetExceeded(message)
+
+
+def query_budget(limit, name=None):
+    # @query_budget(3) on a view, or `with query_budget(3):` around a block
+    return QueryBudget(limit, name)
+
+
+def allow_statements(count):
+    # Makes room for `count` more statements in every open budget. Only for
+    # loops over the request's own size, such as one committed chunk per
+    # BULK_CHUNK_SIZE rows; work that grows with groups or the ledger has to
+    # fit the budget as declared.
+    budget = current_budget.get()
+    while budget is not None:
+        budget.allowed += count
+        budget = budget.parent
+
+
+def strict_budgets():
+    # Going over budget fails in tests and debug mode and is only logged otherwise
+    if not has_app_context():
+        return False
+    return bool(current_app.config.get('QUERY_BUDGET_STRICT') or current_app.testing or current_app.debug)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    budget = current_budget.get()
+    if budget is not None and statement not in TRANSACTION_STATEMENTS:
+        budget.statements.append(statement)
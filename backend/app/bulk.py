@@ -0,0 +1,261 @@
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import DBAPIError
+from .models import db, SavingsGroup, GroupMember, Contribution, WithdrawalRequest
+from .money import to_cents
+from .timestamps import parse_timestamp
+from .summaries import record_contributions, record_withdrawals
+from .snapshots import invalidate_snapshots
+from .events import emit_events, withdrawal_decision
+from .ledger import credit_groups, debit_groups, fold_group_stripes, retry_on_conflict
+from .budget import allow_statements, query_budget
+import json
+
+# Statements per contribution chunk, whatever the number of groups in it
+CHUNK_BUDGET = 6
+
+
+def parse_contribution_rows(records, actor_id=None):
+    # Accepts dicts (JSON array) or raw lines (NDJSON); returns (rows, errors)
+    rows, errors = [], []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, (str, bytes)):
+                record = json.loads(record)
+            if not isinstance(record, dict):
+                raise ValueError("Row must be an object")
+            user_id = record.get('user_id', actor_id)
+            if user_id is None:
+                raise ValueError("user_id is required")
+            cents = to_cents(record['amount'])
+            if cents <= 0:
+                raise ValueError("Contribution amount must be greater than zero")
+            now = datetime.utcnow()
+            created_at = record.get('created_at')
+            if created_at:
+                created_at = parse_timestamp(created_at)
+                if created_at > now:
+                    raise ValueError("created_at cannot be in the future")
+            rows.append({
+                "index": index,
+                "group_id": int(record['group_id']),
+                "user_id": int(user_id),
+                "amount_cents": cents,
+                "created_at": created_at or now,
+                "backdated": bool(created_at)
+            })
+        except KeyError as e:
+            errors.append({"index": index, "error": f"Missing field {e}"})
+        except (TypeError, ValueError) as e:
+            errors.append({"index": index, "error": str(e)})
+    return rows, errors
+
+
+def check_memberships(rows, actor_id=None):
+    # One query for the whole batch. Rows for another user or with their own
+    # created_at need the actor to be an admin of that group; actor_id=None
+    # (CLI) skips that check.
+    group_ids = {row['group_id'] for row in rows}
+    user_ids = {row['user_id'] for row in rows}
+    if actor_id is not None:
+        user_ids.add(actor_id)
+    memberships = {}
+    if rows:
+        memberships = {
+            (user_id, group_id): is_admin
+            for user_id, group_id, is_admin in db.session.execute(
+                select(GroupMember.user_id, GroupMember.group_id, GroupMember.is_admin).where(
+                    GroupMember.group_id.in_(group_ids), GroupMember.user_id.in_(user_ids)
+                )
+            )
+        }
+    valid, errors = [], []
+    for row in rows:
+        if (row['user_id'], row['group_id']) not in memberships:
+            errors.append({"index": row['index'], "error": "Not a member of this group"})
+        elif actor_id is not None and row['user_id'] != actor_id and not memberships.get((actor_id, row['group_id'])):
+            errors.append({"index": row['index'], "error": "Not authorized to record contributions for other members"})
+        elif actor_id is not None and row['backdated'] and not memberships.get((actor_id, row['group_id'])):
+            errors.append({"index": row['index'], "error": "Only group admins can set created_at"})
+        else:
+            valid.append(row)
+    return valid, errors
+
+
+def insert_pages(count):
+    # Statements beyond the first that an INSERT of `count` rows takes;
+    # psycopg2 sends it in pages of insertmanyvalues_page_size rows
+    dialect = db.session.get_bind().dialect
+    if not dialect.use_insertmanyvalues_wo_returning:
+        return 0
+    return -(-count // dialect.insertmanyvalues_page_size) - 1
+
+
+@retry_on_conflict
+def apply_contribution_chunk(rows):
+    # A budget per attempt: one that failed and is retried leaves nothing
+    # behind in the budgets around it
+    with query_budget(CHUNK_BUDGET + insert_pages(len(rows)), 'apply_contribution_chunk'):
+        db.session.execute(insert(Contribution), [
+            {"group_id": row['group_id'], "user_id": row['user_id'], "amount_cents": row['amount_cents'], "created_at": row['created_at']}
+            for row in rows
+        ])
+        # The balance updates for all groups in the chunk, not one per contribution
+        totals = defaultdict(int)
+        for row in rows:
+            totals[row['group_id']] += row['amount_cents']
+        credit_groups(totals)
+        record_contributions(rows)
+        invalidate_snapshots(rows)
+        db.session.commit()
+
+
+def ingest_contributions(records, actor_id=None, chunk_size=None):
+    # Returns (inserted_count, errors); bad rows are reported, not fatal
+    chunk_size = chunk_size or current_app.config.get('BULK_CHUNK_SIZE', 1000)
+    rows, errors = parse_contribution_rows(records, actor_id)
+    rows, membership_errors = check_memberships(rows, actor_id)
+    errors.extend(membership_errors)
+    inserted = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        # Callers budget for one chunk of one insert page; each further chunk
+        # is its own transaction. Made room for once, however many attempts
+        # the chunk takes.
+        allow_statements((CHUNK_BUDGET if start else 0) + insert_pages(len(chunk)))
+        try:
+            apply_contribution_chunk(chunk)
+            inserted += len(chunk)
+        except DBAPIError as e:
+            # A failed chunk is rolled back on its own; earlier chunks stay committed
+            db.session.rollback()
+            current_app.logger.error(f"Bulk contribution chunk failed: {e}")
+            errors.extend({"index": row['index'], "error": "Database error"} for row in chunk)
+    errors.sort(key=lambda error: error['index'])
+    return inserted, errors
+
+
+class BalanceChanged(Exception):
+    # The group balance moved under a batch after its approvals were planned
+    pass
+
+
+@retry_on_conflict
+def process_withdrawal_batch(decisions, admin_id):
+    # decisions: [{"id": ..., "status": "approved"|"rejected"}]; returns one
+    # result per decision, in input order. All changes share one transaction.
+    results = [None] * len(decisions)
+    wanted = {}
+    for position, decision in enumerate(decisions):
+        withdrawal_id = decision.get('id') if isinstance(decision, dict) else None
+        status = decision.get('status') if isinstance(decision, dict) else None
+        if not isinstance(withdrawal_id, int) or isinstance(withdrawal_id, bool) or status not in ('approved', 'rejected'):
+            results[position] = {"id": withdrawal_id, "error": "Invalid id or status value"}
+        elif withdrawal_id in wanted:
+            results[position] = {"id": withdrawal_id, "error": "Duplicate withdrawal id in batch"}
+        else:
+            wanted[withdrawal_id] = (position, status)
+    
+    withdrawals = WithdrawalRequest.query.filter(WithdrawalRequest.id.in_(wanted)).all() if wanted else []
+    group_ids = {withdrawal.group_id for withdrawal in withdrawals}
+    admin_groups = set(db.session.execute(
+        select(GroupMember.group_id).where(
+            GroupMember.user_id == admin_id,
+            GroupMember.is_admin.is_(True),
+            GroupMember.group_id.in_(group_ids)
+        )
+    ).scalars()) if group_ids else set()
+    
+    found = {withdrawal.id for withdrawal in withdrawals}
+    for withdrawal_id, (position, status) in wanted.items():
+        if withdrawal_id not in found:
+            results[position] = {"id": withdrawal_id, "error": "Withdrawal request not found"}
+    
+    # Balances of all groups with an approval to check, folded and locked
+    # together
+    approving = sorted({
+        withdrawal.group_id for withdrawal in withdrawals
+        if withdrawal.group_id in admin_groups and withdrawal.status == 'pending' and wanted[withdrawal.id][1] == 'approved'
+    })
+    available = {}
+    if approving:
+        fold_group_stripes(approving)
+        available = dict(db.session.execute(
+            select(SavingsGroup.id, SavingsGroup.current_amount_cents)
+            .where(SavingsGroup.id.in_(approving))
+            .order_by(SavingsGroup.id)
+            .with_for_update()
+        ).all())
+    
+    # Oldest requests are served first so overdraft refusals are deterministic
+    withdrawals.sort(key=lambda withdrawal: (withdrawal.group_id, withdrawal.created_at, withdrawal.id))
+    processed_at = datetime.utcnow()
+    planned = []
+    for withdrawal in withdrawals:
+        position, status = wanted[withdrawal.id]
+        group_id = withdrawal.group_id
+        if group_id not in admin_groups:
+            results[position] = {"id": withdrawal.id, "error": "Not authorized to process withdrawals"}
+            continue
+        if withdrawal.status != 'pending':
+            results[position] = {"id": withdrawal.id, "error": "Withdrawal request already processed"}
+            continue
+        if status == 'approved':
+            if withdrawal.amount_cents > available[group_id]:
+                results[position] = {"id": withdrawal.id, "error": "Withdrawal amount exceeds group's current amount"}
+                continue
+            available[group_id] -= withdrawal.amount_cents
+        planned.append((withdrawal, status))
+    
+    # Claim every planned request in one UPDATE per status; only those
+    # still pending come back
+    claimed = set()
+    for status in ('approved', 'rejected'):
+        ids = [withdrawal.id for withdrawal, planned_status in planned if planned_status == status]
+        if ids:
+            claimed.update(db.session.execute(
+                update(WithdrawalRequest)
+                .where(WithdrawalRequest.id.in_(ids), WithdrawalRequest.status == 'pending')
+                .values(status=status, processed_at=processed_at, processed_by=admin_id)
+                .returning(WithdrawalRequest.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+    
+    debits = {}
+    approved = []
+    touched = set()
+    decided = []
+    for withdrawal, status in planned:
+        position = wanted[withdrawal.id][0]
+        group_id = withdrawal.group_id
+        if withdrawal.id not in claimed:
+            results[position] = {"id": withdrawal.id, "error": "Withdrawal request already processed"}
+            continue
+        touched.add(group_id)
+        if status == 'approved':
+            debits[group_id] = debits.get(group_id, 0) + withdrawal.amount_cents
+            approved.append({
+                "group_id": group_id, "user_id": withdrawal.user_id,
+                "amount_cents": withdrawal.amount_cents, "processed_at": processed_at
+            })
+        decided.append((withdrawal, status))
+        results[position] = {"id": withdrawal.id, "status": status, "processed_at": processed_at.isoformat()}
+    
+    # One statement debits every group; groups with only rejections still
+    # need a new version for ETags
+    balances = debit_groups(debits, touched) if touched else {}
+    if touched - set(balances):
+        db.session.rollback()
+        raise BalanceChanged(min(touched - set(balances)))
+    record_withdrawals(approved)
+    # Approvals carry the group balance after the whole batch
+    emit_events([
+        (withdrawal.group_id, 'withdrawal_processed', withdrawal_decision(
+            withdrawal, status, processed_at, admin_id, balances.get(withdrawal.group_id) if status == 'approved' else None
+        ))
+        for withdrawal, status in decided
+    ])
+    db.session.commit()
+    return results
@@ -0,0 +1,307 @@
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event, select
+from .models import db, GroupMember, SavingsGroup
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemoryCache:
+    # Per-worker LRU cache with a TTL, bounded by entry count and optionally
+    # by the approximate (JSON-encoded) size of its values
+    def __init__(self, max_entries=10000, ttl=60, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.size_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self.remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        size = len(json.dumps(value)) if self.max_bytes else 0
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.size_bytes += size
+            while self.entries and (
+                len(self.entries) > self.max_entries
+                or (self.max_bytes and self.size_bytes > self.max_bytes)
+            ):
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        # Caller holds the lock
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= entry[2]
+
+    def delete(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def generation(self, name):
+        return self.generations.get(name, 0)
+
+    def bump_generation(self, name):
+        with self.lock:
+            self.generations[name] = self.generations.get(name, 0) + 1
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": hit_ratio(self.hits, self.misses),
+            "size": len(self.entries),
+            "bytes": self.size_bytes
+        }
+
+
+class SQLiteCache:
+    # LRU cache in a local SQLite file, shared by every worker on the host.
+    # Values must be JSON-serialisable.
+    def __init__(self, path, max_entries=10000, ttl=60, max_bytes=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entry ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed_at ON cache_entry (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_generation (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def connection(self):
+        # One connection per thread and per process (a forked worker opens its own)
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT value FROM cache_entry WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE cache_entry SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self.connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entry (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        self.writes += 1
+        # Trim least recently used entries every so often rather than on every write
+        if self.writes % 100 == 0:
+            conn.execute(
+                "DELETE FROM cache_entry WHERE expires_at <= ? OR key IN ("
+                " SELECT key FROM cache_entry ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now, self.max_entries)
+            )
+            if self.max_bytes:
+                conn.execute(
+                    "DELETE FROM cache_entry WHERE key IN ("
+                    " SELECT key FROM (SELECT key, SUM(LENGTH(value)) OVER ("
+                    "  ORDER BY accessed_at DESC, key) AS running FROM cache_entry)"
+                    " WHERE running > ?)",
+                    (self.max_bytes,)
+                )
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    def clear(self):
+        self.connection().execute("DELETE FROM cache_entry")
+
+    def generation(self, name):
+        row = self.connection().execute("SELECT value FROM cache_generation WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, name):
+        self.connection().execute(
+            "INSERT INTO cache_generation (name, value) VALUES (?, 1)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+
+    def stats(self):
+        size, size_bytes = self.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_entry"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": hit_ratio(self.hits, self.misses),
+            "size": size,
+            "bytes": size_bytes
+        }
+
+
+def hit_ratio(hits, misses):
+    return round(hits / (hits + misses), 4) if hits + misses else None
+
+
+def make_backend(app, prefix):
+    # Builds the backend named by <prefix>_BACKEND ('memory' or 'sqlite')
+    max_entries = app.config.get(f'{prefix}_SIZE', 10000)
+    ttl = app.config.get(f'{prefix}_TTL', 60)
+    max_bytes = app.config.get(f'{prefix}_MAX_BYTES')
+    if app.config.get(f'{prefix}_BACKEND', 'memory') == 'sqlite':
+        # One file per cache: each trims its table to its own size
+        path = app.config.get(f'{prefix}_PATH') or os.path.join(app.instance_path, f"{prefix.lower()}.db")
+        return SQLiteCache(path, max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+    return MemoryCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+
+
+class MembershipCache:
+    # Caches each user's {group_id: (is_admin, balance_stripes)} map. Only
+    # positive answers are trusted: "not a member" or "not an admin" is
+    # re-checked against the database, so joins and promotions show up
+    # immediately even in workers whose cache was not invalidated. The stripe
+    # count is only a hint for credit_group and may be up to the TTL old.
+    def init_app(self, app):
+        app.extensions['membership_cache'] = make_backend(app, 'MEMBERSHIP_CACHE')
+
+    @property
+    def backend(self):
+        return current_app.extensions['membership_cache']
+
+    def memberships(self, user_id):
+        key = f"memberships:{int(user_id)}"
+        cached = self.backend.get(key)
+        if cached is not None:
+            return {group_id: (is_admin, stripes) for group_id, is_admin, stripes in cached}
+        memberships = self.load(user_id)
+        self.backend.set(key, [[group_id, is_admin, stripes] for group_id, (is_admin, stripes) in memberships.items()])
+        return memberships
+
+    def load(self, user_id):
+        return {
+            group_id: (bool(is_admin), stripes)
+            for group_id, is_admin, stripes in db.session.execute(
+                select(GroupMember.group_id, GroupMember.is_admin, SavingsGroup.balance_stripes)
+                .join(SavingsGroup, SavingsGroup.id == GroupMember.group_id)
+                .where(GroupMember.user_id == int(user_id))
+            )
+        }
+
+    def groups(self, user_id):
+        return {group_id: is_admin for group_id, (is_admin, _) in self.memberships(user_id).items()}
+
+    def membership(self, user_id, group_id, admin=False):
+        # Returns (is_admin, balance_stripes), or None if the user is not a
+        # member (or not an admin when admin=True)
+        membership = self.memberships(user_id).get(int(group_id))
+        if membership is None or (admin and not membership[0]):
+            self.invalidate(user_id)
+            membership = self.memberships(user_id).get(int(group_id))
+        if membership is None or (admin and not membership[0]):
+            return None
+        return membership
+
+    def lookup(self, user_id, group_id, admin=False):
+        # Returns the membership's is_admin flag, or None as membership() does
+        membership = self.membership(user_id, group_id, admin)
+        return None if membership is None else membership[0]
+
+    def invalidate(self, user_id):
+        self.backend.delete(f"memberships:{int(user_id)}")
+
+    def stats(self):
+        return self.backend.stats()
+
+
+class CatalogueCache:
+    # Caches pages of the public group catalogue (/api/discover) for all
+    # users alike. Writes that change a listed group mark the session with
+    # catalogue_changed(); the cache is invalidated once that commit lands.
+    # Invalidation bumps a generation number that is part of every key, so
+    # stale pages are never read again and age out through LRU/TTL. With the
+    # memory backend the generation is the worker's own, so other workers
+    # serve their pages until DISCOVER_CACHE_TTL; the sqlite backend (the
+    # default under several workers) shares it.
+    def init_app(self, app):
+        app.extensions['catalogue_cache'] = make_backend(app, 'DISCOVER_CACHE')
+        if not event.contains(db.session, 'after_commit', invalidate_after_commit):
+            event.listen(db.session, 'after_commit', invalidate_after_commit)
+            event.listen(db.session, 'after_rollback', discard_catalogue_changes)
+
+    @property
+    def backend(self):
+        return current_app.extensions['catalogue_cache']
+
+    def page(self, cursor, limit, loader, params=''):
+        # loader(cursor, limit) builds the page on a miss; params tells apart
+        # searches and filtered listings
+        backend = self.backend
+        key = f"discover:{backend.generation('discover')}:{params}:{cursor or ''}:{limit}"
+        page = backend.get(key)
+        if page is None:
+            page = loader(cursor, limit)
+            backend.set(key, page)
+        return page
+
+    def invalidate(self):
+        self.backend.bump_generation('discover')
+
+    def stats(self):
+        return self.backend.stats()
+
+
+def catalogue_changed():
+    db.session.info['catalogue_changed'] = True
+
+
+def invalidate_after_commit(session):
+    if session.info.pop('catalogue_changed', False):
+        catalogue_cache.invalidate()
+
+
+def discard_catalogue_changes(session):
+    session.info.pop('catalogue_changed', None)
+
+
+membership_cache = MembershipCache()
+catalogue_cache = CatalogueCache()
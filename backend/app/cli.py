@@ -0,0 +1,202 @@
+import click
+from flask.cli import with_appcontext
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from .models import db, Contribution, SavingsGroup
+from .bulk import ingest_contributions
+from .summaries import rebuild_rollups, rebuild_summaries
+from .reconcile import DEFAULT_SETTLE_SECONDS, reconcile_groups, reset_checkpoints
+from .snapshots import take_snapshots
+from .events import prune_events
+from .export import EXPORT_FORMATS, export_ledger, parse_date_range
+from .money import from_cents
+from .timestamps import parse_timestamp
+from .ledger import fold_stripes, set_balance_stripes
+import json
+import time
+
+
+@click.command('set-balance-stripes')
+@click.argument('group_id', type=int)
+@click.argument('stripes', type=click.IntRange(min=0))
+@with_appcontext
+def set_balance_stripes_command(group_id, stripes):
+    """Spread a group's contributions over STRIPES sub-balances (0 disables)."""
+    if db.session.get(SavingsGroup, group_id) is None:
+        raise click.ClickException(f"Group {group_id} not found")
+    set_balance_stripes(group_id, stripes)
+    db.session.commit()
+    click.echo(f"Group {group_id} now uses {stripes} balance stripes")
+
+
+@click.command('fold-balances')
+@with_appcontext
+def fold_balances_command():
+    """Fold striped sub-balances back into each group's balance."""
+    group_ids = db.session.execute(
+        select(SavingsGroup.id).where(SavingsGroup.balance_stripes > 0)
+    ).scalars().all()
+    for group_id in group_ids:
+        moved = fold_stripes(group_id)
+        db.session.commit()
+        click.echo(f"Group {group_id}: folded {from_cents(moved)}")
+
+
+@click.command('import-contributions')
+@click.argument('source', type=click.File('r'))
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None, help='Rows per commit.')
+@with_appcontext
+def import_contributions_command(source, chunk_size):
+    """Import contributions from a JSON array or NDJSON file ('-' for stdin).
+
+    Every row needs group_id, user_id and amount; created_at is optional.
+    """
+    content = source.read()
+    if content.lstrip().startswith('['):
+        records = json.loads(content)
+    else:
+        records = [line for line in content.splitlines() if line.strip()]
+    inserted, errors = ingest_contributions(records, chunk_size=chunk_size)
+    for error in errors:
+        click.echo(f"row {error['index']}: {error['error']}", err=True)
+    click.echo(f"Imported {inserted} contributions, {len(errors)} failed")
+
+
+@click.command('export-ledger')
+@click.argument('group_id', type=int)
+@click.option('--output', '-o', type=click.File('wb'), default='-', help="Destination file ('-' for stdout).")
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--from', 'since', default=None, help='Only rows created at or after this ISO date.')
+@click.option('--to', 'until', default=None, help='Only rows created before this ISO date.')
+@with_appcontext
+def export_ledger_command(group_id, output, export_format, compress, since, until):
+    """Stream a group's contributions and withdrawals, oldest first."""
+    if db.session.get(SavingsGroup, group_id) is None:
+        raise click.ClickException(f"Group {group_id} not found")
+    try:
+        since, until = parse_date_range(since, until)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for chunk in export_ledger(group_id, export_format, compress, since, until):
+        output.write(chunk)
+
+
+@click.command('rebuild-member-summaries')
+@click.option('--group', 'group_id', type=int, default=None, help='Only rebuild this group.')
+@with_appcontext
+def rebuild_member_summaries_command(group_id):
+    """Recompute per-member totals from the ledger in one statement.
+
+    Run while writes are paused; totals written meanwhile may be lost.
+    """
+    if group_id is not None and db.session.get(SavingsGroup, group_id) is None:
+        raise click.ClickException(f"Group {group_id} not found")
+    rows = rebuild_summaries(group_id)
+    db.session.commit()
+    click.echo(f"Rebuilt {rows} member summaries")
+
+
+@click.command('rebuild-rollups')
+@click.option('--group', 'group_id', type=int, default=None, help='Only rebuild this group.')
+@with_appcontext
+def rebuild_rollups_command(group_id):
+    """Backfill the daily chart rollups from the ledger in one statement.
+
+    Run while writes are paused; totals written meanwhile may be lost.
+    """
+    if group_id is not None and db.session.get(SavingsGroup, group_id) is None:
+        raise click.ClickException(f"Group {group_id} not found")
+    rows = rebuild_rollups(group_id)
+    db.session.commit()
+    click.echo(f"Rebuilt {rows} daily rollups")
+
+
+@click.command('reconcile-balances')
+@click.option('--group', 'group_ids', type=int, multiple=True, help='Only check these groups.')
+@click.option('--repair', is_flag=True, help='Correct mismatched balances to match the ledger.')
+@click.option('--workers', type=click.IntRange(min=1), default=1, help='Processes to spread groups over.')
+@click.option('--full', is_flag=True, help='Discard checkpoints and re-read whole ledgers.')
+@click.option('--settle-seconds', type=click.IntRange(min=0), default=DEFAULT_SETTLE_SECONDS,
+              help='Only checkpoint rows older than this.')
+@with_appcontext
+def reconcile_balances_command(group_ids, repair, workers, full, settle_seconds):
+    """Check group balances against the ledger rows added since the last run.
+
+    Exits with status 1 if any mismatch is left unrepaired.
+    """
+    group_ids = list(group_ids) or db.session.execute(
+        select(SavingsGroup.id).order_by(SavingsGroup.id)
+    ).scalars().all()
+    if full:
+        reset_checkpoints(group_ids)
+    started = time.perf_counter()
+    groups = rows = mismatched = 0
+    for result in reconcile_groups(group_ids, repair, workers, settle_seconds):
+        groups += 1
+        rows += result['rows']
+        if result['mismatch_cents']:
+            mismatched += 1
+            action = "repaired" if result['repaired'] else "mismatch"
+            click.echo(f"Group {result['group_id']}: {action}, balance is off by {from_cents(result['mismatch_cents'])}")
+    elapsed = time.perf_counter() - started
+    click.echo(f"Checked {groups} groups, {rows} new rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s), {mismatched} mismatched")
+    if mismatched and not repair:
+        raise SystemExit(1)
+
+
+@click.command('snapshot-balances')
+@click.option('--at', 'taken_at', default=None, help='Snapshot time as an ISO date (default: now minus --settle-seconds).')
+@click.option('--backfill-hours', type=click.IntRange(min=1), default=None,
+              help='Also take snapshots every N hours from the first ledger row up to --at.')
+@click.option('--settle-seconds', type=click.IntRange(min=0), default=DEFAULT_SETTLE_SECONDS,
+              help='Leave the newest rows out, as their transactions may still be open.')
+@with_appcontext
+def snapshot_balances_command(taken_at, backfill_hours, settle_seconds):
+    """Record every group's ledger totals for point-in-time balances.
+
+    Run it periodically; as_of queries replay at most one interval of rows.
+    """
+    try:
+        taken_at = parse_timestamp(taken_at) if taken_at else datetime.utcnow() - timedelta(seconds=settle_seconds)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    times = [taken_at]
+    if backfill_hours:
+        first = db.session.execute(select(func.min(Contribution.created_at))).scalar()
+        step = timedelta(hours=backfill_hours)
+        times = []
+        while first is not None and first < taken_at:
+            first += step
+            times.append(min(first, taken_at))
+    # Oldest first, each building on the one before it
+    snapshots = 0
+    for moment in times:
+        snapshots += take_snapshots(moment)
+        db.session.commit()
+    click.echo(f"Took {snapshots} snapshots at {len(times)} times")
+
+
+@click.command('prune-events')
+@click.option('--hours', type=click.IntRange(min=1), default=168, show_default=True,
+              help='Keep events this recent.')
+@with_appcontext
+def prune_events_command(hours):
+    """Delete old events from the outbox behind GET /api/events.
+
+    Clients that reconnect with an older Last-Event-ID miss the pruned events.
+    """
+    deleted = prune_events(datetime.utcnow() - timedelta(hours=hours))
+    click.echo(f"Deleted {deleted} events")
+
+
+def register_commands(app):
+    app.cli.add_command(set_balance_stripes_command)
+    app.cli.add_command(fold_balances_command)
+    app.cli.add_command(import_contributions_command)
+    app.cli.add_command(export_ledger_command)
+    app.cli.add_command(rebuild_member_summaries_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(reconcile_balances_command)
+    app.cli.add_command(snapshot_balances_command)
+    app.cli.add_command(prune_events_command)
@@ -0,0 +1,238 @@
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from .models import db, GroupEvent
+from .money import from_cents
+import json
+import os
+import threading
+import time
+
+# Streams send a comment this often, so proxies keep idle connections open
+HEARTBEAT_SECONDS = 15
+# Tells EventSource how long to wait before reconnecting
+RETRY_MILLISECONDS = 3000
+# Outbox rows read per query, by the poller and by a replay
+EVENTS_BATCH_SIZE = 1000
+# A transaction can commit an event id lower than one already seen; ids are
+# only passed over for good once their row is this old
+EVENTS_SETTLE_SECONDS = 5
+EVENT_COLUMNS = (GroupEvent.id, GroupEvent.group_id, GroupEvent.kind, GroupEvent.payload, GroupEvent.created_at)
+
+
+def emit_event(group_id, kind, payload):
+    # Queues an event in the caller's transaction; it is streamed only if
+    # that transaction commits
+    db.session.add(GroupEvent(group_id=group_id, kind=kind, payload=json.dumps({"group_id": group_id, **payload})))
+
+
+def emit_events(events):
+    # events: [(group_id, kind, payload)], as one INSERT
+    if events:
+        db.session.execute(insert(GroupEvent), [
+            {"group_id": group_id, "kind": kind, "payload": json.dumps({"group_id": group_id, **payload})}
+            for group_id, kind, payload in events
+        ])
+
+
+def withdrawal_decision(withdrawal, status, processed_at, processed_by, current_cents=None):
+    # Payload of a 'withdrawal_processed' event; approvals carry the new balance
+    payload = {
+        "withdrawal": {
+            "id": withdrawal.id,
+            "user_id": withdrawal.user_id,
+            "amount": from_cents(withdrawal.amount_cents),
+            "status": status,
+            "processed_at": processed_at.isoformat(),
+            "processed_by": int(processed_by)
+        }
+    }
+    if current_cents is not None:
+        payload["current_amount"] = from_cents(current_cents)
+    return payload
+
+
+def replay_events(group_ids, after_id, settled_before=None):
+    # Outbox rows of the groups after after_id, oldest first, read a batch
+    # at a time without holding a connection between batches. With
+    # settled_before, rows up to after_id created since then are sent first:
+    # they may have committed after the client read past their ids.
+    if settled_before is not None and group_ids:
+        rows = db.session.execute(
+            select(*EVENT_COLUMNS)
+            .where(GroupEvent.group_id.in_(group_ids), GroupEvent.id <= after_id, GroupEvent.created_at >= settled_before)
+            .order_by(GroupEvent.id)
+        ).all()
+        db.session.close()
+        yield from rows
+    while group_ids:
+        rows = db.session.execute(
+            select(*EVENT_COLUMNS)
+            .where(GroupEvent.group_id.in_(group_ids), GroupEvent.id > after_id)
+            .order_by(GroupEvent.id)
+            .limit(EVENTS_BATCH_SIZE)
+        ).all()
+        db.session.close()
+        yield from rows
+        if len(rows) < EVENTS_BATCH_SIZE:
+            return
+        after_id = rows[-1].id
+
+
+def prune_events(older_than):
+    # Returns the number of events deleted
+    deleted = db.session.execute(delete(GroupEvent).where(GroupEvent.created_at < older_than)).rowcount
+    db.session.commit()
+    return deleted
+
+
+class EventHub:
+    # Fans new outbox rows out to every open stream in this process. One
+    # poller thread reads the outbox for all of them and streams wait on a
+    # condition, so an idle stream runs no queries and, under the gevent
+    # worker, costs a parked greenlet rather than a thread.
+    def __init__(self, app):
+        self.app = app
+        self.poll_seconds = app.config.get('EVENTS_POLL_SECONDS', 1.0)
+        self.condition = threading.Condition()
+        # (sequence, event) for the newest events; sequence numbers follow
+        # arrival order, which can differ from id order
+        self.recent = deque(maxlen=app.config.get('EVENTS_BUFFER_SIZE', 10000))
+        self.sequence = 0
+        self.pid = None
+        self.after_id = 0
+        self.unsettled = set()
+
+    def start(self):
+        # Once per process, on the first stream (a forked worker starts its
+        # own). The starting point is read here, before the caller replays
+        # anything, so no event falls between a replay and the poller.
+        with self.condition:
+            if self.pid == os.getpid():
+                return
+            self.after_id = db.session.execute(select(func.max(GroupEvent.id))).scalar() or 0
+            db.session.close()
+            self.unsettled = set()
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, name='event-poller', daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.poll():
+                        pass
+            except Exception:
+                self.app.logger.exception("Polling the event outbox failed")
+            time.sleep(self.poll_seconds)
+
+    def poll(self):
+        # Publishes unseen rows; returns True if a full batch was read
+        rows = db.session.execute(
+            select(*EVENT_COLUMNS).where(GroupEvent.id > self.after_id).order_by(GroupEvent.id).limit(EVENTS_BATCH_SIZE)
+        ).all()
+        db.session.close()
+        new = [row for row in rows if row.id not in self.unsettled]
+        if new:
+            with self.condition:
+                for row in new:
+                    self.sequence += 1
+                    self.recent.append((self.sequence, row))
+                self.condition.notify_all()
+        self.unsettled.update(row.id for row in new)
+
+        # Move past the oldest rows; newer ones are read again (but not
+        # published again) until no earlier id can still commit
+        settled_before = datetime.utcnow() - timedelta(seconds=EVENTS_SETTLE_SECONDS)
+        for row in rows:
+            if row.created_at >= settled_before:
+                break
+            self.after_id = row.id
+        self.unsettled = {event_id for event_id in self.unsettled if event_id > self.after_id}
+        return len(rows) == EVENTS_BATCH_SIZE
+
+    def wait(self, sequence, timeout):
+        # Events published after `sequence`, waiting up to timeout for one.
+        # Returns (events, sequence); events is None if some of them have
+        # already left the buffer.
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence > sequence, timeout)
+            events = []
+            for event_sequence, event in reversed(self.recent):
+                if event_sequence <= sequence:
+                    break
+                events.append(event)
+            if len(events) < self.sequence - sequence:
+                return None, self.sequence
+            events.reverse()
+            return events, self.sequence
+
+
+class EventBroker:
+    def init_app(self, app):
+        app.extensions['event_hub'] = EventHub(app)
+
+    @property
+    def hub(self):
+        return current_app.extensions['event_hub']
+
+
+def format_event(event):
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {event.payload}\n\n"
+
+
+def event_stream(user_id, group_ids, after_id, expires_at):
+    # Server-sent events for the user's groups: the outbox rows after
+    # after_id (a Last-Event-ID, or None to start from now), then live
+    # events until the token expires
+    hub = event_broker.hub
+    hub.start()
+    group_ids = set(group_ids)
+    sequence = hub.sequence
+    # A resumed stream also looks back over ids the client passed that were
+    # still settling; a new one gets those from the hub
+    look_back = after_id is not None
+    if after_id is None:
+        after_id = db.session.execute(select(func.max(GroupEvent.id))).scalar() or 0
+        db.session.close()
+    yield f"retry: {RETRY_MILLISECONDS}\n\n"
+
+    # Ids sent on this stream that a replay or the hub could send again;
+    # once the hub has settled past an id it never comes back
+    sent = set()
+    written_at = time.monotonic()
+    while True:
+        settled_before = datetime.utcnow() - timedelta(seconds=EVENTS_SETTLE_SECONDS) if look_back else None
+        for event in replay_events(group_ids, after_id, settled_before):
+            if event.id in sent:
+                continue
+            sent.add(event.id)
+            after_id = max(after_id, event.id)
+            yield format_event(event)
+        look_back = True
+        while True:
+            now = time.monotonic()
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                # The client reconnects (with a fresh token) and resumes
+                return
+            events, sequence = hub.wait(sequence, min(written_at + HEARTBEAT_SECONDS - now, remaining))
+            if events is None:
+                # Too slow for the buffer: catch up from the outbox
+                break
+            for event in events:
+                if event.kind == 'member_joined' and json.loads(event.payload)['user_id'] == user_id:
+                    group_ids.add(event.group_id)
+                if event.group_id in group_ids and event.id not in sent:
+                    sent.add(event.id)
+                    after_id = max(after_id, event.id)
+                    written_at = time.monotonic()
+                    yield format_event(event)
+            sent = {event_id for event_id in sent if event_id > hub.after_id}
+            if time.monotonic() - written_at >= HEARTBEAT_SECONDS:
+                written_at = time.monotonic()
+                yield ": ping\n\n"
+
+
+event_broker = EventBroker()
@@ -0,0 +1,257 @@
+from collections import defaultdict
+from functools import wraps
+from flask import current_app
+from sqlalchemy import and_, case, delete, func, literal, select, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from .models import db, User, SavingsGroup, GroupMember, GroupBalanceStripe
+from .cache import catalogue_changed
+from .money import sum_cents
+from .sqlite_profile import serialized_writes
+import random
+import time
+
+# Postgres serialization failure, deadlock and lock-not-available
+RETRYABLE_PGCODES = {'40001', '40P01', '55P03'}
+
+
+def is_retryable(error):
+    orig = getattr(error, 'orig', None)
+    if getattr(orig, 'pgcode', None) in RETRYABLE_PGCODES:
+        return True
+    # SQLite reports write contention as "database is locked"/"database table is locked"
+    return 'is locked' in str(orig)
+
+
+def retry_on_conflict(view):
+    # Re-run a whole write transaction when the database reports contention.
+    # Views using this are also the write transactions serialised by the
+    # SQLite profile.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        attempts = current_app.config.get('DB_RETRY_ATTEMPTS', 5)
+        for attempt in range(attempts):
+            try:
+                with serialized_writes():
+                    return view(*args, **kwargs)
+            except DBAPIError as e:
+                db.session.rollback()
+                if attempt == attempts - 1 or not is_retryable(e):
+                    raise
+                current_app.logger.warning(f"Retrying after database conflict: {e.orig}")
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return wrapper
+
+
+def balance_column():
+    # Group balance including unfolded stripes, for selecting next to SavingsGroup
+    # Amounts are integer cents, so the sum is exact
+    stripes = select(func.coalesce(sum_cents(GroupBalanceStripe.amount_cents), 0)).where(
+        GroupBalanceStripe.group_id == SavingsGroup.id
+    ).correlate(SavingsGroup).scalar_subquery()
+    return (SavingsGroup.current_amount_cents + stripes).label('balance_cents')
+
+
+def read_balance(group_id):
+    return db.session.execute(
+        select(balance_column()).where(SavingsGroup.id == group_id)
+    ).scalar_one_or_none()
+
+
+def credit_group(group_id, cents, striped=True):
+    # Returns the new balance in cents, or None if the group does not exist.
+    # Striped groups add to one random stripe row so concurrent writers
+    # rarely touch the same row; others update the group row directly.
+    # `striped` is whether the group had stripes when last read (see
+    # MembershipCache); a stale answer costs a statement or some contention,
+    # never money.
+    catalogue_changed()
+    if striped:
+        credited = credit_stripe(group_id, cents)
+        if credited is not None:
+            return credited
+    return db.session.execute(
+        update(SavingsGroup)
+        .where(SavingsGroup.id == group_id)
+        .values(
+            current_amount_cents=SavingsGroup.current_amount_cents + cents,
+            version=SavingsGroup.version + 1
+        )
+        .returning(SavingsGroup.current_amount_cents)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+
+def credit_stripe(group_id, cents):
+    # Adds to one random stripe; returns the new balance, or None if the
+    # group has no stripes
+    stripe_count = select(func.nullif(SavingsGroup.balance_stripes, 0)).where(
+        SavingsGroup.id == group_id
+    ).scalar_subquery()
+    striped = db.session.execute(
+        update(GroupBalanceStripe)
+        .where(
+            GroupBalanceStripe.group_id == group_id,
+            GroupBalanceStripe.stripe == random.randrange(1 << 16) % stripe_count
+        )
+        .values(amount_cents=GroupBalanceStripe.amount_cents + cents, version=GroupBalanceStripe.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return read_balance(group_id) if striped else None
+
+
+def credit_groups(totals):
+    # totals: {group_id: cents}. The batch form of credit_group, in at most two
+    # statements however many groups: striped groups add to one random stripe
+    # each, and the groups that got no stripe update their own row.
+    catalogue_changed()
+    group_ids = sorted(totals)
+    stripe_count = select(func.nullif(SavingsGroup.balance_stripes, 0)).where(
+        SavingsGroup.id == GroupBalanceStripe.group_id
+    ).scalar_subquery()
+    picks = case({group_id: random.randrange(1 << 16) for group_id in group_ids}, value=GroupBalanceStripe.group_id)
+    striped = set(db.session.execute(
+        update(GroupBalanceStripe)
+        .where(GroupBalanceStripe.group_id.in_(group_ids), GroupBalanceStripe.stripe == picks % stripe_count)
+        .values(
+            amount_cents=GroupBalanceStripe.amount_cents + case(totals, value=GroupBalanceStripe.group_id),
+            version=GroupBalanceStripe.version + 1
+        )
+        .returning(GroupBalanceStripe.group_id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    plain = {group_id: cents for group_id, cents in totals.items() if group_id not in striped}
+    if plain:
+        db.session.execute(
+            update(SavingsGroup)
+            .where(SavingsGroup.id.in_(sorted(plain)))
+            .values(
+                current_amount_cents=SavingsGroup.current_amount_cents + case(plain, value=SavingsGroup.id),
+                version=SavingsGroup.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+def fold_group_stripes(group_ids):
+    # Move stripe amounts into current_amount_cents; returns {group_id: cents
+    # moved}. Each stripe is decremented by the value read rather than zeroed,
+    # so contributions landing on it meanwhile are never lost. At most three
+    # statements, however many groups and stripes.
+    read = db.session.execute(
+        select(GroupBalanceStripe.group_id, GroupBalanceStripe.stripe, GroupBalanceStripe.amount_cents)
+        .where(GroupBalanceStripe.group_id.in_(group_ids), GroupBalanceStripe.amount_cents != 0)
+        .order_by(GroupBalanceStripe.group_id, GroupBalanceStripe.stripe)
+    ).all()
+    if read:
+        db.session.execute(
+            update(GroupBalanceStripe)
+            .where(tuple_(GroupBalanceStripe.group_id, GroupBalanceStripe.stripe).in_(
+                [(group_id, stripe) for group_id, stripe, _ in read]
+            ))
+            .values(amount_cents=GroupBalanceStripe.amount_cents - case(*(
+                (and_(GroupBalanceStripe.group_id == group_id, GroupBalanceStripe.stripe == stripe), cents)
+                for group_id, stripe, cents in read
+            )))
+            .execution_options(synchronize_session=False)
+        )
+    moved = defaultdict(int)
+    for group_id, _, cents in read:
+        moved[group_id] += cents
+    moved = {group_id: cents for group_id, cents in moved.items() if cents}
+    if moved:
+        db.session.execute(
+            update(SavingsGroup)
+            .where(SavingsGroup.id.in_(sorted(moved)))
+            .values(current_amount_cents=SavingsGroup.current_amount_cents + case(moved, value=SavingsGroup.id))
+            .execution_options(synchronize_session=False)
+        )
+    return moved
+
+
+def fold_stripes(group_id):
+    # fold_group_stripes for one group; returns the cents moved
+    return fold_group_stripes([group_id]).get(group_id, 0)
+
+
+def debit_group(group_id, cents):
+    # Returns the new balance in cents, or None if the group would be overdrawn.
+    # Stripes are folded first so the check sees the whole balance.
+    catalogue_changed()
+    fold_stripes(group_id)
+    return db.session.execute(
+        update(SavingsGroup)
+        .where(SavingsGroup.id == group_id, SavingsGroup.current_amount_cents >= cents)
+        .values(current_amount_cents=SavingsGroup.current_amount_cents - cents, version=SavingsGroup.version + 1)
+        .returning(SavingsGroup.current_amount_cents)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+
+def debit_groups(debits, group_ids):
+    # Subtracts debits.get(group_id, 0) from each of group_ids and bumps its
+    # version, in one statement; returns {group_id: new balance in cents},
+    # leaving out groups that would be overdrawn. Stripes are not folded here:
+    # callers fold (and lock) the groups before checking what they can debit.
+    if debits:
+        catalogue_changed()
+        amounts = case(debits, value=SavingsGroup.id, else_=0)
+    else:
+        amounts = literal(0)
+    return dict(db.session.execute(
+        update(SavingsGroup)
+        .where(SavingsGroup.id.in_(sorted(group_ids)), SavingsGroup.current_amount_cents >= amounts)
+        .values(current_amount_cents=SavingsGroup.current_amount_cents - amounts, version=SavingsGroup.version + 1)
+        .returning(SavingsGroup.id, SavingsGroup.current_amount_cents)
+        .execution_options(synchronize_session=False)
+    ).all())
+
+
+def set_balance_stripes(group_id, stripes):
+    # Switch a group to `stripes` sub-balance rows (0 turns striping off)
+    fold_stripes(group_id)
+    # Carry the dropped stripes' versions over so the group version never goes back
+    retired = db.session.execute(
+        select(func.coalesce(func.sum(GroupBalanceStripe.version), 0)).where(GroupBalanceStripe.group_id == group_id)
+    ).scalar_one()
+    db.session.execute(delete(GroupBalanceStripe).where(GroupBalanceStripe.group_id == group_id))
+    db.session.execute(
+        update(SavingsGroup)
+        .where(SavingsGroup.id == group_id)
+        .values(balance_stripes=stripes, version=SavingsGroup.version + retired + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.add_all([GroupBalanceStripe(group_id=group_id, stripe=i, amount_cents=0) for i in range(stripes)])
+
+
+def version_column():
+    # Group version including stripe writes, for selecting next to SavingsGroup
+    stripes = select(func.coalesce(func.sum(GroupBalanceStripe.version), 0)).where(
+        GroupBalanceStripe.group_id == SavingsGroup.id
+    ).correlate(SavingsGroup).scalar_subquery()
+    return (SavingsGroup.version + stripes).label('version')
+
+
+def member_versions_column():
+    # Sum of the members' user versions, for responses that show member profiles
+    return select(func.coalesce(func.sum(User.version), 0)).join(
+        GroupMember, GroupMember.user_id == User.id
+    ).where(GroupMember.group_id == SavingsGroup.id).correlate(SavingsGroup).scalar_subquery().label('member_versions')
+
+
+def touch_group(group_id):
+    # Bump the version of a group after a write that does not move its balance
+    db.session.execute(
+        update(SavingsGroup)
+        .where(SavingsGroup.id == group_id)
+        .values(version=SavingsGroup.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def touch_user(user_id):
+    db.session.execute(
+        update(User)
+        .where(User.id == int(user_id))
+        .values(version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
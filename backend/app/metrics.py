@@ -0,0 +1,328 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; +Inf is implied
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# name: (type, help, buckets), in the order they are exposed
+FAMILIES = {
+    'http_requests_total': (
+        'counter', 'Requests handled, by endpoint, method and status code.', None
+    ),
+    'http_requests_in_flight': (
+        'gauge', 'Requests being handled; an open event stream counts until it closes.', None
+    ),
+    'http_request_duration_seconds': (
+        'histogram', 'Time from the request arriving to its response being closed.', SECONDS_BUCKETS
+    ),
+    'http_request_db_statements': (
+        'histogram', 'SQL statements executed per request.', STATEMENT_BUCKETS
+    ),
+    'http_request_db_seconds': (
+        'histogram', 'Time spent executing SQL per request.', SECONDS_BUCKETS
+    ),
+}
+# The RequestMetrics of the request being handled in this thread (or
+# greenlet). It stays set until the response is closed, so SQL run while a
+# streamed body is sent still counts.
+current_request = ContextVar('current_request', default=None)
+# Label strings by (endpoint, method), so they are built once
+LABELS = {}
+# Any other method (only possible on unmatched URLs) is labelled "other"
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# le label of each bucket, as stored
+BUCKET_LABELS = {
+    name: tuple(format_value(bound) for bound in buckets)
+    for name, (kind, help_text, buckets) in FAMILIES.items() if kind == 'histogram'
+}
+
+
+def histogram_samples(name, labels, value):
+    # [(key, amount)] for one observation. Buckets are stored as plain counts
+    # and made cumulative when rendered, so an observation touches one.
+    buckets = FAMILIES[name][2]
+    samples = [((f'{name}_sum', labels, ''), value), ((f'{name}_count', labels, ''), 1)]
+    index = bisect_left(buckets, value)
+    if index < len(buckets):
+        samples.append(((f'{name}_bucket', labels, BUCKET_LABELS[name][index]), 1))
+    return samples
+
+
+class RequestMetrics:
+    __slots__ = ('labels', 'started', 'statements', 'db_seconds', 'statement_started')
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.statement_started = None
+
+    def samples(self, status):
+        return [
+            (('http_requests_total', f'{self.labels},status="{status}"', ''), 1),
+            *histogram_samples('http_request_duration_seconds', self.labels, time.perf_counter() - self.started),
+            *histogram_samples('http_request_db_statements', self.labels, self.statements),
+            *histogram_samples('http_request_db_seconds', self.labels, self.db_seconds),
+        ]
+
+
+class MemoryMetrics:
+    # This process's samples. Right for a single process; under several
+    # gunicorn workers each would only report its own share.
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels, le): value, and (name, labels): value
+        self.counters = {}
+        self.gauges = {}
+
+    def record(self, counters=(), gauges=()):
+        with self.lock:
+            for key, amount in counters:
+                self.counters[key] = self.counters.get(key, 0) + amount
+            for key, amount in gauges:
+                self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def collect(self):
+        with self.lock:
+            return dict(self.counters), dict(self.gauges)
+
+
+class SQLiteMetrics(MemoryMetrics):
+    # Each worker adds its counters to a local SQLite file every
+    # flush_seconds, and /metrics in any worker reads the file, so a scrape
+    # sees every worker on the host. Counters of exited workers are kept;
+    # their gauges are dropped.
+    def __init__(self, path, flush_seconds=5):
+        super().__init__()
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.local = threading.local()
+        self.pid = None
+        self.flushed_gauges = None
+
+    def connection(self):
+        # One connection per thread and per process (a forked worker opens its own)
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_sample ("
+                " name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL,"
+                " PRIMARY KEY (name, labels, le))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_gauge ("
+                " pid INTEGER NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL,"
+                " PRIMARY KEY (pid, name, labels))"
+            )
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def record(self, counters=(), gauges=()):
+        if self.pid != os.getpid():
+            self.start()
+        super().record(counters, gauges)
+
+    def start(self):
+        # Once per process, on its first request; a forked worker drops
+        # whatever it inherited, which the parent flushes itself
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.counters, self.gauges = {}, {}
+            self.flushed_gauges = None
+            self.pid = os.getpid()
+        threading.Thread(target=self.run, name='metrics-flusher', daemon=True).start()
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing metrics failed")
+
+    def flush(self):
+        with self.lock:
+            counters, self.counters = self.counters, {}
+            gauges = dict(self.gauges)
+        if not counters and gauges == self.flushed_gauges:
+            return
+        pid = os.getpid()
+        conn = self.connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO metric_sample (name, labels, le, value) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value",
+                [(*key, value) for key, value in counters.items()]
+            )
+            conn.execute("DELETE FROM metric_gauge WHERE pid = ?", (pid,))
+            conn.executemany(
+                "INSERT INTO metric_gauge (pid, name, labels, value) VALUES (?, ?, ?, ?)",
+                [(pid, *key, value) for key, value in gauges.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # Keep the counts for the next flush
+            MemoryMetrics.record(self, counters.items())
+            raise
+        self.flushed_gauges = gauges
+
+    def collect(self):
+        if self.pid == os.getpid():
+            self.flush()
+        conn = self.connection()
+        counters = {
+            (name, labels, le): value
+            for name, labels, le, value in conn.execute("SELECT name, labels, le, value FROM metric_sample")
+        }
+        rows = conn.execute("SELECT pid, name, labels, value FROM metric_gauge").fetchall()
+        exited = {pid for pid in {row[0] for row in rows} if not process_alive(pid)}
+        if exited:
+            conn.executemany("DELETE FROM metric_gauge WHERE pid = ?", [(pid,) for pid in exited])
+        gauges = {}
+        for pid, name, labels, value in rows:
+            if pid not in exited:
+                gauges[(name, labels)] = gauges.get((name, labels), 0) + value
+        return counters, gauges
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def make_metrics_backend(app):
+    # METRICS_BACKEND: 'sqlite' (shared by the workers on a host) or 'memory'
+    if app.config.get('METRICS_BACKEND', 'sqlite') == 'sqlite':
+        path = app.config.get('METRICS_PATH') or os.path.join(app.instance_path, 'metrics.db')
+        return SQLiteMetrics(path, flush_seconds=app.config.get('METRICS_FLUSH_SECONDS', 5))
+    return MemoryMetrics()
+
+
+def render(counters, gauges):
+    # Prometheus text exposition format (version 0.0.4)
+    lines = []
+    for name, (kind, help_text, buckets) in FAMILIES.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'histogram':
+            for labels in sorted(labels for sample, labels, _ in counters if sample == f'{name}_count'):
+                cumulative = 0
+                for le in BUCKET_LABELS[name]:
+                    cumulative += counters.get((f'{name}_bucket', labels, le), 0)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {format_value(cumulative)}')
+                count = counters[(f'{name}_count', labels, '')]
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {format_value(count)}')
+                lines.append(f'{name}_sum{{{labels}}} {format_value(counters[(f"{name}_sum", labels, "")])}')
+                lines.append(f'{name}_count{{{labels}}} {format_value(count)}')
+        else:
+            samples = gauges if kind == 'gauge' else counters
+            for key, value in sorted(samples.items()):
+                if key[0] == name:
+                    lines.append(f'{name}{{{key[1]}}} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def request_labels(endpoint, method):
+    key = (endpoint, method)
+    labels = LABELS.get(key)
+    if labels is None:
+        labels = LABELS[key] = f'endpoint="{label_value(endpoint or "none")}",method="{label_value(method)}"'
+    return labels
+
+
+def start_request():
+    endpoint, method = request.endpoint, request.method
+    if endpoint == 'metrics':
+        current_request.set(None)
+        return
+    labels = request_labels(endpoint, method if method in HTTP_METHODS else 'other')
+    current_request.set(RequestMetrics(labels))
+    metrics.backend.record(gauges=[(('http_requests_in_flight', labels), 1)])
+
+
+def finish_request(response):
+    # Counted when the response is closed, after a streamed body is sent
+    state = current_request.get()
+    if state is not None:
+        backend = metrics.backend
+
+        def finish():
+            if current_request.get() is state:
+                current_request.set(None)
+            backend.record(state.samples(response.status_code), [(('http_requests_in_flight', state.labels), -1)])
+
+        response.call_on_close(finish)
+    return response
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = current_request.get()
+    if state is not None:
+        state.statement_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = current_request.get()
+    if state is not None and state.statement_started is not None:
+        state.statements += 1
+        state.db_seconds += time.perf_counter() - state.statement_started
+        state.statement_started = None
+
+
+def metrics_view():
+    return current_app.response_class(
+        render(*metrics.backend.collect()), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class Metrics:
+    # Request counts, latency, in-flight requests and SQL per request for
+    # every endpoint, served at /metrics for Prometheus
+    def init_app(self, app):
+        app.extensions['metrics'] = make_metrics_backend(app)
+        app.before_request(start_request)
+        app.after_request(finish_request)
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+        if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @property
+    def backend(self):
+        return current_app.extensions['metrics']
+
+
+metrics = Metrics()
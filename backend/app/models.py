@@ -1,8 +1,24 @@
 from datetime import datetime
 from flask_migrate import migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, func, literal_column
 
 db = SQLAlchemy()
+
+# Full-text search over group names and descriptions (app/search.py).
+# 'simple' only lowercases: names are not in any one language.
+SEARCH_CONFIG = literal_column("'simple'")
+
+def search_document(name, description):
+    # The Postgres tsvector; queries must use this exact expression to hit
+    # the GIN index, so constants are inlined rather than bound. Names weigh
+    # more than descriptions.
+    def weighted(column, weight):
+        return func.setweight(
+            func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, literal_column("''"))), literal_column(f"'{weight}'")
+        )
+    return weighted(name, 'A').op('||')(weighted(description, 'B'))
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -10,6 +26,10 @@ class User(db.Model):
     password = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     avatar = db.Column(db.String(255), nullable=True)
+    # Bumped when the profile or the user's set of groups changes (ETags)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped when the password changes; refresh tokens issued before that are refused
+    password_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     groups = db.relationship('GroupMember', back_populates='user')
@@ -21,16 +41,58 @@ class SavingsGroup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    target_amount = db.Column(db.Float, nullable=False)
-    current_amount = db.Column(db.Float, default=0.0)
+    # Money columns hold integer minor units (cents); see app/money.py
+    target_amount_cents = db.Column(db.BigInteger, nullable=False)
+    current_amount_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Number of GroupBalanceStripe rows contributions are spread over; 0 disables striping
+    balance_stripes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every write that changes what GET /api/groups/<id> returns (ETags)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Keyset pagination order for /api/discover, and the Postgres search index
+    __table_args__ = (
+        db.Index('ix_savings_group_created_at_id', 'created_at', 'id'),
+        db.Index(
+            'ix_savings_group_search', search_document(name, description), postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
     
     # Relationships
     members = db.relationship('GroupMember', back_populates='group')
     contributions = db.relationship('Contribution', back_populates='group')
     withdrawals = db.relationship('WithdrawalRequest', back_populates='group')
 
+# SQLite keeps an external-content FTS5 table in step through triggers;
+# balance updates do not touch it
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS savings_group_fts USING fts5("
+    "name, description, content='savings_group', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS savings_group_fts_insert AFTER INSERT ON savings_group BEGIN"
+    " INSERT INTO savings_group_fts (rowid, name, description) VALUES (new.id, new.name, new.description);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS savings_group_fts_delete AFTER DELETE ON savings_group BEGIN"
+    " INSERT INTO savings_group_fts (savings_group_fts, rowid, name, description)"
+    " VALUES ('delete', old.id, old.name, old.description);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS savings_group_fts_update AFTER UPDATE OF name, description ON savings_group BEGIN"
+    " INSERT INTO savings_group_fts (savings_group_fts, rowid, name, description)"
+    " VALUES ('delete', old.id, old.name, old.description);"
+    " INSERT INTO savings_group_fts (rowid, name, description) VALUES (new.id, new.name, new.description);"
+    " END",
+)
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(SavingsGroup.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+class GroupBalanceStripe(db.Model):
+    # Sub-balance of a hot group; the group balance is current_amount_cents plus all stripes
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), primary_key=True)
+    stripe = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    # Writes to a stripe bump this instead of the contended group version
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
 class GroupMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -38,24 +100,38 @@ class GroupMember(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # One membership per (user, group); also serves the per-route membership lookup
+    __table_args__ = (
+        db.Index('ix_group_member_user_id_group_id', 'user_id', 'group_id', unique=True),
+        db.Index('ix_group_member_group_id', 'group_id'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='groups')
     group = db.relationship('SavingsGroup', back_populates='members')
 
 class Contribution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Keyset pagination order for group history, with and without a user filter
+    __table_args__ = (
+        db.Index('ix_contribution_group_id_created_at_id', 'group_id', 'created_at', 'id'),
+        db.Index('ix_contribution_group_id_user_id_created_at_id', 'group_id', 'user_id', 'created_at', 'id'),
+        # Rows past a reconciliation checkpoint
+        db.Index('ix_contribution_group_id_id', 'group_id', 'id'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='contributions')
     group = db.relationship('SavingsGroup', back_populates='contributions')
 
 class WithdrawalRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
     reason = db.Column(db.Text, nullable=True)
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -64,11 +140,89 @@ class WithdrawalRequest(db.Model):
     processed_at = db.Column(db.DateTime, nullable=True)
     processed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     
+    # Keyset pagination order for group history, plus its user and status filters
+    __table_args__ = (
+        db.Index('ix_withdrawal_request_group_id_created_at_id', 'group_id', 'created_at', 'id'),
+        db.Index('ix_withdrawal_request_group_id_user_id_created_at_id', 'group_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_withdrawal_request_group_id_status_created_at_id', 'group_id', 'status', 'created_at', 'id'),
+        db.Index('ix_withdrawal_request_group_id_id', 'group_id', 'id'),
+        # Approvals replayed after a balance snapshot
+        db.Index('ix_withdrawal_request_group_id_processed_at', 'group_id', 'processed_at'),
+    )
+    
     # Relationships with explicit foreign keys
     user = db.relationship('User', foreign_keys=[user_id], back_populates='withdrawals')
     group = db.relationship('SavingsGroup', back_populates='withdrawals')
     processor = db.relationship('User', foreign_keys=[processed_by], back_populates='processed_withdrawals')
 
+class MemberSummary(db.Model):
+    # Running totals per (group, member), updated in the same transaction as
+    # the ledger rows; `flask rebuild-member-summaries` recomputes them
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    contributed_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    contributions_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Approved withdrawals only
+    withdrawn_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    withdrawals_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    
+    # Top contributors of a group
+    __table_args__ = (
+        db.Index('ix_member_summary_group_id_contributed_cents', 'group_id', 'contributed_cents'),
+    )
+
+class GroupDailyRollup(db.Model):
+    # Per-day group totals for charts, maintained alongside MemberSummary;
+    # weeks and months are summed from these
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    contributed_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    contributions_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Approved withdrawals, on the day they were processed
+    withdrawn_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    withdrawals_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class ReconciliationCheckpoint(db.Model):
+    # How far `flask reconcile-balances` has verified a group's ledger: every
+    # row up to these ids is settled and included in the running sums
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), primary_key=True)
+    last_contribution_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_withdrawal_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    contributed_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    withdrawn_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Balance minus ledger at the last run (0 when they agreed)
+    mismatch_cents = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Last run that moved the checkpoint or changed the mismatch
+    checked_at = db.Column(db.DateTime, nullable=True)
+
+class BalanceSnapshot(db.Model):
+    # A group's ledger totals up to taken_at; point-in-time balances start
+    # from the nearest snapshot and replay only the rows after it
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), primary_key=True)
+    taken_at = db.Column(db.DateTime, primary_key=True)
+    contributed_cents = db.Column(db.BigInteger, nullable=False)
+    # Approved withdrawals, by the time they were processed
+    withdrawn_cents = db.Column(db.BigInteger, nullable=False)
+
+class GroupEvent(db.Model):
+    # Outbox behind GET /api/events: written in the transaction that makes
+    # the change, so an event exists exactly when its change committed
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey('savings_group.id'), nullable=False)
+    kind = db.Column(db.String(32), nullable=False)
+    # JSON, sent to clients as is
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Replay after a Last-Event-ID, and pruning by age. Ids are never
+    # reused (AUTOINCREMENT on SQLite), even once old events are pruned.
+    __table_args__ = (
+        db.Index('ix_group_event_group_id_id', 'group_id', 'id'),
+        db.Index('ix_group_event_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+
 
 
 if __name__ == '__main__':
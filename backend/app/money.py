@@ -0,0 +1,41 @@
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import BigInteger, cast, func
+
+# The ledger stores integer minor units (cents); the API speaks major units
+MINOR_UNITS = 100
+# Largest accepted amount. Far inside BIGINT, so balances and sums of many
+# amounts cannot overflow, and exact as a JSON float.
+MAX_CENTS = 10 ** 15
+
+
+def to_cents(value):
+    # Parses an API amount (number or numeric string) into integer cents.
+    # Raises ValueError for non-numbers, sub-cent precision and amounts
+    # beyond MAX_CENTS either way.
+    if isinstance(value, bool):
+        raise ValueError("Amount must be a number")
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError):
+        raise ValueError("Amount must be a number")
+    if not amount.is_finite():
+        raise ValueError("Amount must be a number")
+    cents = amount * MINOR_UNITS
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount cannot exceed {MAX_CENTS // MINOR_UNITS}")
+    if cents != cents.to_integral_value():
+        raise ValueError("Amount can have at most two decimal places")
+    return int(cents)
+
+
+def sum_cents(column):
+    # PostgreSQL sums BIGINT columns as NUMERIC, which arrives as Decimal;
+    # cast back so totals stay ints on every database
+    return cast(func.sum(column), BigInteger)
+
+
+def from_cents(cents):
+    # JSON-friendly major units, e.g. 1050 -> 10.5
+    if cents is None:
+        return None
+    return cents / MINOR_UNITS
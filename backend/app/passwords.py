@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+import functools
+import os
+import sys
+import threading
+
+# hashlib's scrypt/pbkdf2 release the GIL, so running them on a small shared
+# pool keeps other request threads responsive and caps how many KDFs burn
+# CPU at once in a worker.
+executor = None
+executor_lock = threading.Lock()
+
+
+def executor_class():
+    # Under gevent workers threading is monkey-patched and its "threads" are
+    # greenlets, so a KDF would hold the whole worker and every open stream.
+    # gevent's executor runs on native threads and waits cooperatively.
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor
+    return ThreadPoolExecutor
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = executor_class()(
+                max_workers=current_app.config.get('PASSWORD_HASH_WORKERS', 2),
+                thread_name_prefix='password-hash'
+            )
+        return executor
+
+
+def reset_executor():
+    global executor
+    executor = None
+
+
+# Pool threads do not survive fork; pre-forked workers start a fresh pool
+os.register_at_fork(after_in_child=reset_executor)
+
+
+def hash_password(password):
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    return get_executor().submit(generate_password_hash, password, method).result()
+
+
+def verify_password(password_hash, password):
+    return get_executor().submit(check_password_hash, password_hash, password).result()
+
+
+@functools.lru_cache
+def method_prefix(method):
+    # Werkzeug expands short methods ("scrypt" is written as "scrypt:32768:8:1"),
+    # so take the prefix from a real hash, made once per method
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    # Hashes look like "<method>$<salt>$<hash>"; anything made with other
+    # parameters than the configured method is upgraded on next login
+    method = current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    return password_hash.split('$', 1)[0] != method_prefix(method)
@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import current_app
+from sqlalchemy import and_, bindparam, delete, func, or_, select, update
+from sqlalchemy.orm import aliased
+from .models import db, Contribution, ReconciliationCheckpoint, SavingsGroup, WithdrawalRequest
+from .cache import catalogue_changed
+from .ledger import balance_column, retry_on_conflict
+from .money import sum_cents
+import multiprocessing
+
+# Rows newer than this are counted but not checkpointed yet, so a slow
+# transaction that commits a lower id later is still picked up next run
+DEFAULT_SETTLE_SECONDS = 60
+
+
+def amount_sum(model, *where):
+    return select(func.coalesce(sum_cents(model.amount_cents), 0)).where(*where).scalar_subquery()
+
+
+def row_count(model, *where):
+    return select(func.count(model.id)).where(*where).scalar_subquery()
+
+
+@lru_cache(maxsize=None)
+def reconcile_statement():
+    # Built once with bind parameters; constructing it per group costs more
+    # than running it
+    group_id, last_contribution_id = bindparam('group_id'), bindparam('last_contribution_id')
+    last_withdrawal_id, settled_before = bindparam('last_withdrawal_id'), bindparam('settled_before')
+    new_contributions = and_(Contribution.group_id == group_id, Contribution.id > last_contribution_id)
+    new_withdrawals = and_(WithdrawalRequest.group_id == group_id, WithdrawalRequest.id > last_withdrawal_id)
+    approved = WithdrawalRequest.status == 'approved'
+
+    # The checkpoint can move up to the newest settled contribution, and up to
+    # (not past) the oldest withdrawal that is unsettled or still pending
+    contribution, withdrawal = aliased(Contribution), aliased(WithdrawalRequest)
+    settled_contribution = select(func.max(contribution.id)).where(
+        contribution.group_id == group_id, contribution.id > last_contribution_id,
+        contribution.created_at < settled_before
+    ).scalar_subquery()
+    open_withdrawal = select(func.min(withdrawal.id)).where(
+        withdrawal.group_id == group_id, withdrawal.id > last_withdrawal_id,
+        or_(withdrawal.status == 'pending', withdrawal.created_at >= settled_before)
+    ).scalar_subquery()
+    settled_withdrawal = select(func.max(WithdrawalRequest.id)).where(
+        new_withdrawals, or_(open_withdrawal.is_(None), WithdrawalRequest.id < open_withdrawal)
+    ).scalar_subquery()
+
+    # One statement, so the balance and the ledger come from the same snapshot
+    return select(
+        balance_column(),
+        amount_sum(Contribution, new_contributions),
+        amount_sum(WithdrawalRequest, new_withdrawals, approved),
+        row_count(Contribution, new_contributions) + row_count(WithdrawalRequest, new_withdrawals),
+        settled_contribution,
+        amount_sum(Contribution, new_contributions, Contribution.id <= settled_contribution),
+        settled_withdrawal,
+        amount_sum(WithdrawalRequest, new_withdrawals, approved, WithdrawalRequest.id <= settled_withdrawal)
+    ).where(SavingsGroup.id == group_id)
+
+
+@retry_on_conflict
+def reconcile_group(group_id, settled_before, repair=False):
+    # Compares the group balance with its ledger, reading only rows past the
+    # checkpoint. Returns {"group_id", "rows", "mismatch_cents", "repaired"}.
+    checkpoint = db.session.get(ReconciliationCheckpoint, group_id)
+    if checkpoint is None:
+        checkpoint = ReconciliationCheckpoint(
+            group_id=group_id, last_contribution_id=0, last_withdrawal_id=0,
+            contributed_cents=0, withdrawn_cents=0, mismatch_cents=0
+        )
+        db.session.add(checkpoint)
+
+    row = db.session.execute(reconcile_statement(), {
+        "group_id": group_id,
+        "last_contribution_id": checkpoint.last_contribution_id,
+        "last_withdrawal_id": checkpoint.last_withdrawal_id,
+        "settled_before": settled_before
+    }).one_or_none()
+    if row is None:
+        db.session.rollback()
+        return None
+    (balance, contributed, withdrawn, rows,
+     last_contribution_id, settled_contributed, last_withdrawal_id, settled_withdrawn) = row
+
+    expected = checkpoint.contributed_cents + contributed - checkpoint.withdrawn_cents - withdrawn
+    mismatch = balance - expected
+    repaired = False
+    if mismatch and repair:
+        # A delta keeps any contribution committed since the read
+        db.session.execute(
+            update(SavingsGroup)
+            .where(SavingsGroup.id == group_id)
+            .values(current_amount_cents=SavingsGroup.current_amount_cents - mismatch, version=SavingsGroup.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        catalogue_changed()
+        repaired = True
+
+    mismatch_left = 0 if repaired else mismatch
+    if last_contribution_id is None and last_withdrawal_id is None and mismatch_left == checkpoint.mismatch_cents \
+            and checkpoint.checked_at is not None:
+        # Nothing to record; skipping the commit saves a disk sync per idle group
+        db.session.rollback()
+        return {"group_id": group_id, "rows": rows, "mismatch_cents": mismatch, "repaired": repaired}
+    if last_contribution_id is not None:
+        checkpoint.last_contribution_id = last_contribution_id
+        checkpoint.contributed_cents += settled_contributed
+    if last_withdrawal_id is not None:
+        checkpoint.last_withdrawal_id = last_withdrawal_id
+        checkpoint.withdrawn_cents += settled_withdrawn
+    checkpoint.mismatch_cents = mismatch_left
+    checkpoint.checked_at = datetime.utcnow()
+    db.session.commit()
+    return {"group_id": group_id, "rows": rows, "mismatch_cents": mismatch, "repaired": repaired}
+
+
+def reset_checkpoints(group_ids=None):
+    # The next run re-reads these groups' whole ledgers
+    statement = delete(ReconciliationCheckpoint)
+    if group_ids is not None:
+        statement = statement.where(ReconciliationCheckpoint.group_id.in_(group_ids))
+    db.session.execute(statement)
+    db.session.commit()
+
+
+# The app a forked pool worker runs in, inherited from the parent
+worker_app = None
+
+
+def reconcile_chunk(task):
+    group_ids, settled_before, repair = task
+    with worker_app.app_context():
+        return [reconcile_group(group_id, settled_before, repair) for group_id in group_ids]
+
+
+def reconcile_groups(group_ids, repair=False, workers=1, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    # Yields one result per group (see reconcile_group), in completion order
+    global worker_app
+    settled_before = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    if workers <= 1:
+        for group_id in group_ids:
+            result = reconcile_group(group_id, settled_before, repair)
+            if result:
+                yield result
+        return
+
+    # Forked workers share the app; each opens its own connections
+    worker_app = current_app._get_current_object()
+    chunk_size = max(1, min(100, len(group_ids) // (workers * 4) or 1))
+    chunks = [group_ids[start:start + chunk_size] for start in range(0, len(group_ids), chunk_size)]
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        for results in pool.imap_unordered(reconcile_chunk, [(chunk, settled_before, repair) for chunk in chunks]):
+            for result in results:
+                if result:
+                    yield result
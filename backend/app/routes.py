@@ -1,14 +1,151 @@
-from flask import Blueprint, jsonify, request, current_app
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, abort, jsonify, request, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, create_access_token, create_refresh_token, get_jwt, get_jwt_identity
 from datetime import datetime
-from .models import db, User, SavingsGroup, GroupMember, Contribution, WithdrawalRequest
+from sqlalchemy import and_, func, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from urllib.parse import urlencode
+import base64
+import math
+import operator
+from .models import db, User, SavingsGroup, GroupMember, Contribution, WithdrawalRequest, MemberSummary
+from .cache import catalogue_cache, catalogue_changed, membership_cache
+from .passwords import hash_password, needs_rehash, verify_password
+from .bulk import BalanceChanged, ingest_contributions, process_withdrawal_batch
+from .money import from_cents, to_cents
+from .timestamps import parse_timestamp
+from .summaries import TIMESERIES_BUCKETS, record_contributions, record_withdrawals, timeseries
+from .snapshots import balance_as_of
+from .search import search_scores, search_terms, search_truncated
+from .events import emit_event, event_stream, withdrawal_decision
+from .budget import query_budget
+from .export import EXPORT_FORMATS, EXPORT_MIMETYPES, export_ledger, parse_date_range
+from .ledger import (
+    balance_column, credit_group, debit_group, read_balance, retry_on_conflict,
+    member_versions_column, touch_group, touch_user, version_column
+)
 
 
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+def members_count_column():
+    # Correlated COUNT(*) so list endpoints get members_count in the same query
+    return select(func.count(GroupMember.id)).where(
+        GroupMember.group_id == SavingsGroup.id
+    ).correlate(SavingsGroup).scalar_subquery().label('members_count')
+
+def not_modified(etag):
+    # 304 for a client that already holds this version, else None
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(token):
+    # Raises ValueError on a malformed token
+    created_at, row_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+    return parse_timestamp(created_at), int(row_id)
+
+def encode_rank_cursor(score, row_id):
+    # Ranked search pages; repr() round-trips the float exactly
+    raw = f"{score!r}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_rank_cursor(token):
+    score, row_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+    return float(score), int(row_id)
+
+def page_size_arg():
+    # Raises ValueError; type=int would quietly turn ?limit=abc into the default
+    limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+def keyset_page(query, model, cursor, limit):
+    # Newest first by (created_at, id); the row-value comparison lets the
+    # composite indexes seek straight to the cursor at any depth
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, last_id))
+    
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+def history_filters(query, model):
+    # Optional ?user_id=, ?from= and ?to= (ISO timestamps, UTC unless they
+    # carry an offset; `to` exclusive). Raises ValueError.
+    user_id = request.args.get('user_id')
+    if user_id is not None:
+        query = query.filter(model.user_id == int(user_id))
+    since = request.args.get('from')
+    if since:
+        query = query.filter(model.created_at >= parse_timestamp(since))
+    until = request.args.get('to')
+    if until:
+        query = query.filter(model.created_at < parse_timestamp(until))
+    return query
+
+def contribution_json(contribution):
+    return {
+        "id": contribution.id,
+        "amount": from_cents(contribution.amount_cents),
+        "user": {
+            "id": contribution.user.id,
+            "name": contribution.user.name,
+            "avatar": contribution.user.avatar
+        },
+        "created_at": contribution.created_at.isoformat()
+    }
+
+def withdrawal_json(withdrawal, as_of=None):
+    # With as_of, a request processed after that time is shown still pending
+    processed_at = withdrawal.processed_at
+    status = withdrawal.status
+    if as_of and (processed_at is None or processed_at > as_of):
+        processed_at, status = None, 'pending'
+    return {
+        "id": withdrawal.id,
+        "amount": from_cents(withdrawal.amount_cents),
+        "reason": withdrawal.reason,
+        "status": status,
+        "user": {
+            "id": withdrawal.user.id,
+            "name": withdrawal.user.name,
+            "avatar": withdrawal.user.avatar
+        },
+        "created_at": withdrawal.created_at.isoformat(),
+        "processed_at": processed_at.isoformat() if processed_at else None
+    }
+
+def create_user_refresh_token(user):
+    return create_refresh_token(
+        identity=str(user.id), additional_claims={"password_version": user.password_version}
+    )
+
 # Auth Routes
 @api_bp.route('/auth/register', methods=['POST'])
+@query_budget(3)
 def register():
     try:
         data = request.get_json()
@@ -19,7 +156,7 @@ def register():
             return jsonify({"error": "Email already registered"}), 409
         
         # Create new user
-        hashed_password = generate_password_hash(data['password'])
+        hashed_password = hash_password(data['password'])
         new_user = User(
             name=data['name'],
             email=data['email'],
@@ -30,8 +167,9 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         
-        # Generate access token
+        # Generate access and refresh tokens
         access_token = create_access_token(identity=str(new_user.id))
+        refresh_token = create_user_refresh_token(new_user)
         
         return jsonify({
             "message": "User registered successfully",
@@ -41,7 +179,8 @@ def register():
                 "email": new_user.email,
                 "avatar": new_user.avatar
             },
-            "token": access_token
+            "token": access_token,
+            "refresh_token": refresh_token
         }), 201
     except Exception as e:
         db.session.rollback()
@@ -49,14 +188,21 @@ def register():
         current_app.logger.error(f"Request data: {request.get_json()}")
         return jsonify({"error": "Registration failed", "details": str(e)}), 500
 @api_bp.route('/auth/login', methods=['POST'])
+@query_budget(2)
 def login():
     data = request.get_json()
     
     user = User.query.filter_by(email=data['email']).first()
-    if not user or not check_password_hash(user.password, data['password']):
+    if not user or not verify_password(user.password, data['password']):
         return jsonify({"error": "Invalid email or password"}), 401
     
+    # Upgrade hashes made with outdated parameters while we have the password
+    if needs_rehash(user.password):
+        user.password = hash_password(data['password'])
+        db.session.commit()
+    
     access_token = create_access_token(identity=str(user.id))
+    refresh_token = create_user_refresh_token(user)
     
     return jsonify({
         "message": "Login successful",
@@ -66,35 +212,69 @@ def login():
             "email": user.email,
             "avatar": user.avatar
         },
-        "token": access_token
+        "token": access_token,
+        "refresh_token": refresh_token
     }), 200
 
+@api_bp.route('/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+@query_budget(1)
+def refresh():
+    # Renew the access token without re-checking (and re-hashing) the password,
+    # unless the password has changed since the refresh token was issued.
+    # Tokens from before password versions existed count as version 0.
+    identity = get_jwt_identity()
+    password_version = db.session.execute(
+        select(User.password_version).where(User.id == int(identity))
+    ).scalar()
+    if password_version is None or password_version != get_jwt().get('password_version', 0):
+        return jsonify({"error": "Refresh token has been revoked"}), 401
+    access_token = create_access_token(identity=identity)
+    
+    return jsonify({"token": access_token}), 200
+
 # Group Routes
 @api_bp.route('/groups', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_groups():
     user_id = int(get_jwt_identity())
     
-    memberships = GroupMember.query.filter_by(user_id=user_id).all()
+    # The list changes only if the user's groups or one of those groups changes,
+    # and versions only grow, so their sum identifies the list contents
+    user_version, groups_count, groups_version = db.session.query(
+        User.version, func.count(SavingsGroup.id), func.coalesce(func.sum(version_column()), 0)
+    ).outerjoin(GroupMember, GroupMember.user_id == User.id).outerjoin(
+        SavingsGroup, SavingsGroup.id == GroupMember.group_id
+    ).filter(User.id == user_id).group_by(User.version).one()
+    etag = f"groups-{user_id}-{user_version}-{groups_count}-{groups_version}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    rows = db.session.query(GroupMember.is_admin, SavingsGroup, balance_column(), members_count_column()).join(
+        SavingsGroup, SavingsGroup.id == GroupMember.group_id
+    ).filter(GroupMember.user_id == user_id).all()
     groups = []
     
-    for membership in memberships:
-        group = membership.group
+    for is_admin, group, balance, members_count in rows:
         groups.append({
             "id": group.id,
             "name": group.name,
             "description": group.description,
-            "target_amount": group.target_amount,
-            "current_amount": group.current_amount,
+            "target_amount": from_cents(group.target_amount_cents),
+            "current_amount": from_cents(balance),
             "created_at": group.created_at.isoformat(),
-            "is_admin": membership.is_admin,
-            "members_count": len(group.members)
+            "is_admin": is_admin,
+            "members_count": members_count
         })
     
-    return jsonify({"groups": groups})
+    return with_etag(jsonify({"groups": groups}), etag)
 
 @api_bp.route('/groups', methods=['POST'])
 @jwt_required()
+@retry_on_conflict
+@query_budget(4)
 def create_group():
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -115,15 +295,15 @@ def create_group():
 
 
     try:
-        target_amount = float(target_amount)
-    except ValueError:
-        return jsonify({"error": "Target amount must be a number"}), 422
+        target_cents = to_cents(target_amount)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 422
     
 
     new_group = SavingsGroup(
         name=data['name'],
         description=data.get('description', ''),
-        target_amount=target_amount,
+        target_amount_cents=target_cents,
         created_by=user_id
     )
     
@@ -138,7 +318,10 @@ def create_group():
     )
     
     db.session.add(member)
+    touch_user(user_id)
+    catalogue_changed()
     db.session.commit()
+    membership_cache.invalidate(user_id)
     
     return jsonify({
         "message": "Group created successfully",
@@ -146,27 +329,58 @@ def create_group():
             "id": new_group.id,
             "name": new_group.name,
             "description": new_group.description,
-            "target_amount": new_group.target_amount,
-            "current_amount": new_group.current_amount,
+            "target_amount": from_cents(new_group.target_amount_cents),
+            "current_amount": from_cents(new_group.current_amount_cents),
             "created_at": new_group.created_at.isoformat()
         }
     }), 201
 
 @api_bp.route('/groups/<int:group_id>', methods=['GET'])
 @jwt_required()
+@query_budget(7)
 def get_group(group_id):
     user_id = get_jwt_identity()
     
     # Check if user is a member of the group
-    membership = GroupMember.query.filter_by(user_id=user_id, group_id=group_id).first()
-    if not membership:
+    is_admin = membership_cache.lookup(user_id, group_id)
+    if is_admin is None:
         return jsonify({"error": "Not authorized to view this group"}), 403
     
-    group = SavingsGroup.query.get_or_404(group_id)
+    # ?as_of= shows the group as it was at that time
+    as_of = request.args.get('as_of')
+    if as_of:
+        try:
+            as_of = parse_timestamp(as_of)
+        except ValueError:
+            return jsonify({"error": "Invalid as_of date"}), 400
+    
+    # Answer revalidations from the versions alone, before loading anything else.
+    # Member versions cover profile edits, which do not touch the group.
+    versions = db.session.execute(
+        select(version_column(), member_versions_column()).where(SavingsGroup.id == group_id)
+    ).one_or_none()
+    if versions is None:
+        abort(404)
+    version, member_versions = versions
+    etag = f"group-{group_id}-{version}-{member_versions}-{int(is_admin)}" + (f"-{as_of.isoformat()}" if as_of else "")
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    # Get members
+    # Members and their users arrive in one extra SELECT instead of one per member
+    group, balance = db.session.query(SavingsGroup, balance_column()).options(
+        selectinload(SavingsGroup.members).joinedload(GroupMember.user)
+    ).filter(SavingsGroup.id == group_id).first_or_404()
+    if as_of:
+        # Nearest snapshot plus the ledger rows after it
+        balance = balance_as_of(group_id, as_of)
+    
+    # Get members; as_of leaves out those who joined later (members never
+    # leave), but names, avatars and admin flags are today's
     members = []
     for member in group.members:
+        if as_of and member.joined_at > as_of:
+            continue
         members.append({
             "id": member.user.id,
             "name": member.user.name,
@@ -178,58 +392,233 @@ def get_group(group_id):
     
     # Get recent contributions
     contributions = []
-    for contribution in Contribution.query.filter_by(group_id=group_id).order_by(Contribution.created_at.desc()).limit(5).all():
-        contributions.append({
-            "id": contribution.id,
-            "amount": contribution.amount,
-            "user": {
-                "id": contribution.user.id,
-                "name": contribution.user.name,
-                "avatar": contribution.user.avatar
-            },
-            "created_at": contribution.created_at.isoformat()
-        })
+    recent_contributions = Contribution.query.options(joinedload(Contribution.user)).filter_by(group_id=group_id)
+    if as_of:
+        recent_contributions = recent_contributions.filter(Contribution.created_at <= as_of)
+    for contribution in recent_contributions.order_by(Contribution.created_at.desc(), Contribution.id.desc()).limit(5).all():
+        contributions.append(contribution_json(contribution))
     
     # Get recent withdrawal requests
     withdrawals = []
-    for withdrawal in WithdrawalRequest.query.filter_by(group_id=group_id).order_by(WithdrawalRequest.created_at.desc()).limit(5).all():
-        withdrawals.append({
-            "id": withdrawal.id,
-            "amount": withdrawal.amount,
-            "reason": withdrawal.reason,
-            "status": withdrawal.status,
-            "user": {
-                "id": withdrawal.user.id,
-                "name": withdrawal.user.name,
-                "avatar": withdrawal.user.avatar
-            },
-            "created_at": withdrawal.created_at.isoformat(),
-            "processed_at": withdrawal.processed_at.isoformat() if withdrawal.processed_at else None
-        })
+    recent_withdrawals = WithdrawalRequest.query.options(joinedload(WithdrawalRequest.user)).filter_by(group_id=group_id)
+    if as_of:
+        recent_withdrawals = recent_withdrawals.filter(WithdrawalRequest.created_at <= as_of)
+    for withdrawal in recent_withdrawals.order_by(WithdrawalRequest.created_at.desc(), WithdrawalRequest.id.desc()).limit(5).all():
+        withdrawals.append(withdrawal_json(withdrawal, as_of))
     
-    return jsonify({
+    return with_etag(jsonify({
         "group": {
             "id": group.id,
             "name": group.name,
             "description": group.description,
-            "target_amount": group.target_amount,
-            "current_amount": group.current_amount,
+            "target_amount": from_cents(group.target_amount_cents),
+            "current_amount": from_cents(balance),
             "created_at": group.created_at.isoformat(),
             "members": members,
             "contributions": contributions,
             "withdrawals": withdrawals,
-            "is_admin": membership.is_admin
+            "is_admin": is_admin,
+            "as_of": as_of.isoformat() if as_of else None
         }
+    }), etag)
+
+@api_bp.route('/groups/<int:group_id>/contributions', methods=['GET'])
+@jwt_required()
+@query_budget(2)
+def list_contributions(group_id):
+    user_id = get_jwt_identity()
+    
+    if membership_cache.lookup(user_id, group_id) is None:
+        return jsonify({"error": "Not authorized to view this group"}), 403
+    
+    query = Contribution.query.options(joinedload(Contribution.user)).filter(Contribution.group_id == group_id)
+    try:
+        limit = page_size_arg()
+        query = history_filters(query, Contribution)
+        rows, next_cursor = keyset_page(query, Contribution, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid limit, cursor or filter"}), 400
+    
+    return jsonify({
+        "contributions": [contribution_json(contribution) for contribution in rows],
+        "next_cursor": next_cursor
     })
 
+@api_bp.route('/groups/<int:group_id>/withdrawals', methods=['GET'])
+@jwt_required()
+@query_budget(2)
+def list_withdrawals(group_id):
+    user_id = get_jwt_identity()
+    
+    if membership_cache.lookup(user_id, group_id) is None:
+        return jsonify({"error": "Not authorized to view this group"}), 403
+    
+    status = request.args.get('status')
+    if status is not None and status not in ('pending', 'approved', 'rejected'):
+        return jsonify({"error": "status must be pending, approved or rejected"}), 400
+    
+    query = WithdrawalRequest.query.options(joinedload(WithdrawalRequest.user)).filter(WithdrawalRequest.group_id == group_id)
+    if status is not None:
+        query = query.filter(WithdrawalRequest.status == status)
+    try:
+        limit = page_size_arg()
+        query = history_filters(query, WithdrawalRequest)
+        rows, next_cursor = keyset_page(query, WithdrawalRequest, request.args.get('cursor'), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid limit, cursor or filter"}), 400
+    
+    return jsonify({
+        "withdrawals": [withdrawal_json(withdrawal) for withdrawal in rows],
+        "next_cursor": next_cursor
+    })
+
+def member_stats_json(user, summary):
+    # summary is None for a member with no activity yet
+    return {
+        "user": {
+            "id": user.id,
+            "name": user.name,
+            "avatar": user.avatar
+        },
+        "contributed": from_cents(summary.contributed_cents if summary else 0),
+        "contributions_count": summary.contributions_count if summary else 0,
+        "withdrawn": from_cents(summary.withdrawn_cents if summary else 0),
+        "withdrawals_count": summary.withdrawals_count if summary else 0,
+        "last_activity_at": summary.last_activity_at.isoformat() if summary and summary.last_activity_at else None
+    }
+
+@api_bp.route('/groups/<int:group_id>/stats', methods=['GET'])
+@jwt_required()
+@query_budget(4)
+def get_group_stats(group_id):
+    user_id = get_jwt_identity()
+    
+    if membership_cache.lookup(user_id, group_id) is None:
+        return jsonify({"error": "Not authorized to view this group"}), 403
+    
+    top = request.args.get('top', 10, type=int)
+    if top is None or top <= 0:
+        return jsonify({"error": "top must be a positive integer"}), 400
+    top = min(top, MAX_PAGE_SIZE)
+    
+    # Summaries move with every ledger write, and so does the group version;
+    # member versions cover the names and avatars shown next to them
+    versions = db.session.execute(
+        select(version_column(), member_versions_column()).where(SavingsGroup.id == group_id)
+    ).one_or_none()
+    if versions is None:
+        abort(404)
+    version, member_versions = versions
+    etag = f"stats-{group_id}-{version}-{member_versions}-{top}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Leaderboard straight off the (group_id, contributed_cents) index
+    leaders = db.session.query(User, MemberSummary).join(
+        MemberSummary, MemberSummary.user_id == User.id
+    ).filter(MemberSummary.group_id == group_id).order_by(
+        MemberSummary.contributed_cents.desc(), MemberSummary.user_id
+    ).limit(top).all()
+    
+    # Every member, including those with no activity yet
+    members = db.session.query(User, MemberSummary).join(
+        GroupMember, GroupMember.user_id == User.id
+    ).outerjoin(MemberSummary, and_(
+        MemberSummary.group_id == GroupMember.group_id, MemberSummary.user_id == GroupMember.user_id
+    )).filter(GroupMember.group_id == group_id).order_by(User.id).all()
+    
+    summaries = [summary for _, summary in members if summary]
+    return with_etag(jsonify({
+        "group_id": group_id,
+        "totals": {
+            "contributed": from_cents(sum(summary.contributed_cents for summary in summaries)),
+            "contributions_count": sum(summary.contributions_count for summary in summaries),
+            "withdrawn": from_cents(sum(summary.withdrawn_cents for summary in summaries)),
+            "withdrawals_count": sum(summary.withdrawals_count for summary in summaries)
+        },
+        "top_contributors": [member_stats_json(user, summary) for user, summary in leaders],
+        "members": [member_stats_json(user, summary) for user, summary in members]
+    }), etag)
+
+@api_bp.route('/groups/<int:group_id>/timeseries', methods=['GET'])
+@jwt_required()
+@query_budget(3)
+def get_group_timeseries(group_id):
+    user_id = get_jwt_identity()
+    
+    if membership_cache.lookup(user_id, group_id) is None:
+        return jsonify({"error": "Not authorized to view this group"}), 403
+    
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in TIMESERIES_BUCKETS:
+        return jsonify({"error": "bucket must be day, week or month"}), 400
+    try:
+        since, until = parse_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Invalid from or to date"}), 400
+    
+    version = db.session.execute(
+        select(version_column()).where(SavingsGroup.id == group_id)
+    ).scalar_one_or_none()
+    if version is None:
+        abort(404)
+    etag = f"timeseries-{group_id}-{version}-{bucket}-{since}-{until}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    # Answered from the daily rollups, never from the ledger itself
+    series = timeseries(group_id, bucket, since and since.date(), until and until.date())
+    return with_etag(jsonify({
+        "group_id": group_id,
+        "bucket": bucket,
+        "series": [{
+            "start": point["start"].isoformat(),
+            "contributed": from_cents(point["contributed_cents"]),
+            "contributions_count": point["contributions_count"],
+            "withdrawn": from_cents(point["withdrawn_cents"]),
+            "withdrawals_count": point["withdrawals_count"]
+        } for point in series]
+    }), etag)
+
+@api_bp.route('/groups/<int:group_id>/export', methods=['GET'])
+@jwt_required()
+@query_budget(2)
+def export_group_ledger(group_id):
+    user_id = get_jwt_identity()
+    
+    if membership_cache.lookup(user_id, group_id, admin=True) is None:
+        return jsonify({"error": "Only group admins can export the ledger"}), 403
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    try:
+        since, until = parse_date_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Invalid from or to date"}), 400
+    
+    # Rows are streamed as they are read; the request context (and its
+    # session) stays open until the last chunk is sent
+    filename = f"group-{group_id}-ledger.{export_format}" + ('.gz' if compress else '')
+    response = current_app.response_class(
+        stream_with_context(export_ledger(group_id, export_format, compress, since, until)),
+        mimetype='application/gzip' if compress else EXPORT_MIMETYPES[export_format]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @api_bp.route('/groups/<int:group_id>/join', methods=['POST'])
 @jwt_required()
+@retry_on_conflict
+@query_budget(8)
 def join_group(group_id):
     user_id = get_jwt_identity()
     
     # Check if user is already a member
-    existing_membership = GroupMember.query.filter_by(user_id=user_id, group_id=group_id).first()
-    if existing_membership:
+    if membership_cache.lookup(user_id, group_id) is not None:
         return jsonify({"error": "Already a member of this group"}), 400
     
     # Check if group exists
@@ -243,7 +632,17 @@ def join_group(group_id):
     )
     
     db.session.add(member)
-    db.session.commit()
+    touch_group(group_id)
+    touch_user(user_id)
+    catalogue_changed()
+    emit_event(group_id, 'member_joined', {"user_id": int(user_id)})
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent join won the race on the unique (user_id, group_id) index
+        db.session.rollback()
+        return jsonify({"error": "Already a member of this group"}), 400
+    membership_cache.invalidate(user_id)
     
     return jsonify({
         "message": "Successfully joined the group",
@@ -255,81 +654,144 @@ def join_group(group_id):
 
 @api_bp.route('/groups/<int:group_id>/contribute', methods=['POST'])
 @jwt_required()
+@retry_on_conflict
+@query_budget(8)
 def contribute(group_id):
     user_id = get_jwt_identity()
     data = request.get_json()
     
     # Check if user is a member of the group
-    membership = GroupMember.query.filter_by(user_id=user_id, group_id=group_id).first()
-    if not membership:
+    membership = membership_cache.membership(user_id, group_id)
+    if membership is None:
         return jsonify({"error": "Not a member of this group"}), 403
     
-    amount = float(data['amount'])
-    if amount <= 0:
+    try:
+        cents = to_cents(data['amount'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if cents <= 0:
         return jsonify({"error": "Contribution amount must be greater than zero"}), 400
     
     # Create contribution
     contribution = Contribution(
-        amount=amount,
+        amount_cents=cents,
         user_id=user_id,
-        group_id=group_id
+        group_id=group_id,
+        created_at=datetime.utcnow()
     )
     
-    # Update group's current amount
-    group = SavingsGroup.query.get(group_id)
-    group.current_amount += amount
+    # Update group's current amount in a single UPDATE so concurrent
+    # contributions cannot overwrite each other
+    current_cents = credit_group(group_id, cents, striped=membership[1] > 0)
+    record_contributions([{
+        "group_id": group_id, "user_id": user_id, "amount_cents": cents, "created_at": contribution.created_at
+    }])
     
     db.session.add(contribution)
+    db.session.flush()
+    emit_event(group_id, 'contribution', {
+        "contribution": {
+            "id": contribution.id,
+            "user_id": int(user_id),
+            "amount": from_cents(cents),
+            "created_at": contribution.created_at.isoformat()
+        },
+        "current_amount": from_cents(current_cents)
+    })
     db.session.commit()
     
     return jsonify({
         "message": "Contribution successful",
         "contribution": {
             "id": contribution.id,
-            "amount": contribution.amount,
+            "amount": from_cents(contribution.amount_cents),
             "created_at": contribution.created_at.isoformat()
         },
         "group": {
-            "id": group.id,
-            "current_amount": group.current_amount
+            "id": group_id,
+            "current_amount": from_cents(current_cents)
         }
     }), 201
 
+@api_bp.route('/contributions/batch', methods=['POST'])
+@jwt_required()
+# The membership check and one chunk (BULK_CHUNK_SIZE rows); every further
+# chunk adds bulk.CHUNK_BUDGET
+@query_budget(7)
+def contribute_batch():
+    user_id = int(get_jwt_identity())
+    
+    # NDJSON bodies are read line by line; anything else must be a JSON array
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        records = (line for line in request.stream if line.strip())
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({"error": "Expected a JSON array or NDJSON body"}), 400
+    
+    chunk_size = request.args.get('chunk_size', type=int)
+    if chunk_size is not None and chunk_size <= 0:
+        return jsonify({"error": "chunk_size must be a positive integer"}), 400
+    
+    inserted, errors = ingest_contributions(records, actor_id=user_id, chunk_size=chunk_size)
+    
+    return jsonify({
+        "message": "Batch processed",
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": errors
+    }), 200
+
 @api_bp.route('/groups/<int:group_id>/withdraw', methods=['POST'])
 @jwt_required()
+@retry_on_conflict
+@query_budget(6)
 def request_withdrawal(group_id):
     user_id = get_jwt_identity()
     data = request.get_json()
     
     # Check if user is a member of the group
-    membership = GroupMember.query.filter_by(user_id=user_id, group_id=group_id).first()
-    if not membership:
+    membership = membership_cache.membership(user_id, group_id)
+    if membership is None:
         return jsonify({"error": "Not a member of this group"}), 403
     
-    amount = float(data['amount'])
-    if amount <= 0:
+    try:
+        cents = to_cents(data['amount'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if cents <= 0:
         return jsonify({"error": "Withdrawal amount must be greater than zero"}), 400
     
-    group = SavingsGroup.query.get(group_id)
-    if amount > group.current_amount:
+    if cents > read_balance(group_id):
         return jsonify({"error": "Withdrawal amount exceeds group's current amount"}), 400
     
     # Create withdrawal request
     withdrawal = WithdrawalRequest(
-        amount=amount,
+        amount_cents=cents,
         reason=data.get('reason', ''),
         user_id=user_id,
         group_id=group_id
     )
     
     db.session.add(withdrawal)
+    touch_group(group_id)
+    db.session.flush()
+    emit_event(group_id, 'withdrawal_requested', {
+        "withdrawal": {
+            "id": withdrawal.id,
+            "user_id": int(user_id),
+            "amount": from_cents(cents),
+            "reason": withdrawal.reason,
+            "created_at": withdrawal.created_at.isoformat()
+        }
+    })
     db.session.commit()
     
     return jsonify({
         "message": "Withdrawal request submitted",
         "withdrawal": {
             "id": withdrawal.id,
-            "amount": withdrawal.amount,
+            "amount": from_cents(withdrawal.amount_cents),
             "reason": withdrawal.reason,
             "status": withdrawal.status,
             "created_at": withdrawal.created_at.isoformat()
@@ -338,6 +800,8 @@ def request_withdrawal(group_id):
 
 @api_bp.route('/withdrawals/<int:withdrawal_id>/process', methods=['POST'])
 @jwt_required()
+@retry_on_conflict
+@query_budget(10)
 def process_withdrawal(withdrawal_id):
     user_id = get_jwt_identity()
     data = request.get_json()
@@ -345,65 +809,236 @@ def process_withdrawal(withdrawal_id):
     withdrawal = WithdrawalRequest.query.get_or_404(withdrawal_id)
     
     # Check if user is an admin of the group
-    membership = GroupMember.query.filter_by(user_id=user_id, group_id=withdrawal.group_id, is_admin=True).first()
-    if not membership:
+    if not membership_cache.lookup(user_id, withdrawal.group_id, admin=True):
         return jsonify({"error": "Not authorized to process withdrawals"}), 403
     
     status = data['status']  # 'approved' or 'rejected'
     if status not in ['approved', 'rejected']:
         return jsonify({"error": "Invalid status value"}), 400
     
-    withdrawal.status = status
-    withdrawal.processed_at = datetime.utcnow()
-    withdrawal.processed_by = user_id
+    # Only a pending request can be processed, and only once
+    processed_at = datetime.utcnow()
+    claimed = db.session.execute(
+        update(WithdrawalRequest)
+        .where(WithdrawalRequest.id == withdrawal_id, WithdrawalRequest.status == 'pending')
+        .values(status=status, processed_at=processed_at, processed_by=user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return jsonify({"error": "Withdrawal request already processed"}), 409
     
-    # If approved, update group's current amount
+    # If approved, debit the group only if the balance still covers it
+    current_cents = None
     if status == 'approved':
-        group = SavingsGroup.query.get(withdrawal.group_id)
-        group.current_amount -= withdrawal.amount
+        current_cents = debit_group(withdrawal.group_id, withdrawal.amount_cents)
+        if current_cents is None:
+            db.session.rollback()
+            return jsonify({"error": "Withdrawal amount exceeds group's current amount"}), 400
+        record_withdrawals([{
+            "group_id": withdrawal.group_id, "user_id": withdrawal.user_id,
+            "amount_cents": withdrawal.amount_cents, "processed_at": processed_at
+        }])
+    if status == 'rejected':
+        touch_group(withdrawal.group_id)
+    emit_event(withdrawal.group_id, 'withdrawal_processed', withdrawal_decision(
+        withdrawal, status, processed_at, user_id, current_cents
+    ))
     
     db.session.commit()
     
     return jsonify({
         "message": f"Withdrawal request {status}",
         "withdrawal": {
-            "id": withdrawal.id,
-            "status": withdrawal.status,
-            "processed_at": withdrawal.processed_at.isoformat()
+            "id": withdrawal_id,
+            "status": status,
+            "processed_at": processed_at.isoformat()
         }
     }), 200
 
-@api_bp.route('/discover', methods=['GET'])
+@api_bp.route('/withdrawals/process', methods=['POST'])
 @jwt_required()
-def discover_groups():
-    user_id = get_jwt_identity()
+@query_budget(12)
+def process_withdrawals():
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    
+    decisions = data.get('withdrawals')
+    if not isinstance(decisions, list):
+        return jsonify({"error": "withdrawals must be a list of {id, status}"}), 400
     
-    # Get groups the user is not a member of
-    user_groups = [m.group_id for m in GroupMember.query.filter_by(user_id=user_id).all()]
+    try:
+        results = process_withdrawal_batch(decisions, user_id)
+    except BalanceChanged:
+        return jsonify({"error": "Group balance changed while processing, please retry"}), 409
+    
+    return jsonify({
+        "message": "Withdrawal requests processed",
+        "results": results
+    }), 200
+
+DISCOVER_ARGS = ('q', 'min_target', 'max_target', 'min_fill', 'max_fill')
+
+def discover_filters():
+    # Optional ?min_target= and ?max_target= (amounts) and ?min_fill= and
+    # ?max_fill= (balance over target, 0.5 = half way) as SQL conditions.
+    # Raises ValueError.
+    conditions = []
+    for arg, compare in (('min_target', operator.ge), ('max_target', operator.le)):
+        value = request.args.get(arg)
+        if value is not None:
+            conditions.append(compare(SavingsGroup.target_amount_cents, to_cents(value)))
+    for arg, compare in (('min_fill', operator.ge), ('max_fill', operator.le)):
+        value = request.args.get(arg)
+        if value is not None:
+            ratio = float(value)
+            if not math.isfinite(ratio):
+                raise ValueError(f"{arg} must be a number")
+            # Multiplied out rather than divided, so a zero target is harmless
+            conditions.append(compare(balance_column(), SavingsGroup.target_amount_cents * ratio))
+    return conditions
+
+def load_catalogue_page(cursor, limit, terms=None, conditions=()):
+    # One page of the group catalogue, as cached by catalogue_cache: newest
+    # first, or best match first when searching for terms. Searches also say
+    # whether matches beyond MAX_RANKED_MATCHES were left out.
+    query = db.session.query(SavingsGroup, balance_column(), members_count_column())
+    if terms:
+        scores = search_scores(terms, conditions)
+        query = query.add_columns(scores.c.score).join(scores, scores.c.id == SavingsGroup.id)
+        if cursor:
+            score, last_id = decode_rank_cursor(cursor)
+            query = query.filter(or_(
+                scores.c.score < score,
+                and_(scores.c.score == score, SavingsGroup.id < last_id)
+            ))
+        query = query.order_by(scores.c.score.desc(), SavingsGroup.id.desc())
+    else:
+        query = query.filter(*conditions)
+        if cursor:
+            created_at, last_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                SavingsGroup.created_at < created_at,
+                and_(SavingsGroup.created_at == created_at, SavingsGroup.id < last_id)
+            ))
+        query = query.order_by(SavingsGroup.created_at.desc(), SavingsGroup.id.desc())
     
-    groups = SavingsGroup.query.filter(~SavingsGroup.id.in_(user_groups) if user_groups else True).all()
+    # Fetch one extra row to know whether another page exists
+    groups = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(groups) > limit:
+        groups = groups[:limit]
+        last = groups[-1]
+        if terms:
+            next_cursor = encode_rank_cursor(last[3], last[0].id)
+        else:
+            next_cursor = encode_cursor(last[0].created_at, last[0].id)
     
     results = []
-    for group in groups:
+    for group, balance, members_count, *_ in groups:
         results.append({
             "id": group.id,
             "name": group.name,
             "description": group.description,
-            "target_amount": group.target_amount,
-            "current_amount": group.current_amount,
+            "target_amount": from_cents(group.target_amount_cents),
+            "current_amount": from_cents(balance),
             "created_at": group.created_at.isoformat(),
-            "members_count": len(group.members)
+            "members_count": members_count
         })
     
-    return jsonify({"groups": results})
+    page = {"groups": results, "next_cursor": next_cursor}
+    if terms:
+        page["truncated"] = search_truncated(terms, conditions)
+    return page
+
+@api_bp.route('/discover', methods=['GET'])
+@jwt_required()
+@query_budget(3)
+def discover_groups():
+    user_id = get_jwt_identity()
+    
+    terms = None
+    q = request.args.get('q')
+    if q is not None:
+        terms = search_terms(q)
+        if not terms:
+            return jsonify({"error": "Search query must contain a letter or digit"}), 400
+    
+    try:
+        limit = page_size_arg()
+        cursor = request.args.get('cursor')
+        if cursor and terms:
+            decode_rank_cursor(cursor)
+        elif cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+    try:
+        conditions = discover_filters()
+    except ValueError:
+        return jsonify({"error": "Invalid target or fill filter"}), 400
+    
+    # Pages are shared by all users; the caller's own groups are removed
+    # afterwards, so a page can hold fewer than `limit` groups
+    params = urlencode([(arg, request.args[arg]) for arg in DISCOVER_ARGS if arg in request.args])
+    page = catalogue_cache.page(
+        cursor, limit, lambda cursor, limit: load_catalogue_page(cursor, limit, terms, conditions), params
+    )
+    user_groups = membership_cache.groups(user_id)
+    results = [group for group in page["groups"] if group["id"] not in user_groups]
+    
+    response = {"groups": results, "next_cursor": page["next_cursor"]}
+    if terms:
+        response["truncated"] = page.get("truncated", False)
+    return jsonify(response)
+
+@api_bp.route('/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+@query_budget(1)
+def stream_events():
+    # Server-sent events for all of the user's groups. EventSource cannot set
+    # headers, so the token may also be passed as ?jwt=; ?last_event_id=
+    # stands in for the Last-Event-ID header on a first connection.
+    user_id = int(get_jwt_identity())
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+    
+    group_ids = membership_cache.groups(user_id)
+    db.session.close()
+    response = current_app.response_class(
+        stream_with_context(event_stream(user_id, group_ids, last_event_id, get_jwt()['exp'])),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+@query_budget(0)
+def cache_stats():
+    return jsonify({
+        "membership": membership_cache.stats(),
+        "discover": catalogue_cache.stats()
+    })
 
 @api_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@query_budget(1)
 def get_profile():
     user_id = get_jwt_identity()
     user = User.query.get_or_404(user_id)
     
-    return jsonify({
+    etag = f"profile-{user.id}-{user.version}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    return with_etag(jsonify({
         "user": {
             "id": user.id,
             "name": user.name,
@@ -411,14 +1046,23 @@ def get_profile():
             "avatar": user.avatar,
             "created_at": user.created_at.isoformat()
         }
-    })
+    }), etag)
 
 @api_bp.route('/profile', methods=['PUT'])
 @jwt_required()
+@query_budget(4)
 def update_profile():
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
     data = request.get_json()
+    # Hash before the write transaction: under the SQLite profile that holds
+    # the process-wide write lock, and every other writer would wait on the KDF
+    new_password = data.get('password')
+    password_hash = hash_password(new_password) if new_password else None
+    return save_profile(get_jwt_identity(), data, password_hash)
+
+@retry_on_conflict
+@query_budget(4)
+def save_profile(user_id, data, password_hash):
+    user = User.query.get_or_404(user_id)
     
     user.name = data.get('name', user.name)
     
@@ -431,18 +1075,19 @@ def update_profile():
         user.email = new_email
     
     # Update password if provided
-    new_password = data.get('password')
-    if new_password:
-        user.password = generate_password_hash(new_password)
+    if password_hash:
+        user.password = password_hash
+        user.password_version += 1
     
     # Update avatar if provided
     new_avatar = data.get('avatar')
     if new_avatar:
         user.avatar = new_avatar
     
+    user.version += 1
     db.session.commit()
     
-    return jsonify({
+    response = {
         "message": "Profile updated successfully",
         "user": {
             "id": user.id,
@@ -450,7 +1095,11 @@ def update_profile():
             "email": user.email,
             "avatar": user.avatar
         }
-    })
+    }
+    # The caller's old refresh token no longer works after a password change
+    if password_hash:
+        response["refresh_token"] = create_user_refresh_token(user)
+    return jsonify(response)
 
 
 
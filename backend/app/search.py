@@ -0,0 +1,51 @@
+from sqlalchemy import column, func, select, table
+from .models import db, SavingsGroup, search_document, SEARCH_CONFIG
+import re
+
+# The SQLite FTS5 index over savings_group (see models.py)
+group_fts = table('savings_group_fts', column('rowid'), column('savings_group_fts'))
+# bm25 column weights: a match in the name counts ten times one in the description
+FTS_WEIGHTS = (10.0, 1.0)
+# Only the newest matches are ranked, so a word found in half the catalogue
+# costs about as much as a rare one
+MAX_RANKED_MATCHES = 10000
+
+
+def search_terms(q):
+    # Words of a ?q= string. Only letters and digits reach the full-text
+    # engines, so no input can be a query syntax error.
+    return re.findall(r'\w+', q.lower())
+
+
+def search_matches(terms, conditions=()):
+    # (query of matching groups with an id and a score, column ordering the newest first)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        query = select(
+            group_fts.c.rowid.label('id'),
+            (-func.bm25(group_fts.c.savings_group_fts, *FTS_WEIGHTS)).label('score')
+        ).where(group_fts.c.savings_group_fts.match(' '.join(f'"{term}"' for term in terms)))
+        if conditions:
+            query = query.join_from(group_fts, SavingsGroup, SavingsGroup.id == group_fts.c.rowid).where(*conditions)
+        return query, group_fts.c.rowid
+    tsquery = func.to_tsquery(SEARCH_CONFIG, ' & '.join(terms))
+    document = search_document(SavingsGroup.name, SavingsGroup.description)
+    query = select(
+        SavingsGroup.id, func.ts_rank(document, tsquery).label('score')
+    ).where(document.op('@@')(tsquery), *conditions)
+    return query, SavingsGroup.id
+
+
+def search_scores(terms, conditions=()):
+    # Subquery of (id, score) for the newest MAX_RANKED_MATCHES groups that
+    # contain every term and meet the conditions; higher scores rank first
+    query, newest = search_matches(terms, conditions)
+    return query.order_by(newest.desc()).limit(MAX_RANKED_MATCHES).subquery()
+
+
+def search_truncated(terms, conditions=()):
+    # Whether more groups match than were ranked; reads no further than one
+    # match past MAX_RANKED_MATCHES
+    query, newest = search_matches(terms, conditions)
+    return db.session.execute(
+        query.with_only_columns(newest).order_by(newest.desc()).offset(MAX_RANKED_MATCHES).limit(1)
+    ).first() is not None
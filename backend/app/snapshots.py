@@ -0,0 +1,82 @@
+from datetime import datetime
+from sqlalchemy import DateTime, and_, delete, func, literal, or_, select
+from sqlalchemy.orm import aliased
+from .models import db, BalanceSnapshot, Contribution, SavingsGroup, WithdrawalRequest
+from .money import sum_cents
+
+
+def ledger_totals_as_of(group_id, as_of):
+    # (contributed, withdrawn) cents of a group up to and including as_of,
+    # as correlated scalar subqueries: the nearest earlier snapshot plus the
+    # rows after it, so the rows read are bounded by the snapshot spacing
+    snapshot = aliased(BalanceSnapshot)
+    base_taken_at = select(func.max(snapshot.taken_at)).where(
+        snapshot.group_id == group_id, snapshot.taken_at <= as_of
+    ).scalar_subquery()
+    # A plain lower bound (not "IS NULL OR >") keeps the ledger scans ranged
+    replay_after = func.coalesce(base_taken_at, literal(datetime.min, DateTime))
+    base = aliased(BalanceSnapshot)
+
+    def base_total(column):
+        return func.coalesce(
+            select(getattr(base, column)).where(base.group_id == group_id, base.taken_at == base_taken_at).scalar_subquery(),
+            0
+        )
+
+    replayed_contributions = select(func.coalesce(sum_cents(Contribution.amount_cents), 0)).where(
+        Contribution.group_id == group_id, Contribution.created_at <= as_of,
+        Contribution.created_at > replay_after
+    ).scalar_subquery()
+    # A withdrawal moves the balance when it is approved, not when requested
+    replayed_withdrawals = select(func.coalesce(sum_cents(WithdrawalRequest.amount_cents), 0)).where(
+        WithdrawalRequest.group_id == group_id, WithdrawalRequest.status == 'approved',
+        WithdrawalRequest.processed_at <= as_of,
+        WithdrawalRequest.processed_at > replay_after
+    ).scalar_subquery()
+    return (
+        base_total('contributed_cents') + replayed_contributions,
+        base_total('withdrawn_cents') + replayed_withdrawals
+    )
+
+
+def balance_as_of(group_id, as_of):
+    # Ledger balance in cents at as_of, or None if the group does not exist
+    contributed, withdrawn = ledger_totals_as_of(group_id, as_of)
+    return db.session.execute(
+        select((contributed - withdrawn).label('balance_cents')).where(SavingsGroup.id == group_id)
+    ).scalar_one_or_none()
+
+
+def take_snapshots(taken_at, group_ids=None):
+    # Records every group's (or the given groups') totals as of taken_at in
+    # one INSERT ... SELECT, each built from that group's previous snapshot.
+    # Returns the number of snapshots written.
+    contributed, withdrawn = ledger_totals_as_of(SavingsGroup.id, taken_at)
+    groups = select(SavingsGroup.id, literal(taken_at, DateTime), contributed, withdrawn).where(
+        or_(SavingsGroup.created_at.is_(None), SavingsGroup.created_at <= taken_at)
+    )
+    stale = delete(BalanceSnapshot).where(BalanceSnapshot.taken_at == taken_at)
+    if group_ids is not None:
+        groups = groups.where(SavingsGroup.id.in_(group_ids))
+        stale = stale.where(BalanceSnapshot.group_id.in_(group_ids))
+    db.session.execute(stale)
+    return db.session.execute(
+        BalanceSnapshot.__table__.insert().from_select(
+            ['group_id', 'taken_at', 'contributed_cents', 'withdrawn_cents'], groups
+        )
+    ).rowcount
+
+
+def invalidate_snapshots(rows):
+    # Back-dated contributions (bulk imports) change totals that later
+    # snapshots already hold; drop those snapshots in the same transaction
+    earliest = {}
+    for row in rows:
+        group_id = row['group_id']
+        if group_id not in earliest or row['created_at'] < earliest[group_id]:
+            earliest[group_id] = row['created_at']
+    if earliest:
+        db.session.execute(delete(BalanceSnapshot).where(or_(*(
+            and_(BalanceSnapshot.group_id == group_id, BalanceSnapshot.taken_at >= created_at)
+            for group_id, created_at in sorted(earliest.items())
+        ))))
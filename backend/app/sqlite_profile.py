@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+import threading
+
+# Serialises write transactions within one process; other processes wait on
+# SQLite's busy_timeout instead of failing with "database is locked"
+write_lock = threading.RLock()
+
+
+def apply_sqlite_profile(app, engine):
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': app.config['SQLITE_MMAP_SIZE'],
+        'cache_size': app.config['SQLITE_CACHE_SIZE'],
+        'foreign_keys': 'ON',
+    }
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy (below) decide how each transaction begins
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        # Write transactions take the write lock up front, so they queue on
+        # busy_timeout rather than failing when a read lock can't be upgraded
+        immediate = has_app_context() and g.get('sqlite_write')
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+
+@contextmanager
+def serialized_writes():
+    # Used around write transactions when the SQLite profile is enabled
+    if not current_app.config.get('SQLITE_PROFILE'):
+        yield
+        return
+    with write_lock:
+        previous = g.get('sqlite_write', False)
+        g.sqlite_write = True
+        try:
+            yield
+        finally:
+            g.sqlite_write = previous
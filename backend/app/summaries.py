@@ -0,0 +1,173 @@
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import case, delete, func, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import db, Contribution, GroupDailyRollup, MemberSummary, SavingsGroup, WithdrawalRequest
+from .money import sum_cents
+
+# Both supported databases have INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+# Counters shared by member_summary and group_daily_rollup
+TOTAL_COLUMNS = ('contributed_cents', 'contributions_count', 'withdrawn_cents', 'withdrawals_count')
+TIMESERIES_BUCKETS = ('day', 'week', 'month')
+
+
+def add_totals(model, key_columns, deltas, extra=None):
+    # deltas: {key tuple: {counter: increment, ...}}. One upsert for all keys;
+    # counters are incremented in the database so concurrent writers never
+    # overwrite each other.
+    if not deltas:
+        return
+    insert = UPSERT_DIALECTS[db.session.get_bind().dialect.name]
+    rows = [
+        {**dict(zip(key_columns, key)), **dict.fromkeys(TOTAL_COLUMNS, 0), **delta}
+        for key, delta in sorted(deltas.items())
+    ]
+    statement = insert(model).values(rows)
+    new = statement.excluded
+    set_ = {column: getattr(model, column) + getattr(new, column) for column in TOTAL_COLUMNS}
+    set_.update(extra(new) if extra else {})
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[getattr(model, column) for column in key_columns], set_=set_
+    ).execution_options(synchronize_session=False))
+
+
+def latest_activity(new):
+    return {
+        "last_activity_at": case(
+            (MemberSummary.last_activity_at.is_(None), new.last_activity_at),
+            (new.last_activity_at > MemberSummary.last_activity_at, new.last_activity_at),
+            else_=MemberSummary.last_activity_at
+        )
+    }
+
+
+def record_activity(rows, amount_column, count_column, at_column):
+    members = defaultdict(lambda: {amount_column: 0, count_column: 0, "last_activity_at": None})
+    days = defaultdict(lambda: {amount_column: 0, count_column: 0})
+    for row in rows:
+        at = row[at_column]
+        member = members[(row['group_id'], int(row['user_id']))]
+        day = days[(row['group_id'], at.date())]
+        for delta in (member, day):
+            delta[amount_column] += row['amount_cents']
+            delta[count_column] += 1
+        if member["last_activity_at"] is None or at > member["last_activity_at"]:
+            member["last_activity_at"] = at
+    add_totals(MemberSummary, ('group_id', 'user_id'), members, latest_activity)
+    add_totals(GroupDailyRollup, ('group_id', 'day'), days)
+
+
+def record_contributions(rows):
+    # rows: dicts with group_id, user_id, amount_cents and created_at
+    record_activity(rows, 'contributed_cents', 'contributions_count', 'created_at')
+
+
+def record_withdrawals(rows):
+    # rows: dicts with group_id, user_id, amount_cents and processed_at, for
+    # approved requests; they count on the day the money left the group
+    record_activity(rows, 'withdrawn_cents', 'withdrawals_count', 'processed_at')
+
+
+def ledger_totals(group_id, key):
+    # Per-key ledger totals as a SELECT of (group_id, key, *TOTAL_COLUMNS,
+    # last activity); key maps a ledger model and its timestamp to a column
+    contributions = select(
+        Contribution.group_id, key(Contribution, Contribution.created_at).label('key'),
+        sum_cents(Contribution.amount_cents).label('contributed_cents'),
+        func.count().label('contributions_count'),
+        literal(0).label('withdrawn_cents'), literal(0).label('withdrawals_count'),
+        func.max(Contribution.created_at).label('last_activity_at')
+    ).group_by(Contribution.group_id, key(Contribution, Contribution.created_at))
+    withdrawals = select(
+        WithdrawalRequest.group_id, key(WithdrawalRequest, WithdrawalRequest.processed_at),
+        literal(0), literal(0),
+        sum_cents(WithdrawalRequest.amount_cents), func.count(),
+        func.max(WithdrawalRequest.processed_at)
+    ).where(WithdrawalRequest.status == 'approved').group_by(
+        WithdrawalRequest.group_id, key(WithdrawalRequest, WithdrawalRequest.processed_at)
+    )
+    if group_id is not None:
+        contributions = contributions.where(Contribution.group_id == group_id)
+        withdrawals = withdrawals.where(WithdrawalRequest.group_id == group_id)
+
+    ledger = union_all(contributions, withdrawals).subquery()
+    return select(
+        ledger.c.group_id, ledger.c.key,
+        *(func.sum(ledger.c[column]) for column in TOTAL_COLUMNS),
+        func.max(ledger.c.last_activity_at)
+    ).group_by(ledger.c.group_id, ledger.c.key)
+
+
+def rebuild_table(model, group_id, columns, totals):
+    stale = delete(model)
+    # New versions so cached responses are not served after a repair
+    versions = update(SavingsGroup).values(version=SavingsGroup.version + 1)
+    if group_id is not None:
+        stale = stale.where(model.group_id == group_id)
+        versions = versions.where(SavingsGroup.id == group_id)
+    db.session.execute(stale)
+    written = db.session.execute(model.__table__.insert().from_select(columns, totals)).rowcount
+    db.session.execute(versions.execution_options(synchronize_session=False))
+    return written
+
+
+def rebuild_summaries(group_id=None):
+    # Recomputes the member summaries of one group (or all) from the ledger
+    # with a single INSERT ... SELECT; returns the number of rows written.
+    # Writes that commit while this runs may be missed, so pause them first.
+    totals = ledger_totals(group_id, lambda model, at: model.user_id)
+    return rebuild_table(
+        MemberSummary, group_id, ['group_id', 'user_id', *TOTAL_COLUMNS, 'last_activity_at'], totals
+    )
+
+
+def rebuild_rollups(group_id=None):
+    # Same as rebuild_summaries, for the daily rollups
+    totals = ledger_totals(group_id, lambda model, at: func.date(at))
+    totals = totals.with_only_columns(*totals.selected_columns[:-1])
+    return rebuild_table(GroupDailyRollup, group_id, ['group_id', 'day', *TOTAL_COLUMNS], totals)
+
+
+def bucket_start(day, bucket):
+    # Weeks start on Monday
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def timeseries(group_id, bucket='day', since=None, until=None):
+    # Group totals per day, week or month from the daily rollups, oldest
+    # first, with empty buckets between the first and last one filled in
+    query = select(GroupDailyRollup.day, *(getattr(GroupDailyRollup, column) for column in TOTAL_COLUMNS)).where(
+        GroupDailyRollup.group_id == group_id
+    )
+    if since is not None:
+        query = query.where(GroupDailyRollup.day >= since)
+    if until is not None:
+        query = query.where(GroupDailyRollup.day < until)
+    totals = {}
+    for day, *values in db.session.execute(query.order_by(GroupDailyRollup.day)):
+        start = bucket_start(day, bucket)
+        current = totals.setdefault(start, [0] * len(TOTAL_COLUMNS))
+        for index, value in enumerate(values):
+            current[index] += value
+    if not totals:
+        return []
+    
+    series = []
+    start, last = min(totals), max(totals)
+    while start <= last:
+        series.append({"start": start, **dict(zip(TOTAL_COLUMNS, totals.get(start, [0] * len(TOTAL_COLUMNS))))})
+        start = next_bucket(start, bucket)
+    return series
@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+
+
+def parse_timestamp(value):
+    # Parses an API timestamp (ISO 8601) into the naive UTC datetimes the
+    # database stores. An offset ("Z", "+02:00") is converted to UTC; a
+    # timestamp without one is taken as UTC already. Raises ValueError.
+    if not isinstance(value, str):
+        raise ValueError("Timestamp must be an ISO 8601 string")
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
@@ -0,0 +1,78 @@
+# /api/discover?q= over a large catalogue, against a LIKE scan of names and
+# descriptions, for rare words, common words and two-word queries:
+#
+#     uv run python -m bench.group_search [--groups 1000000]
+#
+# Uses DATABASE_URL or a temporary SQLite file.
+from datetime import datetime, timedelta
+from sqlalchemy import insert, or_, select
+from app.models import db, SavingsGroup
+from app.routes import load_catalogue_page
+from app.search import search_terms
+from .helpers import bench_app, dispose, register, timed
+import argparse
+import random
+import statistics
+
+COMMON_WORDS = ['savings', 'holiday', 'fund', 'family', 'trip', 'car', 'house', 'wedding', 'school', 'club']
+BATCH = 10_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--groups', type=int, default=1_000_000)
+    args = parser.parse_args()
+    app = bench_app()
+    try:
+        client = app.test_client()
+        admin_id, admin_headers = register(client, 'Admin')
+        rng = random.Random(22)
+        words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9))) for _ in range(20000)]
+
+        def text(count):
+            return ' '.join(rng.choice(COMMON_WORDS) if rng.random() < 0.3 else rng.choice(words) for _ in range(count))
+
+        start = datetime(2024, 1, 1)
+        with app.app_context():
+            def load():
+                for offset in range(0, args.groups, BATCH):
+                    rows = []
+                    for index in range(offset, min(offset + BATCH, args.groups)):
+                        target = rng.randint(1, 1000) * 10000
+                        rows.append({
+                            "name": text(2).title(), "description": text(12), "target_amount_cents": target,
+                            "current_amount_cents": rng.randint(0, target), "created_at": start + timedelta(seconds=index * 30),
+                            "created_by": admin_id
+                        })
+                    db.session.execute(insert(SavingsGroup), rows)
+                db.session.commit()
+            seconds, _ = timed(load)
+            print(f"loaded {args.groups} groups in {seconds:.0f}s", flush=True)
+
+            cases = {
+                'rare word': rng.sample(words, 20),
+                'common word': ['holiday', 'savings', 'trip', 'family', 'club'],
+                'two words': [f"{rng.choice(COMMON_WORDS)} {rng.choice(words)}" for _ in range(20)],
+            }
+            for label, queries in cases.items():
+                indexed, scanned = [], []
+                for query in queries:
+                    indexed.append(timed(load_catalogue_page, None, 20, search_terms(query))[0])
+                    like = f"%{query}%"
+                    scanned.append(timed(lambda: db.session.execute(
+                        select(SavingsGroup.id).where(or_(SavingsGroup.name.ilike(like), SavingsGroup.description.ilike(like)))
+                        .order_by(SavingsGroup.created_at.desc(), SavingsGroup.id.desc()).limit(20)
+                    ).all())[0])
+                print(f"{label:>11}: search median {statistics.median(indexed) * 1000:7.2f} ms, max {max(indexed) * 1000:7.2f} ms"
+                      f" | LIKE median {statistics.median(scanned) * 1000:8.2f} ms", flush=True)
+
+        for query in ('holiday', 'holiday&max_fill=0.1'):
+            seconds, response = timed(client.get, f'/api/discover?q={query}', headers=admin_headers)
+            print(f"GET /api/discover?q={query}: {response.status_code}, {len(response.json['groups'])} groups,"
+                  f" truncated: {response.json.get('truncated')}, {seconds * 1000:.1f} ms", flush=True)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
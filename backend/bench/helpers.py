@@ -0,0 +1,76 @@
+from datetime import datetime
+from sqlalchemy import text, update
+from app import create_app
+from app.models import db, SavingsGroup
+import os
+import tempfile
+import time
+import uuid
+
+# Where fill_ledger starts; its SQL spells the same date
+LEDGER_START = datetime(2022, 1, 1)
+
+
+def bench_app():
+    # The app on DATABASE_URL, or on a new SQLite file when it is not set
+    if not os.environ.get('DATABASE_URL'):
+        directory = tempfile.mkdtemp(prefix='savingcircle-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ.setdefault('METRICS_BACKEND', 'memory')
+    return create_app()
+
+
+def register(client, name='Member'):
+    # A new user's id and auth headers; emails are unique so benchmarks can share a database
+    response = client.post('/api/auth/register', json={
+        "name": name, "email": f"{uuid.uuid4().hex}@bench.invalid", "password": "bench-password"
+    })
+    assert response.status_code == 201, response.json
+    return response.json['user']['id'], {"Authorization": f"Bearer {response.json['token']}"}
+
+
+def create_group(client, admin_headers, members=(), **fields):
+    response = client.post('/api/groups', headers=admin_headers, json={"name": "Bench", "target_amount": 1000, **fields})
+    assert response.status_code == 201, response.json
+    group_id = response.json['group']['id']
+    for headers in members:
+        assert client.post(f'/api/groups/{group_id}/join', headers=headers).status_code == 200
+    return group_id
+
+
+def timed(function, *args, **kwargs):
+    # (seconds, result) of one call
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def dispose(app):
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def fill_ledger(app, group_id, user_id, contributions, withdrawals=0, spacing_seconds=1):
+    # Bulk-loads contributions and approved withdrawals in SQL, spaced
+    # `spacing_seconds` apart from 2022-01-01, and backdates the group to
+    # before them; bypasses balances and summaries
+    with app.app_context():
+        db.session.execute(update(SavingsGroup).where(SavingsGroup.id == group_id).values(created_at=LEDGER_START))
+        if db.engine.dialect.name == 'sqlite':
+            at = "datetime('2022-01-01', '+' || (i * :spacing) || ' seconds') || '.000000'"
+        else:
+            at = "TIMESTAMP '2022-01-01' + i * :spacing * INTERVAL '1 second'"
+        numbers = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) "
+        params = {"group_id": group_id, "user_id": user_id}
+        db.session.execute(text(
+            numbers + "INSERT INTO contribution (amount_cents, user_id, group_id, created_at) "
+            f"SELECT i % 1000 + 1, :user_id, :group_id, {at} FROM n"
+        ), {**params, "rows": contributions, "spacing": spacing_seconds})
+        if withdrawals:
+            spacing = spacing_seconds * contributions // withdrawals
+            db.session.execute(text(
+                numbers + "INSERT INTO withdrawal_request (amount_cents, user_id, group_id, status, created_at, processed_at) "
+                f"SELECT 5, :user_id, :group_id, 'approved', {at}, {at} FROM n"
+            ), {**params, "rows": withdrawals, "spacing": spacing})
+        db.session.commit()
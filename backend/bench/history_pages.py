@@ -0,0 +1,62 @@
+# Contribution history pages: page 1 against page 10,000 of a group with
+# millions of ledger rows, next to the OFFSET query the cursor replaced:
+#
+#     uv run python -m bench.history_pages [--contributions 2000000]
+#
+# Uses DATABASE_URL or a temporary SQLite file.
+from sqlalchemy import select
+from app.models import db, Contribution
+from app.routes import DEFAULT_PAGE_SIZE, encode_cursor
+from .helpers import bench_app, create_group, dispose, fill_ledger, register, timed
+import argparse
+import statistics
+
+PAGES = (1, 10, 100, 1000, 10_000)
+SAMPLES = 20
+
+
+def offset_page(group_id, page):
+    return db.session.execute(
+        select(Contribution.id).where(Contribution.group_id == group_id)
+        .order_by(Contribution.created_at.desc(), Contribution.id.desc())
+        .offset((page - 1) * DEFAULT_PAGE_SIZE).limit(DEFAULT_PAGE_SIZE)
+    ).scalars().all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contributions', type=int, default=2_000_000)
+    args = parser.parse_args()
+    app = bench_app()
+    try:
+        client = app.test_client()
+        admin_id, admin_headers = register(client, 'Admin')
+        group_id = create_group(client, admin_headers)
+        seconds, _ = timed(fill_ledger, app, group_id, admin_id, args.contributions)
+        print(f"loaded {args.contributions} contributions in {seconds:.0f}s", flush=True)
+        url = f'/api/groups/{group_id}/contributions'
+        for page in PAGES:
+            with app.app_context():
+                # The cursor page `page` is fetched with: the last row of the page before it
+                params = ''
+                if page > 1:
+                    before = db.session.execute(
+                        select(Contribution.created_at, Contribution.id).where(Contribution.group_id == group_id)
+                        .order_by(Contribution.created_at.desc(), Contribution.id.desc())
+                        .offset((page - 1) * DEFAULT_PAGE_SIZE - 1).limit(1)
+                    ).one()
+                    params = f'?cursor={encode_cursor(*before)}'
+                offset_seconds, expected = timed(offset_page, group_id, page)
+            latencies = []
+            for _ in range(SAMPLES):
+                seconds, response = timed(client.get, url + params, headers=admin_headers)
+                latencies.append(seconds)
+            correct = [row['id'] for row in response.json['contributions']] == expected
+            print(f"page {page}: cursor median {statistics.median(latencies) * 1000:.2f} ms,"
+                  f" OFFSET {offset_seconds * 1000:.1f} ms, correct: {correct}", flush=True)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
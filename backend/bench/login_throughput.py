@@ -0,0 +1,115 @@
+# Login throughput and latency with concurrent clients, per password hash
+# method and hash pool size:
+#
+#     uv run python -m bench.login_throughput [--logins 200] [--clients 1,8,32]
+#
+# Also checks that no login rewrites the stored hash. With --url it logs in
+# against a running server instead (e.g. `gunicorn run:app`, whose hash
+# method and pool come from its environment), and times a cheap request made
+# alongside, which stalls when a worker is stuck in a KDF.
+from concurrent.futures import ThreadPoolExecutor
+from app.models import db, User
+from app.passwords import reset_executor
+from .helpers import bench_app, dispose, register, timed
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+
+METHODS = ('scrypt', 'pbkdf2:sha256')
+
+
+def run(app, method, workers, clients, logins):
+    app.config['PASSWORD_HASH_METHOD'] = method
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    reset_executor()
+    client = app.test_client()
+    user_id = register(client)[0]
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        stored, email = user.password, user.email
+
+    def login(_):
+        started = time.perf_counter()
+        status = app.test_client().post('/api/auth/login', json={"email": email, "password": "bench-password"}).status_code
+        return status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(clients) as pool:
+        seconds, results = timed(lambda: list(pool.map(login, range(logins))))
+    latencies = sorted(latency for _, latency in results)
+    with app.app_context():
+        rehashed = db.session.get(User, user_id).password != stored
+    print(f"{method:>14}, {workers} hash workers, {clients:>2} clients: {logins / seconds:7.1f} logins/s,"
+          f" median {statistics.median(latencies) * 1000:6.1f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms"
+          f" ({sum(status != 200 for status, _ in results)} failed, rehashed: {rehashed})", flush=True)
+
+
+def call(url, path, body=None, headers=None):
+    request = urllib.request.Request(
+        url + path, data=json.dumps(body).encode() if body is not None else None,
+        headers={"Content-Type": "application/json", **(headers or {})}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def run_http(url, clients, logins):
+    email = f"{uuid.uuid4().hex}@bench.invalid"
+    status, body = call(url, '/api/auth/register', {"name": "Member", "email": email, "password": "bench-password"})
+    assert status == 201, status
+    headers = {"Authorization": f"Bearer {body['token']}"}
+
+    def login(_):
+        started = time.perf_counter()
+        status = call(url, '/api/auth/login', {"email": email, "password": "bench-password"})[0]
+        return status, time.perf_counter() - started
+
+    probes, done = [], threading.Event()
+
+    def probe():
+        while not done.is_set():
+            probes.append(timed(call, url, '/api/groups', headers=headers)[0])
+            time.sleep(0.02)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    with ThreadPoolExecutor(clients) as pool:
+        seconds, results = timed(lambda: list(pool.map(login, range(logins))))
+    done.set()
+    prober.join()
+    latencies = sorted(latency for _, latency in results)
+    print(f"{clients:>2} clients: {logins / seconds:7.1f} logins/s, median {statistics.median(latencies) * 1000:6.1f} ms,"
+          f" p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms ({sum(status != 200 for status, _ in results)} failed);"
+          f" GET /api/groups meanwhile: median {statistics.median(probes) * 1000:5.1f} ms, max {max(probes) * 1000:6.1f} ms",
+          flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', default='1,8,32')
+    parser.add_argument('--hash-workers', default='1,2,4')
+    parser.add_argument('--url', help='a running server, e.g. http://127.0.0.1:8000')
+    args = parser.parse_args()
+    if args.url:
+        for clients in map(int, args.clients.split(',')):
+            run_http(args.url.rstrip('/'), clients, args.logins)
+        return
+    app = bench_app()
+    try:
+        for method in METHODS:
+            for workers in map(int, args.hash_workers.split(',')):
+                for clients in map(int, args.clients.split(',')):
+                    run(app, method, workers, clients, args.logins)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Point-in-time balances (?as_of=) with no snapshots and with snapshots
+# every week, day and hour, on a group with two years of ledger rows:
+#
+#     uv run python -m bench.point_in_time [--contributions 1000000]
+#
+# Uses DATABASE_URL or a temporary SQLite file.
+from datetime import timedelta
+from sqlalchemy import delete, func, select
+from app.models import db, BalanceSnapshot, Contribution, WithdrawalRequest
+from app.snapshots import balance_as_of
+from .helpers import LEDGER_START, bench_app, create_group, dispose, fill_ledger, register, timed
+import argparse
+import random
+import statistics
+
+SPAN_SECONDS = 2 * 365 * 86400
+SAMPLES = 30
+
+
+def ledger_balance(group_id, as_of):
+    # The answer read straight off the whole ledger
+    contributed = db.session.execute(select(func.coalesce(func.sum(Contribution.amount_cents), 0)).where(
+        Contribution.group_id == group_id, Contribution.created_at <= as_of
+    )).scalar()
+    withdrawn = db.session.execute(select(func.coalesce(func.sum(WithdrawalRequest.amount_cents), 0)).where(
+        WithdrawalRequest.group_id == group_id, WithdrawalRequest.status == 'approved', WithdrawalRequest.processed_at <= as_of
+    )).scalar()
+    return contributed - withdrawn
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contributions', type=int, default=1_000_000)
+    args = parser.parse_args()
+    app = bench_app()
+    try:
+        client = app.test_client()
+        admin_id, admin_headers = register(client, 'Admin')
+        group_id = create_group(client, admin_headers)
+        fill_ledger(app, group_id, admin_id, args.contributions, args.contributions // 10, max(1, SPAN_SECONDS // args.contributions))
+        rng = random.Random(21)
+        times = [LEDGER_START + timedelta(seconds=rng.randint(0, SPAN_SECONDS)) for _ in range(SAMPLES)]
+        with app.app_context():
+            seconds, truth = timed(lambda: [ledger_balance(group_id, as_of) for as_of in times])
+        print(f"full ledger sums: {seconds / SAMPLES * 1000:.1f} ms per balance", flush=True)
+
+        runner = app.test_cli_runner()
+        end = (LEDGER_START + timedelta(seconds=SPAN_SECONDS)).isoformat()
+        for hours in (None, 168, 24, 1):
+            with app.app_context():
+                db.session.execute(delete(BalanceSnapshot))
+                db.session.commit()
+            label = 'no snapshots'
+            if hours:
+                seconds, result = timed(runner.invoke, args=['snapshot-balances', '--backfill-hours', str(hours), '--at', end])
+                label = f"snapshots every {hours}h ({result.output.strip()} in {seconds:.0f}s)"
+            with app.app_context():
+                latencies, correct = [], True
+                for as_of, expected in zip(times, truth):
+                    seconds, balance = timed(balance_as_of, group_id, as_of)
+                    latencies.append(seconds)
+                    correct &= balance == expected
+            seconds, response = timed(client.get, f'/api/groups/{group_id}?as_of={times[0].isoformat()}', headers=admin_headers)
+            correct &= round(response.json['group']['current_amount'] * 100) == truth[0]
+            print(f"{label}: median {statistics.median(latencies) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms,"
+                  f" API {seconds * 1000:.1f} ms, correct: {correct}", flush=True)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# /timeseries served from the daily rollups against a GROUP BY over the
+# ledger itself, for a group with years of contributions:
+#
+#     uv run python -m bench.rollups [--contributions 10000000]
+#
+# Uses DATABASE_URL or a temporary SQLite file.
+from sqlalchemy import func, select
+from app.models import db, Contribution
+from app.summaries import rebuild_rollups
+from .helpers import bench_app, create_group, dispose, fill_ledger, register, timed
+import argparse
+import statistics
+
+# About three years of contributions at the default size
+SPAN_SECONDS = 3 * 365 * 86400
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contributions', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    app = bench_app()
+    try:
+        client = app.test_client()
+        admin_id, admin_headers = register(client, 'Admin')
+        group_id = create_group(client, admin_headers)
+        seconds, _ = timed(fill_ledger, app, group_id, admin_id, args.contributions, 0, max(1, SPAN_SECONDS // args.contributions))
+        print(f"loaded {args.contributions} contributions in {seconds:.0f}s", flush=True)
+        with app.app_context():
+            seconds, rows = timed(rebuild_rollups, group_id)
+            db.session.commit()
+        print(f"backfilled {rows} daily rollups in {seconds:.1f}s", flush=True)
+
+        day = func.date(Contribution.created_at)
+        naive = select(day, func.sum(Contribution.amount_cents), func.count()).where(
+            Contribution.group_id == group_id
+        ).group_by(day).order_by(day)
+        with app.app_context():
+            seconds, rows = timed(lambda: db.session.execute(naive).all())
+        print(f"GROUP BY day over the ledger: {seconds * 1000:.0f} ms, {len(rows)} days", flush=True)
+
+        for bucket in ('day', 'week', 'month'):
+            latencies = []
+            for _ in range(args.repeat):
+                seconds, response = timed(client.get, f'/api/groups/{group_id}/timeseries?bucket={bucket}', headers=admin_headers)
+                assert response.status_code == 200
+                latencies.append(seconds)
+            series = response.json['series']
+            print(f"/timeseries?bucket={bucket}: median {statistics.median(latencies) * 1000:.1f} ms, {len(series)} buckets", flush=True)
+        total = sum(round(point['contributed'] * 100) for point in series)
+        print(f"rollups match the ledger: {total == sum(row[1] for row in rows)}")
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
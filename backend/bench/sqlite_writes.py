@@ -0,0 +1,58 @@
+# Contribution latency under the SQLite production profile while other
+# clients change their passwords, which runs a KDF per request:
+#
+#     uv run python -m bench.sqlite_writes [--contributions 1000] [--password-changes 50]
+#
+# Always uses a temporary SQLite file.
+from concurrent.futures import ThreadPoolExecutor
+from .helpers import bench_app, create_group, dispose, register, timed
+import argparse
+import os
+import statistics
+import time
+
+WRITERS = 8
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contributions', type=int, default=1000)
+    parser.add_argument('--password-changes', type=int, default=50)
+    args = parser.parse_args()
+    os.environ.pop('DATABASE_URL', None)
+    os.environ['SQLITE_PROFILE'] = 'production'
+    app = bench_app()
+    try:
+        client = app.test_client()
+        admin_headers = register(client, 'Admin')[1]
+        members = [register(client)[1] for _ in range(WRITERS)]
+        group_id = create_group(client, admin_headers, members)
+
+        def contribute(index):
+            started = time.perf_counter()
+            status = app.test_client().post(
+                f'/api/groups/{group_id}/contribute', headers=members[index % WRITERS], json={"amount": 1}
+            ).status_code
+            return status, time.perf_counter() - started
+
+        def change_password(index):
+            return app.test_client().put(
+                '/api/profile', headers=members[index % WRITERS], json={"password": f"bench-password-{index}"}
+            ).status_code
+
+        for label, changes in (('alone', 0), (f'with {args.password_changes} password changes', args.password_changes)):
+            with ThreadPoolExecutor(WRITERS) as pool, ThreadPoolExecutor(2) as password_pool:
+                profile_updates = [password_pool.submit(change_password, index) for index in range(changes)]
+                seconds, results = timed(lambda: list(pool.map(contribute, range(args.contributions))))
+                profile_statuses = [future.result() for future in profile_updates]
+            latencies = sorted(latency for _, latency in results)
+            failed = sum(status != 201 for status, _ in results) + sum(status != 200 for status in profile_statuses)
+            print(f"contributions {label}: {args.contributions / seconds:7.1f}/s,"
+                  f" median {statistics.median(latencies) * 1000:6.1f} ms,"
+                  f" p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms ({failed} failed)", flush=True)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
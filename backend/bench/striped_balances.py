@@ -0,0 +1,55 @@
+# Contribution throughput into one group at 1, 8 and 32 concurrent writers,
+# with the single balance row and with striped balances:
+#
+#     uv run python -m bench.striped_balances [--contributions 2000] [--stripes 8]
+#
+# Uses DATABASE_URL (e.g. a PostgreSQL server, where striping matters) or a
+# temporary SQLite file.
+from concurrent.futures import ThreadPoolExecutor
+from app.ledger import read_balance, set_balance_stripes
+from app.models import db
+from .helpers import bench_app, create_group, dispose, register, timed
+import argparse
+
+WRITERS = (1, 8, 32)
+
+
+def run(app, writers, contributions, stripes):
+    client = app.test_client()
+    admin_headers = register(client, 'Admin')[1]
+    members = [register(client)[1] for _ in range(writers)]
+    group_id = create_group(client, admin_headers, members)
+    with app.app_context():
+        set_balance_stripes(group_id, stripes)
+        db.session.commit()
+
+    def contribute(index):
+        return app.test_client().post(
+            f'/api/groups/{group_id}/contribute', headers=members[index % writers], json={"amount": 1}
+        ).status_code
+
+    with ThreadPoolExecutor(writers) as pool:
+        seconds, statuses = timed(lambda: list(pool.map(contribute, range(contributions))))
+    with app.app_context():
+        exact = read_balance(group_id) == statuses.count(201) * 100
+    failed = len(statuses) - statuses.count(201)
+    print(f"{writers:>3} writers, {stripes:>2} stripes: {contributions / seconds:8.1f} contributions/s"
+          f" ({failed} failed, balance exact: {exact})", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contributions', type=int, default=2000)
+    parser.add_argument('--stripes', type=int, default=8)
+    args = parser.parse_args()
+    app = bench_app()
+    try:
+        for writers in WRITERS:
+            for stripes in (0, args.stripes):
+                run(app, writers, args.contributions, stripes)
+    finally:
+        dispose(app)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# Production settings for `gunicorn run:app`, read from this directory.
+# /api/events keeps a connection open per client, so workers are gevent
+# workers: an open stream is a greenlet, not one of a few sync workers.
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# Exported so the app (forked from here) knows it has company, see DISCOVER_CACHE_BACKEND
+workers = int(os.environ.setdefault('WEB_CONCURRENCY', '4'))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 5000))
+# Each worker starts its own event poller and password-hash pool
+preload_app = False
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole worker while it waits on the server unless
+    # it waits through gevent instead
+    import psycopg2
+    from psycopg2 import extensions
+    from gevent.socket import wait_read, wait_write
+
+    def wait(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+    extensions.set_wait_callback(wait)
@@ -0,0 +1,55 @@
+"""store money as integer cents
+
+Revision ID: 5ed34ecc7863
+Revises: 2534ac4d546f
+Create Date: 2026-10-17 20:50:56.558352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5ed34ecc7863'
+down_revision = '2534ac4d546f'
+branch_labels = None
+depends_on = None
+
+
+# (table, float column, cents column, float column nullable, cents server default)
+MONEY_COLUMNS = [
+    ('savings_group', 'target_amount', 'target_amount_cents', False, None),
+    ('savings_group', 'current_amount', 'current_amount_cents', True, '0'),
+    ('group_balance_stripe', 'amount', 'amount_cents', False, None),
+    ('contribution', 'amount', 'amount_cents', False, None),
+    ('withdrawal_request', 'amount', 'amount_cents', False, None),
+]
+
+
+def upgrade():
+    for table, float_column, cents_column, _, server_default in MONEY_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(cents_column, sa.BigInteger(), nullable=True, server_default=server_default))
+
+        # Round every stored float to the nearest cent once; sums are exact from here on
+        op.execute(
+            f"UPDATE {table} SET {cents_column} = CAST(ROUND(COALESCE({float_column}, 0) * 100) AS BIGINT)"
+        )
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(cents_column, existing_type=sa.BigInteger(), nullable=False,
+                                  existing_server_default=server_default)
+            batch_op.drop_column(float_column)
+
+
+def downgrade():
+    for table, float_column, cents_column, nullable, server_default in reversed(MONEY_COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(float_column, sa.Float(), nullable=True))
+
+        op.execute(f"UPDATE {table} SET {float_column} = {cents_column} / 100.0")
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            if not nullable:
+                batch_op.alter_column(float_column, existing_type=sa.Float(), nullable=False)
+            batch_op.drop_column(cents_column)
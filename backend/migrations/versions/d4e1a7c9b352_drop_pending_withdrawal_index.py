@@ -0,0 +1,28 @@
+"""drop pending withdrawal index
+
+Revision ID: d4e1a7c9b352
+Revises: c8f2d6a1e395
+Create Date: 2026-10-18 14:05:37.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e1a7c9b352'
+down_revision = 'c8f2d6a1e395'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The pending listing is served by ix_withdrawal_request_group_id_status_created_at_id;
+    # this index was only written, never read
+    with op.batch_alter_table('withdrawal_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_withdrawal_request_pending', sqlite_where=sa.text("status = 'pending'"), postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    with op.batch_alter_table('withdrawal_request', schema=None) as batch_op:
+        batch_op.create_index('ix_withdrawal_request_pending', ['group_id', 'created_at'], unique=False, sqlite_where=sa.text("status = 'pending'"), postgresql_where=sa.text("status = 'pending'"))
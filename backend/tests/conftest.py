@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from app import create_app
+from app.models import db
+import itertools
+import os
+import pytest
+
+# Sent by the SQLite profile when a transaction starts
+TRANSACTION_STATEMENTS = {'BEGIN', 'BEGIN IMMEDIATE'}
+
+emails = itertools.count(1)
+
+
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database_url(request, tmp_path):
+    # Every test runs on SQLite, and on PostgreSQL too when TEST_POSTGRES_URL
+    # points at a database the tests may wipe
+    # (e.g. postgresql+psycopg2://postgres@localhost/savingcircle_test)
+    if request.param == 'sqlite':
+        yield f"sqlite:///{tmp_path / 'savingcircle.db'}"
+        return
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    reset_schema(url)
+    yield url
+    reset_schema(url)
+
+
+def reset_schema(url):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    engine.dispose()
+
+
+@pytest.fixture
+def app(database_url, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', database_url)
+    monkeypatch.setenv('METRICS_BACKEND', 'memory')
+    app = create_app()
+    # Also makes every view fail when it goes over its query budget
+    app.config['TESTING'] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    # Registers a user; returns (user_id, auth headers)
+    def make_user(name='Member'):
+        response = client.post('/api/auth/register', json={
+            "name": name, "email": f"user{next(emails)}@example.com", "password": "secret"
+        })
+        assert response.status_code == 201, response.json
+        return response.json['user']['id'], {"Authorization": f"Bearer {response.json['token']}"}
+    return make_user
+
+
+@pytest.fixture
+def make_group(client):
+    # Creates a group as the given admin, with the given members; returns its id
+    def make_group(admin_headers, members=(), name='Group', description='', target_amount=1000):
+        response = client.post('/api/groups', headers=admin_headers, json={
+            "name": name, "description": description, "target_amount": target_amount
+        })
+        assert response.status_code == 201, response.json
+        group_id = response.json['group']['id']
+        for headers in members:
+            assert client.post(f'/api/groups/{group_id}/join', headers=headers).status_code == 200
+        return group_id
+    return make_group
+
+
+@contextmanager
+def record_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement not in TRANSACTION_STATEMENTS:
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def recorded_statements():
+    # `with recorded_statements() as statements:` collects the SQL run inside
+    return record_statements
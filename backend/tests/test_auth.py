@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from app import create_app, routes
+from app.models import db, User
+from app.passwords import needs_rehash
+from app.sqlite_profile import write_lock
+import os
+import pytest
+import subprocess
+import sys
+
+# Run in a fresh interpreter, monkey-patched like a gevent worker. Prints the
+# time one hash takes and the longest the hub went without running while
+# eight greenlets hashed.
+GREEN_HASHES = """
+from gevent import monkey
+monkey.patch_all()
+from werkzeug.security import generate_password_hash
+from app import create_app
+from app.passwords import hash_password
+import gevent, time
+
+app = create_app()
+started = time.perf_counter()
+generate_password_hash('secret', app.config['PASSWORD_HASH_METHOD'])
+one_hash = time.perf_counter() - started
+gaps = []
+
+def tick():
+    last = time.perf_counter()
+    while True:
+        gevent.sleep(0.005)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+def login():
+    with app.app_context():
+        hash_password('secret')
+
+gevent.spawn(tick)
+gevent.joinall([gevent.spawn(login) for _ in range(8)])
+print(one_hash, max(gaps))
+"""
+
+
+@pytest.mark.parametrize('method', ['scrypt', 'scrypt:32768:8:1', 'pbkdf2:sha256', 'pbkdf2:sha256:1000000'])
+def test_hashes_made_with_the_configured_method_are_kept(app, method):
+    app.config['PASSWORD_HASH_METHOD'] = method
+    with app.app_context():
+        assert not needs_rehash(generate_password_hash('secret', method))
+        assert needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+
+def test_login_does_not_rewrite_a_current_hash(app, client, make_user, recorded_statements):
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256'
+    user_id, headers = make_user()
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        user.password = generate_password_hash('secret', 'pbkdf2:sha256')
+        email = user.email
+        db.session.commit()
+    with recorded_statements() as statements:
+        response = client.post('/api/auth/login', json={"email": email, "password": "secret"})
+    assert response.status_code == 200, response.json
+    assert not [statement for statement in statements if statement.startswith('UPDATE')]
+
+
+def test_password_change_revokes_refresh_tokens(client):
+    response = client.post('/api/auth/register', json={"name": "Member", "email": "refresh@example.com", "password": "secret"})
+    headers = {"Authorization": f"Bearer {response.json['token']}"}
+    old_refresh = {"Authorization": f"Bearer {response.json['refresh_token']}"}
+    assert client.post('/api/auth/refresh', headers=old_refresh).status_code == 200
+
+    # A profile edit without a new password keeps the token working
+    assert client.put('/api/profile', headers=headers, json={"name": "Renamed"}).status_code == 200
+    assert client.post('/api/auth/refresh', headers=old_refresh).status_code == 200
+
+    response = client.put('/api/profile', headers=headers, json={"password": "changed"})
+    assert response.status_code == 200
+    assert client.post('/api/auth/refresh', headers=old_refresh).status_code == 401
+    new_refresh = {"Authorization": f"Bearer {response.json['refresh_token']}"}
+    assert client.post('/api/auth/refresh', headers=new_refresh).status_code == 200
+
+
+def test_password_is_hashed_outside_the_sqlite_write_lock(database_url, monkeypatch):
+    if not database_url.startswith('sqlite'):
+        pytest.skip("The SQLite profile only applies to SQLite")
+    monkeypatch.setenv('DATABASE_URL', database_url)
+    monkeypatch.setenv('METRICS_BACKEND', 'memory')
+    monkeypatch.setenv('SQLITE_PROFILE', 'production')
+    app = create_app()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={"name": "Member", "email": "lock@example.com", "password": "secret"})
+    headers = {"Authorization": f"Bearer {response.json['token']}"}
+
+    locked = []
+
+    def hash_password(password):
+        # Another thread can take the lock only if this request does not hold it
+        with ThreadPoolExecutor(1) as pool:
+            locked.append(not pool.submit(lambda: write_lock.acquire(timeout=0) and (write_lock.release() or True)).result())
+        return generate_password_hash(password)
+
+    monkeypatch.setattr(routes, 'hash_password', hash_password)
+    assert client.put('/api/profile', headers=headers, json={"password": "changed"}).status_code == 200
+    assert locked == [False]
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_hashing_under_gevent_does_not_stall_the_worker(tmp_path):
+    env = {**os.environ, 'DATABASE_URL': f"sqlite:///{tmp_path / 'green.db'}", 'METRICS_BACKEND': 'memory'}
+    result = subprocess.run(
+        [sys.executable, '-c', GREEN_HASHES], env=env, capture_output=True, text=True,
+        cwd=os.path.join(os.path.dirname(__file__), '..')
+    )
+    assert result.returncode == 0, result.stderr
+    one_hash, longest_stall = map(float, result.stdout.split())
+    assert longest_stall < one_hash / 2
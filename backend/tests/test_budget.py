@@ -0,0 +1,47 @@
+from sqlalchemy import text
+from app.budget import QueryBudgetExceeded, allow_statements, query_budget
+from app.models import db
+import pytest
+
+
+def run(statements):
+    for _ in range(statements):
+        db.session.execute(text("SELECT 1"))
+
+
+def test_nested_budgets_count_against_the_budget_around_them(app):
+    with app.app_context():
+        with pytest.raises(QueryBudgetExceeded):
+            with query_budget(2, 'outer'):
+                for _ in range(3):
+                    with query_budget(1, 'inner'):
+                        run(1)
+
+        with query_budget(3, 'outer') as outer:
+            for _ in range(3):
+                with query_budget(1, 'inner'):
+                    run(1)
+        assert len(outer.statements) == 3
+
+
+def test_failed_attempts_are_not_counted(app):
+    with app.app_context():
+        with query_budget(1, 'outer') as outer:
+            with pytest.raises(ZeroDivisionError):
+                with query_budget(1, 'attempt'):
+                    run(1)
+                    1 / 0
+            run(1)
+        assert len(outer.statements) == 1
+
+
+def test_allowed_statements_reach_every_open_budget(app):
+    with app.app_context():
+        with query_budget(1, 'view'):
+            with query_budget(1, 'chunks'):
+                run(1)
+                allow_statements(1)
+                run(1)
+            with pytest.raises(QueryBudgetExceeded):
+                with query_budget(0, 'extra'):
+                    run(1)
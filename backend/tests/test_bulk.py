@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+from app import bulk, ledger
+from app.budget import query_budget
+from app.bulk import CHUNK_BUDGET, ingest_contributions, insert_pages
+from app.ledger import read_balance, set_balance_stripes
+from app.models import db
+
+
+def test_only_admins_can_backdate_contributions(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    member_id, member_headers = make_user()
+    group_id = make_group(admin_headers, [member_headers])
+    backdated = {"group_id": group_id, "amount": 10, "created_at": "2024-01-01T00:00:00"}
+
+    response = client.post('/api/contributions/batch', headers=member_headers, json=[backdated, {"group_id": group_id, "amount": 5}])
+    assert response.json['inserted'] == 1
+    assert response.json['errors'] == [{"index": 0, "error": "Only group admins can set created_at"}]
+
+    response = client.post('/api/contributions/batch', headers=admin_headers, json=[{**backdated, "user_id": member_id}])
+    assert response.json['inserted'] == 1
+    history = client.get(f'/api/groups/{group_id}/contributions', headers=member_headers).json['contributions']
+    assert sorted(contribution['created_at'][:10] for contribution in history)[0] == '2024-01-01'
+
+
+def test_future_contributions_are_rejected(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id = make_group(admin_headers)
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).isoformat()
+
+    response = client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "amount": 10, "created_at": tomorrow},
+        {"group_id": group_id, "amount": 10, "created_at": "2999-01-01T00:00:00+02:00"},
+    ])
+    assert response.json['inserted'] == 0
+    assert [error['error'] for error in response.json['errors']] == ["created_at cannot be in the future"] * 2
+
+
+def test_batch_withdrawal_ids_must_be_integers(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    member_headers = make_user()[1]
+    group_id = make_group(admin_headers, [member_headers])
+    client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": 10})
+    withdrawal_id = client.post(f'/api/groups/{group_id}/withdraw', headers=member_headers, json={"amount": 5}).json['withdrawal']['id']
+    assert withdrawal_id == 1
+
+    response = client.post('/api/withdrawals/process', headers=admin_headers, json={"withdrawals": [
+        {"id": True, "status": "approved"}, {"id": "1", "status": "approved"}
+    ]})
+    assert [result.get('error') for result in response.json['results']] == ["Invalid id or status value"] * 2
+    assert client.get(f'/api/groups/{group_id}/withdrawals', headers=admin_headers).json['withdrawals'][0]['status'] == 'pending'
+
+
+def batch_statements(app, client, recorded_statements, make_user, make_group, groups):
+    # Statements run by one contribution batch and one withdrawal batch that
+    # both span `groups` groups, every other one striped
+    admin_headers = make_user('Admin')[1]
+    group_ids = [make_group(admin_headers, name=f'Group {index}') for index in range(groups)]
+    with app.app_context():
+        for group_id in group_ids[::2]:
+            set_balance_stripes(group_id, 4)
+        db.session.commit()
+
+    with recorded_statements() as contribution_statements:
+        response = client.post('/api/contributions/batch', headers=admin_headers, json=[
+            {"group_id": group_id, "amount": 10} for group_id in group_ids for _ in range(3)
+        ])
+    assert response.json['inserted'] == 3 * groups
+
+    withdrawal_ids = [
+        client.post(f'/api/groups/{group_id}/withdraw', headers=admin_headers, json={"amount": 25}).json['withdrawal']['id']
+        for group_id in group_ids
+    ]
+    with recorded_statements() as withdrawal_statements:
+        response = client.post('/api/withdrawals/process', headers=admin_headers, json={"withdrawals": [
+            {"id": withdrawal_id, "status": "approved" if index % 3 else "rejected"}
+            for index, withdrawal_id in enumerate(withdrawal_ids)
+        ]})
+    assert [result.get('error') for result in response.json['results']] == [None] * groups
+    for index, group_id in enumerate(group_ids):
+        group = client.get(f'/api/groups/{group_id}', headers=admin_headers).json['group']
+        assert group['current_amount'] == (5 if index % 3 else 30)
+    return len(contribution_statements), len(withdrawal_statements)
+
+
+def test_batch_statements_do_not_grow_with_groups(app, client, recorded_statements, make_user, make_group):
+    few = batch_statements(app, client, recorded_statements, make_user, make_group, 3)
+    many = batch_statements(app, client, recorded_statements, make_user, make_group, 12)
+    assert few == many
+
+
+def test_each_contribution_chunk_is_budgeted(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_ids = [make_group(admin_headers, name=f'Group {index}') for index in range(3)]
+
+    # Five chunks, each its own transaction, fit the view's budget in strict mode
+    response = client.post('/api/contributions/batch?chunk_size=2', headers=admin_headers, json=[
+        {"group_id": group_id, "amount": 1} for group_id in group_ids for _ in range(3)
+    ])
+    assert response.status_code == 200
+    assert response.json['inserted'] == 9
+
+    # One chunk larger than a driver's insert page
+    response = client.post('/api/contributions/batch?chunk_size=2500', headers=admin_headers, json=[
+        {"group_id": group_ids[0], "amount": 1}
+    ] * 2500)
+    assert response.status_code == 200
+    assert response.json['inserted'] == 2500
+
+
+def test_retried_chunks_make_room_once(app, monkeypatch, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    # The first attempt at each chunk hits a lock after its INSERT and is retried
+    attempts = []
+    def credit_groups(totals):
+        attempts.append(totals)
+        if len(attempts) % 2:
+            raise OperationalError('UPDATE savings_group', {}, Exception('database is locked'))
+        return ledger.credit_groups(totals)
+    monkeypatch.setattr(bulk, 'credit_groups', credit_groups)
+
+    with app.app_context():
+        # The membership check and one chunk, as the batch view budgets. Both
+        # chunks are larger than PostgreSQL's insert page.
+        with query_budget(CHUNK_BUDGET + 1) as budget:
+            records = [{"group_id": group_id, "user_id": admin_id, "amount": 1}] * 4000
+            assert ingest_contributions(records, chunk_size=2500) == (4000, [])
+        assert len(attempts) == 4
+        assert budget.allowed == CHUNK_BUDGET + insert_pages(2500) + insert_pages(1500)
+        assert read_balance(group_id) == 4000 * 100
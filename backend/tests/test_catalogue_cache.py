@@ -0,0 +1,63 @@
+from app import create_app
+from app.models import db
+
+
+def discovered(client, headers):
+    response = client.get('/api/discover', headers=headers)
+    assert response.status_code == 200
+    return {group['id']: group['current_amount'] for group in response.json['groups']}
+
+
+def discover_stats(client, headers):
+    response = client.get('/api/cache/stats', headers=headers)
+    assert response.status_code == 200
+    assert set(response.json) == {'membership', 'discover'}
+    return response.json['discover']
+
+
+def test_writes_invalidate_discover_pages(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    viewer_headers = make_user()[1]
+    group_id = make_group(admin_headers)
+
+    assert discovered(client, viewer_headers) == {group_id: 0}
+    before = discover_stats(client, viewer_headers)
+    assert discovered(client, viewer_headers) == {group_id: 0}
+    after = discover_stats(client, viewer_headers)
+    assert (after['hits'], after['misses']) == (before['hits'] + 1, before['misses'])
+    assert after['hit_ratio'] == round(after['hits'] / (after['hits'] + after['misses']), 4)
+
+    client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 10})
+    assert discovered(client, viewer_headers) == {group_id: 10}
+
+    other_id = make_group(admin_headers)
+    assert discovered(client, viewer_headers) == {group_id: 10, other_id: 0}
+
+    # A rejected write leaves the cached page alone
+    before = discover_stats(client, viewer_headers)
+    client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": -1})
+    assert discovered(client, viewer_headers) == {group_id: 10, other_id: 0}
+    assert discover_stats(client, viewer_headers)['hits'] == before['hits'] + 1
+
+
+def test_invalidations_reach_every_worker(app, client, make_user, make_group, monkeypatch, tmp_path):
+    # Two workers on the same database; the other one is built as gunicorn
+    # would, with WEB_CONCURRENCY set
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    monkeypatch.setenv('DISCOVER_CACHE_PATH', str(tmp_path / 'discover_cache.db'))
+    workers = [create_app(), create_app()]
+    assert [worker.config['DISCOVER_CACHE_BACKEND'] for worker in workers] == ['sqlite', 'sqlite']
+    first, second = (worker.test_client() for worker in workers)
+
+    admin_headers = make_user('Admin')[1]
+    viewer_headers = make_user()[1]
+    group_id = make_group(admin_headers)
+    assert discovered(first, viewer_headers) == {group_id: 0}
+    assert discovered(second, viewer_headers) == {group_id: 0}
+
+    second.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 10})
+    assert discovered(first, viewer_headers) == {group_id: 10}
+    for worker in workers:
+        with worker.app_context():
+            db.session.remove()
+            db.engine.dispose()
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+from app import create_app
+from app.models import db, Contribution, WithdrawalRequest
+from app.ledger import read_balance
+import pytest
+import random
+
+THREADS = 8
+CONTRIBUTIONS = 2000
+WITHDRAWALS = 200
+
+
+@pytest.fixture(params=['default', 'sqlite-profile'])
+def app(request, app, database_url, monkeypatch):
+    # Runs the stress test with the SQLite production profile as well
+    if request.param == 'default':
+        yield app
+        return
+    if not database_url.startswith('sqlite'):
+        pytest.skip("The SQLite profile only applies to SQLite")
+    monkeypatch.setenv('SQLITE_PROFILE', 'production')
+    profiled = create_app()
+    profiled.config['TESTING'] = True
+    yield profiled
+    with profiled.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_concurrent_contributions_and_approvals_are_exact(app, make_user, make_group):
+    client = app.test_client()
+    admin_id, admin_headers = make_user('Admin')
+    members = [make_user() for _ in range(THREADS)]
+    group_id = make_group(admin_headers, [headers for _, headers in members])
+
+    # Enough to request every withdrawal up front, but not to approve them
+    # all unless the concurrent contributions arrive first
+    assert client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 500}).status_code == 201
+    withdrawal_ids = []
+    for index in range(WITHDRAWALS):
+        response = client.post(f'/api/groups/{group_id}/withdraw', headers=members[index % THREADS][1], json={"amount": 5})
+        assert response.status_code == 201
+        withdrawal_ids.append(response.json['withdrawal']['id'])
+
+    rng = random.Random(5)
+    amounts = [rng.randint(1, 10000) / 100 for _ in range(CONTRIBUTIONS)]
+
+    def contribute(index):
+        response = app.test_client().post(
+            f'/api/groups/{group_id}/contribute', headers=members[index % THREADS][1], json={"amount": amounts[index]}
+        )
+        return response.status_code
+
+    def approve(withdrawal_id):
+        response = app.test_client().post(
+            f'/api/withdrawals/{withdrawal_id}/process', headers=admin_headers, json={"status": "approved"}
+        )
+        return response.status_code
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        approvals = [pool.submit(approve, withdrawal_id) for withdrawal_id in withdrawal_ids]
+        contributions = list(pool.map(contribute, range(CONTRIBUTIONS)))
+        approvals = [future.result() for future in approvals]
+
+    assert set(contributions) == {201}
+    # An approval only fails when it would overdraw the group
+    assert set(approvals) <= {200, 400}
+    approved = approvals.count(200)
+    expected = 50000 + sum(round(amount * 100) for amount in amounts) - approved * 500
+    with app.app_context():
+        assert read_balance(group_id) == expected
+        contributed = db.session.execute(
+            select(func.sum(Contribution.amount_cents)).where(Contribution.group_id == group_id)
+        ).scalar()
+        withdrawn = db.session.execute(
+            select(func.sum(WithdrawalRequest.amount_cents)).where(
+                WithdrawalRequest.group_id == group_id, WithdrawalRequest.status == 'approved'
+            )
+        ).scalar() or 0
+        assert contributed - withdrawn == expected
@@ -0,0 +1,33 @@
+import pytest
+
+ENDPOINTS = ['/api/groups/{}', '/api/groups/{}/stats']
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_revalidation_runs_at_most_one_query(client, make_user, make_group, recorded_statements, endpoint):
+    admin_headers = make_user('Admin')[1]
+    member_headers = make_user()[1]
+    group_id = make_group(admin_headers, [member_headers])
+    client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": 10})
+    url = endpoint.format(group_id)
+    etag = client.get(url, headers=member_headers).headers['ETag']
+
+    with recorded_statements() as statements:
+        response = client.get(url, headers={**member_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert len(statements) <= 1
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_member_profile_changes_bust_the_etag(client, make_user, make_group, endpoint):
+    admin_headers = make_user('Admin')[1]
+    member_id, member_headers = make_user()
+    group_id = make_group(admin_headers, [member_headers])
+    client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": 10})
+    url = endpoint.format(group_id)
+    etag = client.get(url, headers=admin_headers).headers['ETag']
+
+    assert client.put('/api/profile', headers=member_headers, json={"name": "Renamed"}).status_code == 200
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert 'Renamed' in response.get_data(as_text=True)
@@ -0,0 +1,159 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, update
+from app.models import db, GroupEvent
+import json
+import pytest
+import time
+
+
+@pytest.fixture
+def hub(app, monkeypatch):
+    # A quick poller and heartbeat, so a test waits milliseconds for events
+    hub = app.extensions['event_hub']
+    hub.poll_seconds = 0.02
+    monkeypatch.setattr('app.events.HEARTBEAT_SECONDS', 0.2)
+    yield hub
+    # A stream left open keeps its request context pushed
+    for stream in Stream.open:
+        stream.close()
+    # The poller thread outlives the test; park it
+    hub.poll_seconds = 3600
+
+
+def published(hub, count, seconds=5):
+    # Waits for the poller to have published `count` events in all
+    deadline = time.monotonic() + seconds
+    while hub.sequence < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+class Stream:
+    open = set()
+
+    def __init__(self, client, headers, last_event_id=None):
+        headers = dict(headers, **({"Last-Event-ID": str(last_event_id)} if last_event_id else {}))
+        self.response = client.get('/api/events', headers=headers, buffered=False)
+        assert self.response.status_code == 200
+        self.chunks = iter(self.response.response)
+        Stream.open.add(self)
+        assert next(self.chunks).startswith(b'retry: ')
+
+    def read(self, count, seconds=5):
+        # The next `count` events as (id, kind, data); pings are skipped
+        events = []
+        deadline = time.monotonic() + seconds
+        while len(events) < count:
+            assert time.monotonic() < deadline, f"got {events}"
+            chunk = next(self.chunks).decode()
+            if chunk.startswith(':'):
+                continue
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+
+    def quiet(self, seconds=0.5):
+        # Nothing but pings arrives for a while
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            chunk = next(self.chunks)
+            assert chunk.startswith(b':'), chunk
+
+    def close(self):
+        Stream.open.discard(self)
+        self.response.close()
+
+
+def settle(app):
+    # Makes every event so far old enough to have settled
+    with app.app_context():
+        db.session.execute(update(GroupEvent).values(created_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+
+
+def contribute(client, headers, group_id, amount):
+    assert client.post(f'/api/groups/{group_id}/contribute', headers=headers, json={"amount": amount}).status_code == 201
+
+
+def test_stream_sends_live_events_of_the_users_groups(app, client, hub, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    member_id, member_headers = make_user()
+    group_id = make_group(admin_headers, [member_headers])
+    other_id = make_group(admin_headers)
+
+    stream = Stream(client, member_headers)
+    contribute(client, admin_headers, other_id, 1)
+    contribute(client, admin_headers, group_id, 2.5)
+    [(event_id, kind, data)] = stream.read(1)
+    assert (kind, data['group_id'], data['contribution']['amount']) == ('contribution', group_id, 2.5)
+
+    # Joining a group adds it to an open stream
+    client.post(f'/api/groups/{other_id}/join', headers=member_headers)
+    contribute(client, admin_headers, other_id, 3)
+    assert [(kind, data['group_id']) for _, kind, data in stream.read(2)] == [('member_joined', other_id), ('contribution', other_id)]
+    stream.close()
+
+
+def test_a_slow_stream_catches_up_from_the_outbox(app, client, hub, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id = make_group(admin_headers)
+    stream = Stream(client, admin_headers)
+    # More events than the buffer holds arrive while the stream is not reading
+    hub.recent = deque(maxlen=2)
+    for amount in range(1, 6):
+        contribute(client, admin_headers, group_id, amount)
+    published(hub, 5)
+
+    events = stream.read(5)
+    assert [data['contribution']['amount'] for _, _, data in events] == [1, 2, 3, 4, 5]
+    stream.quiet()
+    stream.close()
+
+
+def test_last_event_id_resumes_with_late_commits(app, client, hub, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id = make_group(admin_headers)
+    # An id taken by a transaction that has not committed yet
+    with app.app_context():
+        late_id = db.session.execute(insert(GroupEvent).returning(GroupEvent.id), [
+            {"group_id": group_id, "kind": 'contribution', "payload": '{}'}
+        ]).scalar()
+        db.session.execute(delete(GroupEvent).where(GroupEvent.id == late_id))
+        db.session.commit()
+    contribute(client, admin_headers, group_id, 1)
+    settle(app)
+
+    stream = Stream(client, admin_headers)
+    contribute(client, admin_headers, group_id, 2)
+    [(last_id, _, _)] = stream.read(1)
+    stream.close()
+    # A stream can get an event from the outbox before the poller does; a
+    # stream opened after that could send it live again
+    published(hub, 1)
+    settle(app)
+
+    # While the client is away: a new event, and the slow transaction
+    # committing the lower id it took before the client's last event
+    contribute(client, admin_headers, group_id, 3)
+    with app.app_context():
+        db.session.execute(insert(GroupEvent), [
+            {"id": late_id, "group_id": group_id, "kind": 'contribution', "payload": json.dumps({"group_id": group_id, "late": True})}
+        ])
+        db.session.commit()
+
+    stream = Stream(client, admin_headers, last_event_id=last_id)
+    events = stream.read(2)
+    assert events[0][0] == late_id and events[0][2]['late']
+    assert events[1][0] > last_id and events[1][2]['contribution']['amount'] == 3
+    stream.quiet()
+    stream.close()
+
+    # Long-settled events at or below Last-Event-ID are not sent again
+    settle(app)
+    stream = Stream(client, admin_headers, last_event_id=events[1][0])
+    stream.quiet()
+    stream.close()
+
+    response = client.get('/api/events?last_event_id=abc', headers=admin_headers)
+    assert response.status_code == 400
@@ -0,0 +1,87 @@
+from sqlalchemy import text
+from app.models import db
+import csv
+import io
+import json
+import os
+import pytest
+
+# Ledger rows for the memory test; EXPORT_TEST_ROWS shrinks it for quick runs
+ROWS = int(os.environ.get('EXPORT_TEST_ROWS', 5_000_000))
+RSS_CEILING_MIB = 64
+
+
+def rss_mib():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+
+def test_only_admins_can_export(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    member_headers = make_user()[1]
+    group_id = make_group(admin_headers, [member_headers])
+    client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": 10})
+
+    assert client.get(f'/api/groups/{group_id}/export', headers=member_headers).status_code == 403
+    response = client.get(f'/api/groups/{group_id}/export', headers=admin_headers)
+    assert response.status_code == 200
+    assert len(list(csv.reader(io.StringIO(response.get_data(as_text=True))))) == 2
+
+
+def test_export_memory_stays_flat(app, client, make_user, make_group):
+    if not os.path.exists('/proc/self/status'):
+        pytest.skip("Needs /proc to read the resident set size")
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            created_at = "datetime('2024-01-01', '+' || i || ' seconds')"
+        else:
+            created_at = "TIMESTAMP '2024-01-01' + i * INTERVAL '1 second'"
+        numbers = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) "
+        params = {"group_id": group_id, "user_id": admin_id}
+        db.session.execute(text(
+            numbers + "INSERT INTO contribution (amount_cents, user_id, group_id, created_at) "
+            f"SELECT i % 1000 + 1, :user_id, :group_id, {created_at} FROM n"
+        ), {**params, "rows": ROWS - ROWS // 10})
+        db.session.execute(text(
+            numbers + "INSERT INTO withdrawal_request (amount_cents, user_id, group_id, status, reason, created_at) "
+            f"SELECT 5, :user_id, :group_id, 'approved', 'rent, \"march\"', {created_at} FROM n"
+        ), {**params, "rows": ROWS // 10})
+        db.session.commit()
+
+    response = client.get(f'/api/groups/{group_id}/export?format=csv', headers=admin_headers, buffered=False)
+    assert response.status_code == 200
+    baseline = peak = rss_mib()
+    lines = 0
+    for chunk_number, chunk in enumerate(response.response):
+        lines += chunk.count(b'\n')
+        if chunk_number % 100 == 0:
+            peak = max(peak, rss_mib())
+    response.close()
+    # A header line, then one line per ledger row
+    assert lines == ROWS + 1
+    assert peak - baseline < RSS_CEILING_MIB
+
+
+def test_date_range_offsets_are_converted_to_utc(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "user_id": admin_id, "amount": hour, "created_at": f"2024-03-01T{hour:02d}:00:00"}
+        for hour in (8, 9, 10)
+    ])
+
+    # 10:30 to 11:30 at +02:00 is 08:30 to 09:30 UTC
+    url = f'/api/groups/{group_id}/export?format=ndjson&from=2024-03-01T10:30:00%2B02:00&to=2024-03-01T11:30:00%2B02:00'
+    response = client.get(url, headers=admin_headers)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['amount'] for row in rows] == [9]
+
+    rows = client.get(f'/api/groups/{group_id}/export?format=ndjson&from=2024-03-01T09:00:00Z', headers=admin_headers)
+    assert [json.loads(line)['amount'] for line in rows.get_data(as_text=True).splitlines()] == [9, 10]
+
+    assert client.get(f'/api/groups/{group_id}/export?from=yesterday', headers=admin_headers).status_code == 400
@@ -0,0 +1,43 @@
+def add_groups(make_user, make_group, user_headers, count, members):
+    # `count` groups that the user belongs to and `count` that it does not,
+    # each with `members` other members
+    for _ in range(count):
+        admin_headers = make_user('Admin')[1]
+        others = [make_user()[1] for _ in range(members)]
+        make_group(admin_headers, others + [user_headers])
+        make_group(admin_headers, others)
+
+
+def list_statements(client, headers, recorded_statements):
+    # Statements run by a cold GET /api/groups and GET /api/discover
+    counts = {}
+    for url in ('/api/groups', '/api/discover?limit=100'):
+        with recorded_statements() as statements:
+            response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        counts[url] = len(statements)
+    return counts
+
+
+def test_list_queries_do_not_grow_with_groups_or_members(client, make_user, make_group, recorded_statements):
+    user_id, headers = make_user()
+    add_groups(make_user, make_group, headers, 1, 1)
+    small = list_statements(client, headers, recorded_statements)
+
+    add_groups(make_user, make_group, headers, 10, 5)
+    large = list_statements(client, headers, recorded_statements)
+
+    assert large == small
+
+
+def test_members_count(client, make_user, make_group):
+    user_id, headers = make_user()
+    admin_headers = make_user('Admin')[1]
+    joined = make_group(admin_headers, [headers, make_user()[1]])
+    other = make_group(admin_headers, [make_user()[1] for _ in range(3)])
+
+    groups = client.get('/api/groups', headers=headers).json['groups']
+    assert [(group['id'], group['members_count']) for group in groups] == [(joined, 3)]
+
+    discovered = client.get('/api/discover', headers=headers).json['groups']
+    assert [(group['id'], group['members_count']) for group in discovered] == [(other, 4)]
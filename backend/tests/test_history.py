@@ -0,0 +1,91 @@
+import pytest
+
+
+def backdate(client, headers, group_id, rows):
+    # rows: [(user_id, created_at)], one contribution of 1 each
+    response = client.post('/api/contributions/batch', headers=headers, json=[
+        {"group_id": group_id, "user_id": user_id, "amount": 1, "created_at": created_at} for user_id, created_at in rows
+    ])
+    assert response.json['inserted'] == len(rows), response.json
+
+
+def walk(client, headers, url, key, limit):
+    # Every page of a history listing; returns the rows and the page count
+    rows, pages, cursor = [], 0, None
+    while True:
+        separator = '&' if '?' in url else '?'
+        response = client.get(f"{url}{separator}limit={limit}" + (f"&cursor={cursor}" if cursor else ''), headers=headers)
+        assert response.status_code == 200, response.json
+        rows += response.json[key]
+        pages += 1
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return rows, pages
+
+
+def test_pages_cover_every_row_once_newest_first(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    # Ten rows share each timestamp, so pages split ties on id
+    backdate(client, admin_headers, group_id, [
+        (admin_id, f"2024-01-0{day}T00:00:00") for day in range(1, 4) for _ in range(10)
+    ])
+
+    rows, pages = walk(client, admin_headers, f'/api/groups/{group_id}/contributions', 'contributions', 7)
+    assert pages == 5
+    keys = [(row['created_at'], row['id']) for row in rows]
+    assert len(set(keys)) == 30
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_history_filters(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    member_id, member_headers = make_user()
+    group_id = make_group(admin_headers, [member_headers])
+    backdate(client, admin_headers, group_id, [
+        (admin_id, "2024-01-01T00:00:00"), (member_id, "2024-01-01T12:00:00"), (admin_id, "2024-01-02T00:00:00")
+    ])
+    url = f'/api/groups/{group_id}/contributions'
+
+    def listed(query):
+        response = client.get(f"{url}?{query}", headers=member_headers)
+        assert response.status_code == 200, response.json
+        return [row['created_at'] for row in response.json['contributions']]
+
+    assert listed(f"user_id={member_id}") == ["2024-01-01T12:00:00"]
+    assert listed("from=2024-01-01T12:00:00") == ["2024-01-02T00:00:00", "2024-01-01T12:00:00"]
+    assert listed("to=2024-01-01T12:00:00") == ["2024-01-01T00:00:00"]
+    # Offsets are converted to UTC before comparing ("+" is %2B in a query)
+    assert listed("from=2024-01-01T13:00:00%2B02:00&to=2024-01-02T00:00:00Z") == ["2024-01-01T12:00:00"]
+    assert listed("from=2024-01-01T06:00:00-06:00") == ["2024-01-02T00:00:00", "2024-01-01T12:00:00"]
+
+
+def test_withdrawal_status_filter_pages(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    member_headers = make_user()[1]
+    group_id = make_group(admin_headers, [member_headers])
+    client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": 100})
+    ids = [
+        client.post(f'/api/groups/{group_id}/withdraw', headers=member_headers, json={"amount": 1}).json['withdrawal']['id']
+        for _ in range(9)
+    ]
+    client.post('/api/withdrawals/process', headers=admin_headers, json={"withdrawals": [
+        {"id": withdrawal_id, "status": "approved"} for withdrawal_id in ids[::3]
+    ]})
+
+    url = f'/api/groups/{group_id}/withdrawals'
+    pending, pages = walk(client, admin_headers, f'{url}?status=pending', 'withdrawals', 4)
+    assert sorted(row['id'] for row in pending) == sorted(set(ids) - set(ids[::3])) and pages == 2
+    approved, _ = walk(client, admin_headers, f'{url}?status=approved', 'withdrawals', 4)
+    assert sorted(row['id'] for row in approved) == ids[::3]
+
+
+@pytest.mark.parametrize('query', [
+    'limit=0', 'limit=abc', 'cursor=not-a-cursor', 'cursor=bm90fGE=', 'user_id=abc', 'from=yesterday', 'to=2024-13-01'
+])
+def test_bad_history_arguments_are_rejected(client, make_user, make_group, query):
+    headers = make_user()[1]
+    group_id = make_group(headers)
+    response = client.get(f'/api/groups/{group_id}/contributions?{query}', headers=headers)
+    assert response.status_code == 400
+    assert response.json == {"error": "Invalid limit, cursor or filter"}
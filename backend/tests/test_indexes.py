@@ -0,0 +1,122 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from app.models import db, GroupMember
+import pytest
+
+# Tables whose lookups must be index searches, never scans or sorts
+LEDGER_TABLES = ('group_member', 'contribution', 'withdrawal_request')
+
+
+def explain(conn, dialect, statement, parameters):
+    # Plan lines of one statement. PostgreSQL is told to avoid sequential
+    # scans and sorts, so it only plans one where no index can serve.
+    cursor = conn.cursor()
+    if dialect == 'sqlite':
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    cursor.execute("SET LOCAL enable_seqscan = off")
+    cursor.execute("SET LOCAL enable_sort = off")
+    cursor.execute(f"EXPLAIN {statement}", parameters)
+    plan = [row[0].strip().removeprefix('-> ').strip() for row in cursor.fetchall()]
+    conn.rollback()
+    return plan
+
+
+def scanned_table(dialect, line):
+    # (table, whether an index finds its rows) for a line that reads a table
+    if dialect == 'sqlite':
+        if line.startswith(('SCAN', 'SEARCH')):
+            return line.split()[1], line.startswith('SEARCH') and 'INDEX' in line
+        return None, False
+    if ' on ' in line and 'Scan' in line and not line.startswith('Bitmap Index Scan'):
+        return line.split(' on ')[1].split()[0], not line.startswith('Seq Scan')
+    return None, False
+
+
+def sorts(dialect, line):
+    return 'TEMP B-TREE' in line if dialect == 'sqlite' else line.startswith('Sort')
+
+
+def query_plans(app, requests):
+    # Plans of every SELECT the requests run, with the dialect name
+    selects = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append((statement, parameters))
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        for request in requests:
+            assert request().status_code == 200
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        conn = db.engine.raw_connection()
+        try:
+            return dialect, [
+                (statement, explain(conn, dialect, statement, parameters)) for statement, parameters in selects
+            ]
+        finally:
+            conn.close()
+
+
+def test_hot_lookups_use_indexes(app, client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    member_id, member_headers = make_user()
+    group_id = make_group(admin_headers, [member_headers])
+    for amount in (10, 20, 30):
+        client.post(f'/api/groups/{group_id}/contribute', headers=member_headers, json={"amount": amount})
+        client.post(f'/api/groups/{group_id}/withdraw', headers=member_headers, json={"amount": 5})
+
+    dialect, plans = query_plans(app, [
+        lambda: client.get(f'/api/groups/{group_id}', headers=member_headers),
+        lambda: client.get(f'/api/groups/{group_id}/contributions?user_id={member_id}', headers=member_headers),
+        lambda: client.get(f'/api/groups/{group_id}/withdrawals?status=pending', headers=admin_headers),
+    ])
+
+    searched = set()
+    for statement, plan in plans:
+        for line in plan:
+            assert not sorts(dialect, line), (statement, plan)
+            table, indexed = scanned_table(dialect, line)
+            if table in LEDGER_TABLES:
+                assert indexed, (statement, plan)
+                searched.add(table)
+    assert searched == set(LEDGER_TABLES)
+
+    # Pending requests are listed from the status index, in page order
+    pending = [plan for statement, plan in plans if 'withdrawal_request.status = ' in statement]
+    assert pending and all(
+        any('ix_withdrawal_request_group_id_status_created_at_id' in line for line in plan) for plan in pending
+    ), pending
+
+
+def test_membership_is_unique(app, make_user, make_group):
+    user_id, headers = make_user()
+    group_id = make_group(headers)
+    with app.app_context():
+        db.session.add(GroupMember(user_id=user_id, group_id=group_id))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+
+
+def test_deep_pages_seek_to_the_cursor(app, client, make_user, make_group):
+    headers = make_user()[1]
+    group_id = make_group(headers)
+    for amount in range(1, 6):
+        client.post(f'/api/groups/{group_id}/contribute', headers=headers, json={"amount": amount})
+    url = f'/api/groups/{group_id}/contributions?limit=2'
+    cursor = client.get(url, headers=headers).json['next_cursor']
+
+    # The cursor is a range condition on the index, so page 10,000 reads as
+    # few rows as page 2
+    dialect, plans = query_plans(app, [lambda: client.get(f'{url}&cursor={cursor}', headers=headers)])
+    plan = [plan for statement, plan in plans if 'FROM contribution' in statement][0]
+    if dialect == 'sqlite':
+        seek = 'USING INDEX ix_contribution_group_id_created_at_id (group_id=? AND created_at<?)'
+    else:
+        seek = 'ROW(created_at, id) < ROW('
+    assert any(seek in line for line in plan), plan
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from sqlalchemy import func, insert, select
+from app.bulk import ingest_contributions, process_withdrawal_batch
+from app.ledger import read_balance
+from app.models import db, MemberSummary, WithdrawalRequest
+from app.reconcile import reconcile_groups
+import os
+import random
+
+# A million ledger operations by default; LEDGER_REPLAY_OPERATIONS shrinks it
+OPERATIONS = int(os.environ.get('LEDGER_REPLAY_OPERATIONS', 1_000_000))
+ROUND = 10_000
+GROUPS = 4
+
+
+def test_replayed_ledger_has_no_drift(app, client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    members = [make_user() for _ in range(3)]
+    group_ids = [make_group(admin_headers, [headers for _, headers in members]) for _ in range(GROUPS)]
+    user_ids = [admin_id] + [user_id for user_id, _ in members]
+
+    rng = random.Random(15)
+    expected = dict.fromkeys(group_ids, Decimal(0))
+    with app.app_context():
+        for _ in range(max(1, OPERATIONS // ROUND)):
+            # Nine contributions per withdrawal, as floats such as 0.1 and 0.2
+            # that do not add up exactly in binary
+            records = [
+                {"group_id": rng.choice(group_ids), "user_id": rng.choice(user_ids), "amount": rng.randint(1, 99999) / 100}
+                for _ in range(ROUND * 9 // 10)
+            ]
+            inserted, errors = ingest_contributions(records)
+            assert (inserted, errors) == (len(records), [])
+            for record in records:
+                expected[record['group_id']] += Decimal(str(record['amount']))
+
+            # Requests are made directly; only processing moves balances
+            requests = [
+                {"group_id": rng.choice(group_ids), "user_id": rng.choice(user_ids), "amount_cents": rng.randint(1, 20000), "status": 'pending'}
+                for _ in range(ROUND // 10)
+            ]
+            withdrawal_ids = db.session.execute(insert(WithdrawalRequest).returning(WithdrawalRequest.id), requests).scalars().all()
+            db.session.commit()
+            decisions = [{"id": withdrawal_id, "status": rng.choice(['approved', 'approved', 'rejected'])} for withdrawal_id in withdrawal_ids]
+            results = process_withdrawal_batch(decisions, admin_id)
+            for request, result in zip(requests, results):
+                assert 'error' not in result, result
+                if result['status'] == 'approved':
+                    expected[request['group_id']] -= Decimal(request['amount_cents']) / 100
+
+        for group_id in group_ids:
+            cents = int(expected[group_id] * 100)
+            assert read_balance(group_id) == cents
+            contributed, withdrawn = db.session.execute(
+                select(func.sum(MemberSummary.contributed_cents), func.sum(MemberSummary.withdrawn_cents))
+                .where(MemberSummary.group_id == group_id)
+            ).one()
+            assert contributed - withdrawn == cents
+        assert [result['mismatch_cents'] for result in reconcile_groups(group_ids, settle_seconds=0)] == [0] * GROUPS
+
+    for group_id in group_ids:
+        group = client.get(f'/api/groups/{group_id}', headers=admin_headers).json['group']
+        assert Decimal(str(group['current_amount'])) == expected[group_id]
@@ -0,0 +1,125 @@
+from sqlalchemy import delete, update
+from app import cache
+from app.cache import membership_cache
+from app.models import db, GroupMember
+import pytest
+
+
+class Clock:
+    # Stands in for the time module inside app.cache
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path, clock):
+    if request.param == 'memory':
+        return cache.MemoryCache(max_entries=2, ttl=60)
+    return cache.SQLiteCache(str(tmp_path / 'cache.db'), max_entries=2, ttl=60)
+
+
+def test_entries_expire_after_the_ttl(backend, clock):
+    backend.set('key', [1])
+    clock.now += 59
+    assert backend.get('key') == [1]
+    clock.now += 2
+    assert backend.get('key') is None
+    assert backend.stats()['hits'] == 1 and backend.stats()['misses'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(backend, clock):
+    # The SQLite cache trims every 100th write, the memory cache on every write
+    fillers = 97 if isinstance(backend, cache.SQLiteCache) else 0
+    backend.set('old', 1)
+    for index in range(fillers):
+        clock.now += 0.001
+        backend.set(f'filler {index}', index)
+    clock.now += 0.001
+    backend.set('used', 2)
+    clock.now += 0.001
+    assert backend.get('old') == 1
+    clock.now += 0.001
+    backend.set('new', 3)
+    assert backend.get('used') is None
+    assert backend.get('old') == 1 and backend.get('new') == 3
+    assert backend.stats()['size'] == 2
+
+
+def test_memory_cache_is_bounded_by_bytes():
+    backend = cache.MemoryCache(max_entries=100, max_bytes=20)
+    backend.set('a', 'x' * 10)
+    backend.set('b', 'y' * 10)
+    assert backend.get('a') is None and backend.get('b') == 'y' * 10
+    assert backend.stats()['bytes'] <= 20
+
+
+def test_only_memberships_are_cached(app, make_user, make_group, recorded_statements):
+    user_id, headers = make_user()
+    group_id = make_group(make_user('Admin')[1])
+    with app.app_context():
+        assert membership_cache.lookup(user_id, group_id) is None
+
+        # Joining behind the cache's back shows up at once: "not a member"
+        # is always re-checked
+        db.session.add(GroupMember(user_id=user_id, group_id=group_id, is_admin=False))
+        db.session.commit()
+        assert membership_cache.lookup(user_id, group_id) is False
+        assert membership_cache.lookup(user_id, group_id, admin=True) is None
+
+        db.session.execute(update(GroupMember).where(GroupMember.user_id == user_id).values(is_admin=True))
+        db.session.commit()
+        assert membership_cache.lookup(user_id, group_id, admin=True) is True
+
+        # A positive answer is served from the cache
+        with recorded_statements() as statements:
+            assert membership_cache.lookup(user_id, group_id, admin=True) is True
+        assert statements == []
+
+
+def test_removed_memberships_last_until_invalidated_or_expired(app, make_user, make_group, clock):
+    user_id, headers = make_user()
+    group_id = make_group(make_user('Admin')[1], [headers])
+    with app.app_context():
+        assert membership_cache.lookup(user_id, group_id) is False
+        db.session.execute(delete(GroupMember).where(GroupMember.user_id == user_id))
+        db.session.commit()
+
+        # There is no leave endpoint; a removal made elsewhere is trusted
+        # until the entry is invalidated or its TTL runs out
+        assert membership_cache.lookup(user_id, group_id) is False
+        clock.now += app.config['MEMBERSHIP_CACHE_TTL'] + 1
+        assert membership_cache.lookup(user_id, group_id) is None
+
+        db.session.add(GroupMember(user_id=user_id, group_id=group_id, is_admin=False))
+        db.session.commit()
+        assert membership_cache.lookup(user_id, group_id) is False
+        db.session.execute(delete(GroupMember).where(GroupMember.user_id == user_id))
+        db.session.commit()
+        membership_cache.invalidate(user_id)
+        assert membership_cache.lookup(user_id, group_id) is None
+
+
+def test_joining_and_creating_groups_invalidate_the_cache(client, make_user, make_group):
+    user_id, headers = make_user()
+    group_id = make_group(make_user('Admin')[1])
+    # Lists are read straight from the cached map, without a re-check
+    assert client.get('/api/groups', headers=headers).json['groups'] == []
+
+    assert client.post(f'/api/groups/{group_id}/join', headers=headers).status_code == 200
+    assert [group['id'] for group in client.get('/api/groups', headers=headers).json['groups']] == [group_id]
+
+    created = make_group(headers)
+    assert sorted(group['id'] for group in client.get('/api/groups', headers=headers).json['groups']) == [group_id, created]
@@ -0,0 +1,105 @@
+from app.metrics import FAMILIES, SQLiteMetrics, render
+import multiprocessing
+import re
+
+SAMPLE = re.compile(r'^([a-z_]+)\{([^{}]*)\} (-?[0-9.e+-]+)$')
+GROUPS = 'endpoint="api.get_groups",method="GET"'
+
+
+def scrape(client):
+    # {(name, labels): value} of every sample, after checking each line's shape
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    text = response.get_data(as_text=True)
+    assert text.endswith('\n')
+    samples, declared = {}, []
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            declared.append(line.split()[2])
+        elif line.startswith('# TYPE '):
+            name, kind = line.split()[2:]
+            assert (name, kind) == (declared[-1], FAMILIES[name][0])
+        else:
+            name, labels, value = SAMPLE.match(line).groups()
+            assert name.startswith(declared[-1])
+            samples[(name, labels)] = float(value)
+    assert declared == list(FAMILIES)
+    return samples
+
+
+def get(client, url, **kwargs):
+    # Requests are counted when the response is closed, as a WSGI server does
+    response = client.get(url, **kwargs)
+    response.close()
+    return response.status_code
+
+
+def test_metrics_count_requests(client, make_user):
+    headers = make_user()[1]
+    for _ in range(3):
+        assert get(client, '/api/groups', headers=headers) == 200
+    assert get(client, '/api/groups') == 401
+    assert get(client, '/no/such/page') == 404
+    get(client, '/metrics')
+
+    samples = scrape(client)
+    assert samples[('http_requests_total', GROUPS + ',status="200"')] == 3
+    assert samples[('http_requests_total', GROUPS + ',status="401"')] == 1
+    assert samples[('http_requests_total', 'endpoint="none",method="GET",status="404"')] == 1
+    # /metrics itself is not counted, and closed requests are no longer in flight
+    assert not any('endpoint="metrics"' in labels for _, labels in samples)
+    assert samples[('http_requests_in_flight', GROUPS)] == 0
+
+    for family in ('http_request_duration_seconds', 'http_request_db_statements', 'http_request_db_seconds'):
+        assert samples[(f'{family}_count', GROUPS)] == 4
+        buckets = [value for (name, labels), value in samples.items() if name == f'{family}_bucket' and labels.startswith(GROUPS + ',')]
+        assert buckets == sorted(buckets) and buckets[-1] == 4
+        assert samples[(f'{family}_bucket', GROUPS + ',le="+Inf"')] == 4
+    # Authenticated listings run SQL; the rejected one does not
+    assert samples[('http_request_db_statements_bucket', GROUPS + ',le="0"')] == 1
+    assert samples[('http_request_db_statements_sum', GROUPS)] >= 3
+
+
+def worker(path, pipe):
+    # Another gunicorn worker on the host: one request finished, one in flight
+    backend = SQLiteMetrics(path, flush_seconds=3600)
+    backend.record(
+        counters=[(('http_requests_total', GROUPS + ',status="200"', ''), 2)],
+        gauges=[(('http_requests_in_flight', GROUPS), 1)]
+    )
+    backend.flush()
+    pipe.send('flushed')
+    pipe.recv()
+
+
+def test_sqlite_metrics_add_up_workers_and_drop_exited_ones(tmp_path):
+    path = str(tmp_path / 'metrics.db')
+    context = multiprocessing.get_context('fork')
+    pipe, child_pipe = context.Pipe()
+    process = context.Process(target=worker, args=(path, child_pipe))
+    process.start()
+    assert pipe.recv() == 'flushed'
+
+    backend = SQLiteMetrics(path, flush_seconds=3600)
+    backend.record(
+        counters=[(('http_requests_total', GROUPS + ',status="200"', ''), 3)],
+        gauges=[(('http_requests_in_flight', GROUPS), 1)]
+    )
+    counters, gauges = backend.collect()
+    assert counters[('http_requests_total', GROUPS + ',status="200"', '')] == 5
+    assert gauges[('http_requests_in_flight', GROUPS)] == 2
+
+    # Once a worker exits its in-flight requests are gone, its counts are not
+    pipe.send('exit')
+    process.join()
+    counters, gauges = backend.collect()
+    assert counters[('http_requests_total', GROUPS + ',status="200"', '')] == 5
+    assert gauges[('http_requests_in_flight', GROUPS)] == 1
+    pids = {pid for pid, in backend.connection().execute("SELECT pid FROM metric_gauge")}
+    assert process.pid not in pids
+
+    # A restarted worker adds to the same counts
+    backend = SQLiteMetrics(path, flush_seconds=3600)
+    backend.record(counters=[(('http_requests_total', GROUPS + ',status="200"', ''), 1)])
+    assert f'http_requests_total{{{GROUPS},status="200"}} 6\n' in render(*backend.collect())
@@ -0,0 +1,68 @@
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import check, stamp, upgrade
+from sqlalchemy import select
+from app import create_app
+from app.models import db, SavingsGroup
+import multiprocessing
+import os
+import shutil
+import sqlite3
+
+# Made by db.create_all() before migrations existed, with Float money columns
+LEGACY_DATABASE = os.path.join(os.path.dirname(__file__), '..', 'instance', 'savingcircle.db')
+INITIAL_REVISION = 'a096522d4c14'
+
+
+def current_revision():
+    with db.engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def test_new_database_is_created_at_head(app):
+    with app.app_context():
+        script = ScriptDirectory(app.extensions['migrate'].directory)
+        assert current_revision() == script.get_current_head()
+        check()
+
+
+def boot_worker(barrier):
+    # Like a gunicorn worker: its own app and connections, started with the rest
+    barrier.wait()
+    app = create_app()
+    with app.app_context():
+        return current_revision()
+
+
+def test_workers_starting_together_create_the_schema_once(database_url, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', database_url)
+    monkeypatch.setenv('METRICS_BACKEND', 'memory')
+    context = multiprocessing.get_context('fork')
+    barrier = context.Manager().Barrier(4)
+    with context.Pool(4) as pool:
+        revisions = pool.map(boot_worker, [barrier] * 4)
+    app = create_app()
+    with app.app_context():
+        head = ScriptDirectory(app.extensions['migrate'].directory).get_current_head()
+        assert revisions == [head] * 4
+        check()
+        db.engine.dispose()
+
+
+def test_legacy_database_upgrades_to_head(tmp_path, monkeypatch):
+    legacy = tmp_path / 'legacy.db'
+    shutil.copy(LEGACY_DATABASE, legacy)
+    with sqlite3.connect(legacy) as conn:
+        balances = dict(conn.execute("SELECT id, ROUND(current_amount * 100) FROM savings_group"))
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{legacy}")
+    monkeypatch.setenv('METRICS_BACKEND', 'memory')
+    app = create_app()
+    with app.app_context():
+        assert current_revision() is None
+        stamp(revision=INITIAL_REVISION)
+        upgrade()
+        # The migrated schema matches the models
+        check()
+        assert dict(db.session.execute(select(SavingsGroup.id, SavingsGroup.current_amount_cents)).all()) == balances
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,27 @@
+from app.money import MAX_CENTS, to_cents
+import pytest
+
+
+@pytest.mark.parametrize('value, cents', [(0.1, 10), ('19.99', 1999), (1e13, MAX_CENTS), (-1e13, -MAX_CENTS)])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize('value', [True, 'abc', float('nan'), float('inf'), 0.001, 1e20, '10000000000000.01'])
+def test_to_cents_rejects(value):
+    with pytest.raises(ValueError):
+        to_cents(value)
+
+
+def test_oversized_amounts_are_rejected(client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id = make_group(admin_headers)
+
+    assert client.post('/api/groups', headers=admin_headers, json={"name": "Huge", "target_amount": 1e20}).status_code == 422
+    for action in ('contribute', 'withdraw'):
+        response = client.post(f'/api/groups/{group_id}/{action}', headers=admin_headers, json={"amount": 1e20})
+        assert response.status_code == 400
+        assert response.json['error'] == "Amount cannot exceed 10000000000000"
+    response = client.post('/api/contributions/batch', headers=admin_headers, json=[{"group_id": group_id, "amount": 1e20}])
+    assert response.json['errors'] == [{"index": 0, "error": "Amount cannot exceed 10000000000000"}]
+    assert client.get('/api/discover?min_target=1e20', headers=admin_headers).status_code == 400
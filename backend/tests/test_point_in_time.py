@@ -0,0 +1,82 @@
+from datetime import datetime
+from sqlalchemy import select, update
+from app.models import db, BalanceSnapshot, GroupMember, SavingsGroup, WithdrawalRequest
+import pytest
+
+
+def set_times(app, model, row_id, **times):
+    with app.app_context():
+        db.session.execute(update(model).where(model.id == row_id).values(
+            **{column: datetime.fromisoformat(value) for column, value in times.items()}
+        ))
+        db.session.commit()
+
+
+def group_as_of(client, headers, group_id, as_of):
+    response = client.get(f'/api/groups/{group_id}?as_of={as_of}', headers=headers)
+    assert response.status_code == 200, response.json
+    group = response.json['group']
+    return (
+        group['current_amount'],
+        sorted(member['id'] for member in group['members']),
+        [contribution['amount'] for contribution in group['contributions']],
+        [(withdrawal['status'], withdrawal['processed_at']) for withdrawal in group['withdrawals']]
+    )
+
+
+@pytest.mark.parametrize('snapshot', [None, '2024-01-03T00:00:00+01:00'])
+def test_as_of_shows_the_group_at_that_time(app, client, make_user, make_group, snapshot):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    with app.app_context():
+        db.session.execute(update(SavingsGroup).where(SavingsGroup.id == group_id).values(created_at=datetime(2023, 12, 31)))
+        db.session.execute(update(GroupMember).where(GroupMember.group_id == group_id).values(joined_at=datetime(2023, 12, 31)))
+        db.session.commit()
+    client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "amount": 10, "created_at": "2024-01-01T10:00:00"},
+        {"group_id": group_id, "amount": 5, "created_at": "2024-01-02T10:00:00"}
+    ])
+    # Joins today, long after the times asked about
+    member_id, member_headers = make_user()
+    client.post(f'/api/groups/{group_id}/join', headers=member_headers)
+
+    # Requested on the 3rd; one approved on the 4th, the other only today
+    first, second = (
+        client.post(f'/api/groups/{group_id}/withdraw', headers=admin_headers, json={"amount": amount}).json['withdrawal']['id']
+        for amount in (3, 2)
+    )
+    for withdrawal_id in (first, second):
+        client.post(f'/api/withdrawals/{withdrawal_id}/process', headers=admin_headers, json={"status": "approved"})
+    set_times(app, WithdrawalRequest, first, created_at='2024-01-03T10:00:00', processed_at='2024-01-04T10:00:00')
+    set_times(app, WithdrawalRequest, second, created_at='2024-01-03T11:00:00')
+
+    if snapshot:
+        result = app.test_cli_runner().invoke(args=['snapshot-balances', '--at', snapshot])
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            assert db.session.execute(select(BalanceSnapshot.taken_at)).scalars().all() == [datetime(2024, 1, 2, 23)]
+
+    pending = ('pending', None)
+    assert group_as_of(client, admin_headers, group_id, '2024-01-01T09:59:59Z') == (0, [admin_id], [], [])
+    assert group_as_of(client, admin_headers, group_id, '2024-01-03T12:00:00') == (15, [admin_id], [5, 10], [pending, pending])
+    # 11:59:59 at +02:00 is a second before the first approval, 12:00 is the approval itself
+    assert group_as_of(client, admin_headers, group_id, '2024-01-04T11:59:59%2B02:00') == (15, [admin_id], [5, 10], [pending, pending])
+    assert group_as_of(client, admin_headers, group_id, '2024-01-04T12:00:00%2B02:00') == (
+        12, [admin_id], [5, 10], [pending, ('approved', '2024-01-04T10:00:00')]
+    )
+
+    response = client.get(f'/api/groups/{group_id}?as_of=2024-01-04T12:00:00%2B02:00', headers=admin_headers)
+    assert response.json['group']['as_of'] == '2024-01-04T10:00:00'
+    group = client.get(f'/api/groups/{group_id}', headers=admin_headers).json['group']
+    assert group['current_amount'] == 10
+    assert sorted(member['id'] for member in group['members']) == [admin_id, member_id]
+    assert [withdrawal['status'] for withdrawal in group['withdrawals']] == ['approved', 'approved']
+
+
+def test_bad_as_of_is_rejected(client, make_user, make_group):
+    headers = make_user()[1]
+    group_id = make_group(headers)
+    for as_of in ('yesterday', '2024-13-01', '2024-01-01T25:00:00'):
+        response = client.get(f'/api/groups/{group_id}?as_of={as_of}', headers=headers)
+        assert response.status_code == 400
+        assert response.json == {"error": "Invalid as_of date"}
@@ -0,0 +1,95 @@
+from sqlalchemy import func, select, update
+from app.ledger import read_balance
+from app.models import db, Contribution, ReconciliationCheckpoint, SavingsGroup, WithdrawalRequest
+
+
+def reconcile(app, *args):
+    return app.test_cli_runner().invoke(args=['reconcile-balances', '--settle-seconds', '0', *args])
+
+
+def checkpoint(app, group_id):
+    with app.app_context():
+        row = db.session.get(ReconciliationCheckpoint, group_id)
+        return (row.last_contribution_id, row.contributed_cents, row.last_withdrawal_id, row.withdrawn_cents, row.mismatch_cents)
+
+
+def ledger_ids(app, group_id):
+    with app.app_context():
+        return (
+            db.session.execute(select(func.max(Contribution.id)).where(Contribution.group_id == group_id)).scalar() or 0,
+            db.session.execute(select(func.max(WithdrawalRequest.id)).where(WithdrawalRequest.group_id == group_id)).scalar() or 0
+        )
+
+
+def test_drift_is_detected_and_repaired(app, client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id, other_id = make_group(admin_headers), make_group(admin_headers)
+    for amount in (10, 2.5):
+        client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": amount})
+    client.post(f'/api/groups/{other_id}/contribute', headers=admin_headers, json={"amount": 1})
+
+    result = reconcile(app)
+    assert result.exit_code == 0, result.output
+    assert 'Checked 2 groups, 3 new rows' in result.output and '0 mismatched' in result.output
+    assert checkpoint(app, group_id) == (ledger_ids(app, group_id)[0], 1250, 0, 0, 0)
+
+    # The balance drifts by 1.23 behind the ledger's back
+    with app.app_context():
+        db.session.execute(update(SavingsGroup).where(SavingsGroup.id == group_id).values(
+            current_amount_cents=SavingsGroup.current_amount_cents + 123
+        ))
+        db.session.commit()
+    result = reconcile(app)
+    assert result.exit_code == 1
+    assert f'Group {group_id}: mismatch, balance is off by 1.23' in result.output
+    assert 'Checked 2 groups, 0 new rows' in result.output and '1 mismatched' in result.output
+    assert checkpoint(app, group_id)[4] == 123
+    with app.app_context():
+        assert read_balance(group_id) == 1373
+
+    # Rows added since are read on top of the checkpoint, and the repair
+    # brings the balance back to the ledger
+    client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 4})
+    result = reconcile(app, '--repair')
+    assert result.exit_code == 0, result.output
+    assert f'Group {group_id}: repaired, balance is off by 1.23' in result.output
+    assert 'Checked 2 groups, 1 new rows' in result.output
+    assert checkpoint(app, group_id) == (ledger_ids(app, group_id)[0], 1650, 0, 0, 0)
+    with app.app_context():
+        assert read_balance(group_id) == 1650
+    assert client.get(f'/api/groups/{group_id}', headers=admin_headers).json['group']['current_amount'] == 16.5
+
+    result = reconcile(app)
+    assert result.exit_code == 0 and '0 new rows' in result.output and '0 mismatched' in result.output
+
+    # --full re-reads the whole ledger and lands on the same checkpoint
+    result = reconcile(app, '--full', '--group', str(group_id))
+    assert result.exit_code == 0 and 'Checked 1 groups, 3 new rows' in result.output
+    assert checkpoint(app, group_id) == (ledger_ids(app, group_id)[0], 1650, 0, 0, 0)
+
+
+def test_checkpoints_wait_for_settled_rows(app, client, make_user, make_group):
+    admin_headers = make_user('Admin')[1]
+    group_id = make_group(admin_headers)
+    client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 10})
+    pending, approved = (
+        client.post(f'/api/groups/{group_id}/withdraw', headers=admin_headers, json={"amount": amount}).json['withdrawal']['id']
+        for amount in (1, 2)
+    )
+    client.post(f'/api/withdrawals/{approved}/process', headers=admin_headers, json={"status": "approved"})
+
+    # Within the settle window rows are checked but the checkpoint stays put
+    result = app.test_cli_runner().invoke(args=['reconcile-balances'])
+    assert result.exit_code == 0 and '0 mismatched' in result.output
+    assert checkpoint(app, group_id) == (0, 0, 0, 0, 0)
+
+    # Past it, contributions move on, but withdrawals stop short of the
+    # pending one, which may still be approved
+    result = reconcile(app)
+    assert result.exit_code == 0 and '0 mismatched' in result.output
+    assert checkpoint(app, group_id) == (ledger_ids(app, group_id)[0], 1000, 0, 0, 0)
+
+    client.post(f'/api/withdrawals/{pending}/process', headers=admin_headers, json={"status": "approved"})
+    result = reconcile(app)
+    assert result.exit_code == 0 and '0 mismatched' in result.output
+    assert checkpoint(app, group_id) == (ledger_ids(app, group_id)[0], 1000, approved, 300, 0)
@@ -0,0 +1,20 @@
+from app import search
+
+
+def test_searches_past_the_ranking_cap_are_flagged(client, make_user, make_group, monkeypatch):
+    monkeypatch.setattr(search, 'MAX_RANKED_MATCHES', 3)
+    admin_headers = make_user('Admin')[1]
+    headers = make_user()[1]
+    for index in range(5):
+        make_group(admin_headers, name=f"Beach trip {index}")
+    make_group(admin_headers, name="Ski trip")
+
+    response = client.get('/api/discover?q=beach', headers=headers)
+    assert response.json['truncated'] is True
+    assert len(response.json['groups']) == 3
+
+    response = client.get('/api/discover?q=ski', headers=headers)
+    assert response.json['truncated'] is False
+    assert [group['name'] for group in response.json['groups']] == ["Ski trip"]
+
+    assert 'truncated' not in client.get('/api/discover', headers=headers).json
@@ -0,0 +1,56 @@
+from sqlalchemy import func, select
+from app.cache import membership_cache
+from app.ledger import set_balance_stripes
+from app.models import db, GroupBalanceStripe
+
+
+def contribute(client, group_id, headers, amount=10):
+    response = client.post(f'/api/groups/{group_id}/contribute', headers=headers, json={"amount": amount})
+    assert response.status_code == 201, response.json
+    return response.json['group']['current_amount']
+
+
+def set_stripes(app, group_id, stripes):
+    with app.app_context():
+        set_balance_stripes(group_id, stripes)
+        db.session.commit()
+
+
+def striped_cents(app, group_id):
+    with app.app_context():
+        return db.session.execute(
+            select(func.coalesce(func.sum(GroupBalanceStripe.amount_cents), 0)).where(GroupBalanceStripe.group_id == group_id)
+        ).scalar_one()
+
+
+def test_unstriped_contribution_updates_only_the_group_row(client, make_user, make_group, recorded_statements):
+    user_id, headers = make_user()
+    group_id = make_group(headers)
+    contribute(client, group_id, headers)
+
+    with recorded_statements() as statements:
+        assert contribute(client, group_id, headers) == 20
+    updates = [statement for statement in statements if statement.lstrip().upper().startswith('UPDATE')]
+    assert len(updates) == 1 and 'savings_group' in updates[0] and 'stripe' not in updates[0]
+
+
+def test_stale_stripe_counts_never_lose_money(app, client, make_user, make_group):
+    user_id, headers = make_user()
+    group_id = make_group(headers)
+    assert contribute(client, group_id, headers) == 10
+
+    # The cached membership still says "no stripes": the group row is credited
+    set_stripes(app, group_id, 4)
+    assert contribute(client, group_id, headers) == 20
+    assert striped_cents(app, group_id) == 0
+
+    # Once the cache reloads, contributions go to the stripes
+    with app.app_context():
+        membership_cache.invalidate(user_id)
+    assert contribute(client, group_id, headers) == 30
+    assert striped_cents(app, group_id) == 1000
+
+    # Stripes turned off behind a cache that still has them: the group row again
+    set_stripes(app, group_id, 0)
+    assert contribute(client, group_id, headers) == 40
+    assert client.get(f'/api/groups/{group_id}', headers=headers).json['group']['current_amount'] == 40
@@ -0,0 +1,114 @@
+from sqlalchemy import select, update
+from app.models import db, Contribution, MemberSummary, WithdrawalRequest
+
+
+def ledger_summaries(group_id):
+    # {user_id: (contributed, contributions, withdrawn, withdrawals, last activity)}
+    # added up in Python from the raw ledger rows
+    totals = {}
+    def add(user_id, contributed, withdrawn, at):
+        row = totals.get(user_id, (0, 0, 0, 0, None))
+        totals[user_id] = (
+            row[0] + contributed, row[1] + (contributed > 0), row[2] + withdrawn, row[3] + (withdrawn > 0),
+            at if row[4] is None or at > row[4] else row[4]
+        )
+    for contribution in db.session.execute(select(Contribution).where(Contribution.group_id == group_id)).scalars():
+        add(contribution.user_id, contribution.amount_cents, 0, contribution.created_at)
+    for withdrawal in db.session.execute(select(WithdrawalRequest).where(
+        WithdrawalRequest.group_id == group_id, WithdrawalRequest.status == 'approved'
+    )).scalars():
+        add(withdrawal.user_id, 0, withdrawal.amount_cents, withdrawal.processed_at)
+    return totals
+
+
+def stored_summaries(group_id):
+    return {
+        summary.user_id: (
+            summary.contributed_cents, summary.contributions_count, summary.withdrawn_cents,
+            summary.withdrawals_count, summary.last_activity_at
+        )
+        for summary in db.session.execute(select(MemberSummary).where(MemberSummary.group_id == group_id)).scalars()
+    }
+
+
+def stats_totals(client, headers, group_id):
+    stats = client.get(f'/api/groups/{group_id}/stats', headers=headers).json
+    members = {
+        member['user']['id']: (member['contributed'], member['contributions_count'], member['withdrawn'], member['withdrawals_count'])
+        for member in stats['members'] if member['contributions_count'] or member['withdrawals_count']
+    }
+    return stats['totals'], members
+
+
+def expected_stats(summaries):
+    members = {
+        user_id: (contributed / 100, contributions, withdrawn / 100, withdrawals)
+        for user_id, (contributed, contributions, withdrawn, withdrawals, _) in summaries.items()
+    }
+    totals = {
+        "contributed": sum(row[0] for row in summaries.values()) / 100,
+        "contributions_count": sum(row[1] for row in summaries.values()),
+        "withdrawn": sum(row[2] for row in summaries.values()) / 100,
+        "withdrawals_count": sum(row[3] for row in summaries.values())
+    }
+    return totals, members
+
+
+def test_summaries_match_the_ledger(app, client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    member_id, member_headers = make_user()
+    idle_id, idle_headers = make_user('Idle')
+    group_id = make_group(admin_headers, [member_headers, idle_headers])
+
+    for headers, amount in ((admin_headers, 10.25), (member_headers, 4), (member_headers, 0.1)):
+        assert client.post(f'/api/groups/{group_id}/contribute', headers=headers, json={"amount": amount}).status_code == 201
+    response = client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "user_id": member_id, "amount": 20, "created_at": "2024-01-01T09:00:00"},
+        {"group_id": group_id, "user_id": admin_id, "amount": 0.2}
+    ])
+    assert response.json['inserted'] == 2
+
+    withdrawals = [
+        client.post(f'/api/groups/{group_id}/withdraw', headers=headers, json={"amount": amount}).json['withdrawal']['id']
+        for headers, amount in ((member_headers, 3), (member_headers, 1.5), (admin_headers, 2), (admin_headers, 0.05))
+    ]
+    assert client.post(f'/api/withdrawals/{withdrawals[0]}/process', headers=admin_headers, json={"status": "approved"}).status_code == 200
+    assert client.post(f'/api/withdrawals/{withdrawals[1]}/process', headers=admin_headers, json={"status": "rejected"}).status_code == 200
+    response = client.post('/api/withdrawals/process', headers=admin_headers, json={"withdrawals": [
+        {"id": withdrawals[2], "status": "approved"}, {"id": withdrawals[3], "status": "rejected"}
+    ]})
+    assert response.status_code == 200
+
+    with app.app_context():
+        ledger = ledger_summaries(group_id)
+        assert set(ledger) == {admin_id, member_id}
+        assert stored_summaries(group_id) == ledger
+    assert stats_totals(client, admin_headers, group_id) == expected_stats(ledger)
+
+    # Wipe out the running totals; the rebuild puts back the same rows
+    with app.app_context():
+        db.session.execute(update(MemberSummary).values(contributed_cents=0, withdrawals_count=7))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rebuild-member-summaries', '--group', str(group_id)])
+    assert result.exit_code == 0, result.output
+    assert 'Rebuilt 2 member summaries' in result.output
+    with app.app_context():
+        assert stored_summaries(group_id) == ledger
+    assert stats_totals(client, admin_headers, group_id) == expected_stats(ledger)
+
+
+def test_rebuild_leaves_other_groups_alone(app, client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_ids = [make_group(admin_headers) for _ in range(2)]
+    for group_id in group_ids:
+        client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 5})
+    with app.app_context():
+        db.session.execute(update(MemberSummary).values(contributed_cents=1))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rebuild-member-summaries', '--group', str(group_ids[0])])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert stored_summaries(group_ids[0])[admin_id][0] == 500
+        assert stored_summaries(group_ids[1])[admin_id][0] == 1
+    assert app.test_cli_runner().invoke(args=['rebuild-member-summaries', '--group', '999']).exit_code != 0
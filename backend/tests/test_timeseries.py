@@ -0,0 +1,127 @@
+from collections import defaultdict
+from sqlalchemy import select, update
+from app.models import db, Contribution, GroupDailyRollup, WithdrawalRequest
+import random
+
+# (UTC time, amount): a Sunday night and the Monday after it, the last second
+# of January and the first of February, a leap day, and a Monday just after
+# midnight at +02:00, which is still Sunday in UTC
+EDGES = [
+    ("2024-01-28T23:59:59", 1),
+    ("2024-01-29T00:00:00", 2),
+    ("2024-01-31T23:59:59", 4),
+    ("2024-02-01T00:00:00", 8),
+    ("2024-02-29T12:00:00", 16),
+    ("2024-03-04T00:00:00+02:00", 32),
+]
+
+
+def series(client, headers, group_id, query=''):
+    response = client.get(f'/api/groups/{group_id}/timeseries?{query}', headers=headers)
+    assert response.status_code == 200, response.json
+    return [(point['start'], point['contributed']) for point in response.json['series']]
+
+
+def ledger_days(group_id):
+    # {day: [contributed, contributions, withdrawn, withdrawals]} from the raw rows
+    days = defaultdict(lambda: [0, 0, 0, 0])
+    for contribution in db.session.execute(select(Contribution).where(Contribution.group_id == group_id)).scalars():
+        day = days[contribution.created_at.date()]
+        day[0] += contribution.amount_cents
+        day[1] += 1
+    for withdrawal in db.session.execute(select(WithdrawalRequest).where(
+        WithdrawalRequest.group_id == group_id, WithdrawalRequest.status == 'approved'
+    )).scalars():
+        day = days[withdrawal.processed_at.date()]
+        day[2] += withdrawal.amount_cents
+        day[3] += 1
+    return dict(days)
+
+
+def rollup_days(group_id):
+    return {
+        rollup.day: [rollup.contributed_cents, rollup.contributions_count, rollup.withdrawn_cents, rollup.withdrawals_count]
+        for rollup in db.session.execute(select(GroupDailyRollup).where(GroupDailyRollup.group_id == group_id)).scalars()
+    }
+
+
+def test_buckets_split_on_utc_edges(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    response = client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "amount": amount, "created_at": created_at} for created_at, amount in EDGES
+    ])
+    assert response.json['inserted'] == len(EDGES)
+
+    days = series(client, admin_headers, group_id, 'bucket=day')
+    # Every day from January 28th to March 3rd, empty ones included
+    assert len(days) == 36
+    assert days[0] == ('2024-01-28', 1) and days[-1] == ('2024-03-03', 32)
+    assert [point for point in days if point[1]] == [
+        ('2024-01-28', 1), ('2024-01-29', 2), ('2024-01-31', 4), ('2024-02-01', 8), ('2024-02-29', 16), ('2024-03-03', 32)
+    ]
+    assert series(client, admin_headers, group_id, 'bucket=week') == [
+        ('2024-01-22', 1), ('2024-01-29', 14), ('2024-02-05', 0), ('2024-02-12', 0), ('2024-02-19', 0), ('2024-02-26', 48)
+    ]
+    assert series(client, admin_headers, group_id, 'bucket=month') == [
+        ('2024-01-01', 7), ('2024-02-01', 24), ('2024-03-01', 32)
+    ]
+
+
+def test_ranges_are_whole_days(client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    group_id = make_group(admin_headers)
+    assert series(client, admin_headers, group_id) == []
+    client.post('/api/contributions/batch', headers=admin_headers, json=[
+        {"group_id": group_id, "amount": amount, "created_at": created_at} for created_at, amount in EDGES
+    ])
+
+    # `from`'s day is included and `to`'s is not, whatever the time of day
+    assert series(client, admin_headers, group_id, 'from=2024-01-29T18:00:00&to=2024-02-01T18:00:00') == [
+        ('2024-01-29', 2), ('2024-01-30', 0), ('2024-01-31', 4)
+    ]
+    # Offsets are converted first: 01:00 on the 1st at +02:00 is still January 31st
+    assert series(client, admin_headers, group_id, 'from=2024-02-01T01:00:00%2B02:00&to=2024-02-01') == [('2024-01-31', 4)]
+    # A range with no rows has no buckets, not a run of empty ones
+    assert series(client, admin_headers, group_id, 'bucket=week&from=2024-02-05&to=2024-02-26') == []
+    assert client.get(f'/api/groups/{group_id}/timeseries?to=soon', headers=admin_headers).status_code == 400
+    assert client.get(f'/api/groups/{group_id}/timeseries?bucket=year', headers=admin_headers).status_code == 400
+
+
+def test_rollups_stay_in_step_with_batch_ingest(app, client, make_user, make_group):
+    admin_id, admin_headers = make_user('Admin')
+    members = [make_user() for _ in range(2)]
+    group_ids = [make_group(admin_headers, [headers for _, headers in members]) for _ in range(2)]
+    user_ids = [admin_id] + [user_id for user_id, _ in members]
+
+    # Backdated rows in small chunks, several days and groups per chunk,
+    # then today's contributions and withdrawals next to them
+    rng = random.Random(19)
+    records = [{
+        "group_id": rng.choice(group_ids), "user_id": rng.choice(user_ids), "amount": rng.randint(1, 9999) / 100,
+        "created_at": f"2024-05-{rng.randint(1, 31):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+    } for _ in range(300)]
+    response = client.post('/api/contributions/batch?chunk_size=7', headers=admin_headers, json=records)
+    assert response.json['inserted'] == len(records)
+    for group_id in group_ids:
+        client.post(f'/api/groups/{group_id}/contribute', headers=admin_headers, json={"amount": 50})
+        withdrawal_id = client.post(f'/api/groups/{group_id}/withdraw', headers=admin_headers, json={"amount": 20}).json['withdrawal']['id']
+        client.post(f'/api/withdrawals/{withdrawal_id}/process', headers=admin_headers, json={"status": "approved"})
+
+    with app.app_context():
+        expected = {group_id: ledger_days(group_id) for group_id in group_ids}
+        assert sum(day[1] for days in expected.values() for day in days.values()) == len(records) + 2
+        for group_id in group_ids:
+            assert rollup_days(group_id) == expected[group_id]
+        db.session.execute(update(GroupDailyRollup).values(contributed_cents=0))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        for group_id in group_ids:
+            assert rollup_days(group_id) == expected[group_id]
+    for group_id in group_ids:
+        month = series(client, admin_headers, group_id, 'bucket=month&to=2024-06-01')
+        cents = sum(round(record['amount'] * 100) for record in records if record['group_id'] == group_id)
+        assert month == [('2024-05-01', cents / 100)]